@@ -1,4 +1,10 @@
+from .growable_array import GrowableArray
+from .csr_adjacency import CSRAdjacency
+from .id_index import IdIndex
 from .implicit_data import ImplicitData
 from .ratings_data import RatingsData
 from .symmetric_matrix import SymmetricMatrix
+from .sparse_symmetric_matrix import SparseSymmetricMatrix
+from .packed_symmetric_matrix import PackedSymmetricMatrix
+from .memmap_symmetric_matrix import MemmapSymmetricMatrix
 from .get_buckets_and_holdouts import getBucketsHoldouts
\ No newline at end of file
@@ -0,0 +1,160 @@
+import numpy as np
+
+class CSRAdjacency:
+    '''
+    Compact row -> columns adjacency (e.g. user -> items), in CSR form.
+    The bulk of the data lives in two int32 arrays (indptr, indices) built with a vectorized argsort.
+    Incremental appends go to small per-row buffers that are merged into the CSR arrays periodically.
+    Within each row, columns keep the order in which they were added (with repetitions).
+    Removals are buffered the same way and applied at compaction.
+    '''
+
+    def __init__(self, rows, cols, num_rows: int, min_pending: int = 4096):
+        '''
+        rows -- row of each entry (array-like of ints)
+        cols -- column of each entry (array-like of ints)
+        num_rows -- number of rows (rows without entries are allowed)
+        min_pending -- minimum number of buffered appends before compaction. Compaction happens when the buffers hold more than max(min_pending, nnz / 4) entries, so its cost is amortized O(1) per append.
+        '''
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        self.num_rows = num_rows
+        self.min_pending = min_pending
+        self._Build(rows, cols)
+
+    @classmethod
+    def FromArrays(cls, indptr, indices, min_pending: int = 4096):
+        '''
+        Wraps existing CSR arrays (e.g. memory-mapped) without copying them.
+        '''
+        adjacency = cls.__new__(cls)
+        adjacency.num_rows = len(indptr) - 1
+        adjacency.min_pending = min_pending
+        adjacency.indptr = indptr
+        adjacency.indices = indices
+        adjacency.pending = {}
+        adjacency.num_pending = 0
+        adjacency.removed = {}
+        adjacency.num_removed = 0
+        return adjacency
+
+    def _Build(self, rows, cols):
+        order = np.argsort(rows, kind='stable') # stable - keeps the original order of the entries in each row
+        self.indices = cols[order]
+        self.indptr = np.zeros(self.num_rows + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=self.num_rows), out=self.indptr[1:])
+        self.pending = {} # row -> list of columns appended since the last compaction
+        self.num_pending = 0
+        self.removed = {} # row -> list of columns removed since the last compaction (one entry per removed occurrence)
+        self.num_removed = 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, row: int):
+        return self.GetRow(row)
+
+    @property
+    def nnz(self):
+        return len(self.indices) + self.num_pending - self.num_removed
+
+    def AddRow(self, count: int = 1):
+        '''
+        Adds 'count' empty rows. Returns the index of the last one.
+        '''
+        self.num_rows += count
+        return self.num_rows - 1
+
+    def Append(self, row: int, col: int):
+        '''
+        Appends a column to the end of a row.
+        '''
+        if row in self.pending:
+            self.pending[row].append(col)
+        else:
+            self.pending[row] = [col]
+        self.num_pending += 1
+        self._CheckCompact()
+
+    def Extend(self, rows, cols):
+        '''
+        Appends several entries, in order. Compaction is checked once at the end.
+        '''
+        pending = self.pending
+        for row, col in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist()):
+            if row in pending:
+                pending[row].append(col)
+            else:
+                pending[row] = [col]
+        self.num_pending += len(rows)
+        self._CheckCompact()
+
+    def Remove(self, row: int, col: int):
+        '''
+        Removes the first (oldest) occurrence of a column from a row. The column must be in the row.
+        '''
+        if row in self.removed:
+            self.removed[row].append(col)
+        else:
+            self.removed[row] = [col]
+        self.num_removed += 1
+        self._CheckCompact()
+
+    def _CheckCompact(self):
+        if self.num_pending + self.num_removed > max(self.min_pending, len(self.indices) // 4):
+            self.Compact()
+
+    def GetRow(self, row: int):
+        '''
+        Returns the columns of a row as an int32 array.
+        The array is a zero-copy slice of the CSR arrays, unless the row has appends waiting for compaction.
+        '''
+        if row + 1 < len(self.indptr):
+            base = self.indices[self.indptr[row]:self.indptr[row + 1]]
+        else:
+            base = self.indices[:0]
+        if row in self.removed:
+            cols = base.tolist() + self.pending.get(row, [])
+            for col in self.removed[row]:
+                cols.remove(col)
+            return np.array(cols, dtype=np.int32)
+        if row in self.pending:
+            return np.concatenate((base, np.array(self.pending[row], dtype=np.int32)))
+        return base
+
+    def RowLength(self, row: int):
+        length = 0
+        if row + 1 < len(self.indptr):
+            length = self.indptr[row + 1] - self.indptr[row]
+        if row in self.pending:
+            length += len(self.pending[row])
+        if row in self.removed:
+            length -= len(self.removed[row])
+        return int(length)
+
+    def Compact(self):
+        '''
+        Merges the per-row buffers into the CSR arrays.
+        '''
+        base_rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        pending_rows = np.fromiter((r for r, cols in self.pending.items() for _ in cols), dtype=np.int32, count=self.num_pending)
+        pending_cols = np.fromiter((c for cols in self.pending.values() for c in cols), dtype=np.int32, count=self.num_pending)
+        rows = np.concatenate((base_rows, pending_rows))
+        cols = np.concatenate((self.indices, pending_cols))
+        if self.num_removed:
+            rows, cols = self._ApplyRemovals(rows, cols)
+        self._Build(rows, cols)
+
+    def _ApplyRemovals(self, rows, cols):
+        # drops, for each (row, col) removed k times, its first k occurrences - entries are in insertion order within each row
+        keys = rows.astype(np.int64) << 32 | cols
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        starts = np.zeros(len(unique_keys), dtype=np.int64)
+        np.cumsum(np.bincount(inverse, minlength=len(unique_keys))[:-1], out=starts[1:])
+        occurrence = np.empty(len(keys), dtype=np.int64)
+        occurrence[order] = np.arange(len(keys)) - starts[inverse[order]]
+        removed_keys = np.fromiter((r << 32 | c for r, removed in self.removed.items() for c in removed), dtype=np.int64, count=self.num_removed)
+        removed_counts = np.bincount(np.searchsorted(unique_keys, removed_keys), minlength=len(unique_keys))
+        keep = occurrence >= removed_counts[inverse]
+        return rows[keep], cols[keep]
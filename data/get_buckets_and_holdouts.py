@@ -1,9 +1,30 @@
 from .implicit_data import ImplicitData
+from .id_index import IdIndex
 
 import pandas as pd
 import numpy as np
 
-def getBucketsHoldouts(data:pd.DataFrame, user_col:str, item_col:str, frequent_users:list, interval_type:str=None, intervals:list=None, cold_start_buckets:int=1):
+def _SortedIndex(column:pd.Series):
+    '''
+    Sorts a column once, so that the rows of each interval can be found by binary search instead of a boolean mask over the whole DataFrame.
+    Returns the sorted values and the positions of the rows in that order.
+    The sorted values are a pandas Index, whose searchsorted accepts the same bounds as the column comparisons
+    (e.g. pd.Timestamp, datetime or str bounds over a datetime64 column).
+    '''
+    values = column.to_numpy()
+    order = np.argsort(values, kind='stable')
+    return pd.Index(values[order]), order
+
+def _IntervalRows(sorted_values, order, start, end):
+    '''
+    Positions of the rows with start <= value <= end, in their original order. end may be None (open interval).
+    O(log n) to find the interval, plus sorting the positions of the rows in it.
+    '''
+    lo = sorted_values.searchsorted(start, side='left')
+    hi = len(sorted_values) if end is None else sorted_values.searchsorted(end, side='right')
+    return np.sort(order[lo:hi])
+
+def getBucketsHoldouts(data:pd.DataFrame, user_col:str, item_col:str, frequent_users:list, interval_type:str=None, intervals:list=None, cold_start_buckets:int=1, shared_vocabulary:bool=False, timestamp_col:str=None):
     '''
     Creates lists with buckets and holdouts based on passed intervals.
     
@@ -14,29 +35,38 @@ def getBucketsHoldouts(data:pd.DataFrame, user_col:str, item_col:str, frequent_u
     interval_type - W for week, M for month, QS for quarter or semester, F representing fixed bucket size\n
     intervals - list containing tuple intervals. pos0-interval start, pos1-interval end. for QS these are dates, for F these are indexes. not necessary for Month interval type.\n
     cold_start_buckets - number of buckets to be used for training only\n
+    shared_vocabulary - if True, user and item columns are made categorical once and every bucket/holdout is built from the category codes (ImplicitData.FromColumns),\n
+    \tsharing one global vocabulary instead of re-hashing IDs per bucket. userset/itemset of each bucket/holdout are then the whole dataset vocabulary.\n
+    timestamp_col - if given, buckets and holdouts keep this column as their timestamps (ImplicitData.timestamps, SliceByTime)\n
     '''
 #     print('0',data.shape[0]) # debug
+    if shared_vocabulary:
+        data = data.astype({user_col: 'category', item_col: 'category'})
+        user_dtype, item_dtype = data[user_col].dtype, data[item_col].dtype
+        users = IdIndex(user_dtype.categories.to_numpy(), copy=False)
+        items = IdIndex(item_dtype.categories.to_numpy(), copy=False)
     print('Creating buckets. . .')
     buckets = []
     assert interval_type in ['W', 'M', 'QS', 'F'], "interval must be one of W, M, QS, or F"
+    # the interval column is sorted once and the rows of each bucket are found by binary search (keeping their original order)
     if interval_type == 'W':
         # create buckets based on months
         weeks = data['week'].unique()
+        sorted_weeks, order = _SortedIndex(data['week'])
         for interval in weeks:
-            idx = (data['week'] == interval)
-            buckets.append( data[idx] )
+            buckets.append( data.iloc[ _IntervalRows(sorted_weeks, order, interval, interval) ] )
     elif interval_type == 'M':
         # create buckets based on months
         months = data['date'].unique()
         months.sort()
+        sorted_dates, order = _SortedIndex(data['date'])
         for interval in months:
-            idx = (data['date'] == interval)
-            buckets.append( data[idx] )
+            buckets.append( data.iloc[ _IntervalRows(sorted_dates, order, interval, interval) ] )
     elif interval_type == 'QS':
         # create buckets based on quarters or semesters
+        sorted_dates, order = _SortedIndex(data['date'])
         for s, e in intervals:
-            idx = (data['date'] >= s) & (data['date'] <= e)
-            buckets.append( data[idx] )
+            buckets.append( data.iloc[ _IntervalRows(sorted_dates, order, s, e) ] )
 
             # debug
             # print(str(s)+' to '+str(e)+'\n'+\
@@ -49,9 +79,9 @@ def getBucketsHoldouts(data:pd.DataFrame, user_col:str, item_col:str, frequent_u
         #     idx = (data['date'] > e)
         #     buckets.append( data[idx] )
         # replaced with the following if-case code
-        idx = (data['date'] > e)
-        if data[idx].shape[0] > 0:
-            buckets.append( data[idx] )
+        idx = np.sort(order[sorted_dates.searchsorted(e, side='right'):]) # date > e
+        if len(idx) > 0:
+            buckets.append( data.iloc[idx] )
             
     else:
         # create buckets based on fixed number of examples
@@ -162,10 +192,19 @@ def getBucketsHoldouts(data:pd.DataFrame, user_col:str, item_col:str, frequent_u
                 
     print('Converting to ImplicitData. . .')
     for i, b in enumerate(buckets):
-        buckets[i] = ImplicitData(user_list=b[user_col], item_list=b[item_col]) # convert to ImplicitData
+        timestamps = b[timestamp_col].to_numpy() if timestamp_col else None
+        if shared_vocabulary:
+            # astype is a no-op for columns that kept the categorical dtype
+            buckets[i] = ImplicitData.FromColumns(b[user_col].astype(user_dtype), b[item_col].astype(item_dtype), users, items, timestamps=timestamps)
+        else:
+            buckets[i] = ImplicitData(user_list=b[user_col], item_list=b[item_col], timestamps=timestamps) # convert to ImplicitData
 
     for j, h in enumerate(holdouts):
-        holdouts[j] = ImplicitData(user_list=h[user_col], item_list=h[item_col]) # convert to ImplicitData
+        timestamps = h[timestamp_col].to_numpy() if timestamp_col else None
+        if shared_vocabulary:
+            holdouts[j] = ImplicitData.FromColumns(h[user_col].astype(user_dtype), h[item_col].astype(item_dtype), users, items, timestamps=timestamps)
+        else:
+            holdouts[j] = ImplicitData(user_list=h[user_col], item_list=h[item_col], timestamps=timestamps) # convert to ImplicitData
     
     print('Done!')
     return buckets, holdouts
@@ -0,0 +1,111 @@
+import numpy as np
+
+class GrowableArray:
+    '''
+    Numpy array with geometric capacity growth, used as a column of a stream.
+    Appending is amortized O(1): the buffer is only reallocated (doubled) when it is full,
+    and the valid part is exposed as a view through View().
+    '''
+
+    def __init__(self, values=None, dtype=None, row_shape: tuple = (), capacity: int = 16, promote: bool = False, copy: bool = True):
+        '''
+        values -- initial values (array-like), may be None or empty
+        dtype -- dtype of the buffer. If None, it is inferred from values
+        row_shape -- shape of each element, e.g. (num_factors,) for a matrix that grows by rows
+        capacity -- initial capacity (number of rows)
+        promote -- if True, the dtype is promoted when an incompatible value is appended (e.g. a longer string), as np.append does
+        copy -- if False and values is already an array of the right dtype, it is used as the buffer without copying.
+            It is never written to: the first append reallocates, since the buffer is full.
+        '''
+        if values is None:
+            values = np.empty((0,) + tuple(row_shape), dtype=dtype if dtype is not None else np.float64)
+        values = np.asarray(values, dtype=dtype)
+        self.promote = promote
+        self.size = len(values)
+        if not copy and self.size:
+            self.buffer = values
+            return
+        self.buffer = np.empty((max(capacity, self.size, 1),) + values.shape[1:], dtype=values.dtype)
+        self.buffer[:self.size] = values
+
+    def __len__(self):
+        return self.size
+
+    def View(self):
+        '''
+        Returns a view over the valid elements (no copy).
+        '''
+        return self.buffer[:self.size]
+
+    def __getitem__(self, index):
+        # e.g. a row of a factor matrix: a view, so in-place updates (p_u += delta) change the stored values
+        return self.View()[index]
+
+    def __setitem__(self, index, value):
+        self.View()[index] = value
+
+    def __array__(self, dtype=None, copy=None):
+        # np.inner(p_u, factors), np.mean(factors, axis=0), ... use the valid elements without copying
+        return self.View() if dtype is None else self.View().astype(dtype, copy=False)
+
+    def Append(self, value):
+        '''
+        Appends a single element. Returns its position.
+        '''
+        if self.promote:
+            self._Promote(np.asarray(value).dtype)
+        if self.size == len(self.buffer):
+            self._Resize(self.size + 1)
+        self.buffer[self.size] = value
+        self.size += 1
+        return self.size - 1
+
+    def Extend(self, values):
+        '''
+        Appends several elements with a single (amortized) reallocation.
+        '''
+        values = np.asarray(values)
+        if self.promote and len(values):
+            self._Promote(values.dtype)
+        new_size = self.size + len(values)
+        if new_size > len(self.buffer):
+            self._Resize(new_size)
+        self.buffer[self.size:new_size] = values
+        self.size = new_size
+
+    def Pop(self):
+        '''
+        Removes and returns the last element. The capacity is kept.
+        '''
+        self.size -= 1
+        return self.buffer[self.size]
+
+    def Set(self, position: int, value):
+        '''
+        Overwrites an existing element. A read-only buffer (e.g. memory-mapped) is copied first.
+        '''
+        if not self.buffer.flags.writeable:
+            self._Resize(self.size)
+        self.buffer[position] = value
+
+    def Reserve(self, capacity: int):
+        '''
+        Makes sure the buffer holds at least 'capacity' elements without reallocating.
+        '''
+        if capacity > len(self.buffer):
+            self._Resize(capacity)
+
+    def _Resize(self, min_capacity: int):
+        new_capacity = max(len(self.buffer) * 2, min_capacity)
+        new_buffer = np.empty((new_capacity,) + self.buffer.shape[1:], dtype=self.buffer.dtype)
+        new_buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = new_buffer
+
+    def _Promote(self, dtype):
+        if self.size == 0:
+            # nothing to preserve - adopt the dtype of the incoming values (e.g. empty float array receiving strings)
+            if dtype != self.buffer.dtype:
+                self.buffer = np.empty(self.buffer.shape, dtype=dtype)
+            return
+        if not np.can_cast(dtype, self.buffer.dtype):
+            self.buffer = self.buffer.astype(np.result_type(self.buffer.dtype, dtype))
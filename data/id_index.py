@@ -0,0 +1,50 @@
+import numpy as np
+from .growable_array import GrowableArray
+
+class IdIndex:
+    '''
+    Vocabulary of external IDs (users or items).
+    The position of an ID in 'ids' is its internal ID; 'index' is the dictionary for the reverse lookup (external -> internal).
+    The same IdIndex can be shared by several ImplicitData objects (e.g. buckets and holdouts of the same dataset).
+    '''
+
+    def __init__(self, ids=None, index: dict = None, copy: bool = True):
+        '''
+        ids -- external IDs, in internal ID order (array-like)
+        index -- dictionary external ID -> internal ID matching 'ids'. Built from 'ids' on first use if None
+        copy -- if False, 'ids' is used without copying when it is already a numpy array (e.g. a memory-mapped array)
+        '''
+        self.ids = GrowableArray(ids if ids is not None else [], promote=True, copy=copy)
+        self._index = index
+
+    @property
+    def index(self):
+        # built lazily, so that loading a (memory-mapped) vocabulary does not hash every ID up front
+        if self._index is None:
+            # tolist() gives native python types, so the hashes of strings and ints match the IDs received in AddFeedback and Recommend
+            self._index = {x: i for i, x in enumerate(self.ids.View().tolist())}
+        return self._index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def View(self):
+        return self.ids.View()
+
+    def Get(self, external_id):
+        '''
+        Returns the internal ID, or -1 if the ID is unknown.
+        '''
+        return self.index.get(external_id, -1)
+
+    def Add(self, external_id):
+        '''
+        Adds a new ID. Returns its internal ID.
+        '''
+        index = self.index
+        internal_id = self.ids.Append(external_id)
+        index[external_id] = internal_id
+        return internal_id
+
+    def Copy(self):
+        return IdIndex(self.View().copy(), dict(self.index))
@@ -1,6 +1,10 @@
+import json
+import os
+from collections import Counter, deque
 import numpy as np
-import warnings
-warnings.simplefilter(action='ignore', category=FutureWarning) # ver linha 72
+from .growable_array import GrowableArray
+from .csr_adjacency import CSRAdjacency
+from .id_index import IdIndex
 
 class ImplicitData:
     '''
@@ -8,120 +12,670 @@ class ImplicitData:
     contém também métodos de suporte
     assume ratings implicitos
     '''
-    def __init__(self, user_list: list, item_list: list):
-        self.userlist = user_list # lista de usuarios
-        self.itemlist = item_list # lista de itens
-        self.size = len(self.userlist) # tamanho da lista de usuarios (total de interações)
-        self.userset, self.userindices = np.unique(self.userlist, return_inverse=True) # lista de usuarios unicos, e indices que mapeiam interações aos usuários unicos
-        self.itemset, self.itemindices = np.unique(self.itemlist, return_inverse=True) # lista de itens unicos, e indices que mapeiam interações aos itens unicos
+    def __init__(self, user_list: list, item_list: list, dedup: bool = False, timestamps: list = None):
+        '''
+        dedup - se True, useritems/itemusers guardam cada par (usuário, item) uma só vez, com o número de repetições e a posição da última (ver GetCount)
+            a sequência de interações (userindices/itemindices, GetTuple) continua completa, pela ordem original
+        timestamps - instante de cada interação (números ou datetime64), opcional. A sequência de interações é mantida ordenada por tempo
+            (as interações são ordenadas de forma estável se não estiverem), o que permite consultas por intervalo de tempo (SliceByTime)
+        '''
+        if timestamps is not None:
+            timestamps = np.asarray(timestamps)
+            if len(timestamps) and np.any(timestamps[1:] < timestamps[:-1]):
+                order = np.argsort(timestamps, kind='stable')
+                user_list, item_list, timestamps = np.asarray(user_list)[order], np.asarray(item_list)[order], timestamps[order]
+        self.size = len(user_list) # tamanho da lista de usuarios (total de interações)
+        userset, userindices = np.unique(user_list, return_inverse=True) # lista de usuarios unicos, e indices que mapeiam interações aos usuários unicos
+        itemset, itemindices = np.unique(item_list, return_inverse=True) # lista de itens unicos, e indices que mapeiam interações aos itens unicos
+        # armazenamento colunar com capacidade que dobra quando cheia - AddFeedback é O(1) amortizado (np.append copiava tudo a cada interação)
+        # userlist/itemlist não são guardadas: são reconstruidas a partir de userset/itemset e dos indices
+        self._users = IdIndex(userset) # vocabulário de usuários (ID externo <-> ID interno)
+        self._items = IdIndex(itemset) # vocabulário de itens
+        self._shared_vocabulary = False
+        self._userindices = GrowableArray(userindices, dtype=np.int32)
+        self._itemindices = GrowableArray(itemindices, dtype=np.int32)
         self.maxuserid = len(self.userset) - 1 # ID máximo de usuários
         self.maxitemid = len(self.itemset) - 1 # ID máximo de itens
+        self._timestamps = GrowableArray(timestamps, promote=True) if timestamps is not None else None # instante de cada interação, ordenado
+        self._interactions = None # conjunto de pares (usuário, item) para HasInteraction, criado no primeiro uso
+        self._retention = None # política de retenção (SetRetention)
+        self._SetDedup(dedup)
         self.BuildMaps()
 
+    @classmethod
+    def FromCodes(cls, user_codes, item_codes, users: IdIndex, items: IdIndex, dedup: bool = False, timestamps = None):
+        '''
+        Cria ImplicitData a partir de interações já codificadas, sem np.unique nem re-hashing dos IDs
+        user_codes/item_codes - ID interno de cada interação (posição no vocabulário), ex. códigos de uma coluna categorical
+        users/items - vocabulários globais (IdIndex), partilhados entre os objetos criados com eles (ex. buckets e holdouts)
+        Os IDs internos são os do vocabulário global: userset/itemset são o vocabulário inteiro, mesmo que alguns usuários/itens não tenham interações
+        Se os códigos já forem int32 não são copiados. O vocabulário só é copiado se AddFeedback encontrar um usuário ou item novo
+        timestamps - instante de cada interação, opcional. Se não estiver ordenado, as interações são ordenadas (com cópia)
+        '''
+        if timestamps is not None:
+            timestamps = np.asarray(timestamps)
+            if len(timestamps) and np.any(timestamps[1:] < timestamps[:-1]):
+                order = np.argsort(timestamps, kind='stable')
+                user_codes, item_codes, timestamps = np.asarray(user_codes)[order], np.asarray(item_codes)[order], timestamps[order]
+        data = cls.__new__(cls)
+        data._users = users
+        data._items = items
+        data._shared_vocabulary = True
+        data._userindices = GrowableArray(np.asarray(user_codes), dtype=np.int32, copy=False)
+        data._itemindices = GrowableArray(np.asarray(item_codes), dtype=np.int32, copy=False)
+        data.size = len(data._userindices)
+        data.maxuserid = len(users) - 1
+        data.maxitemid = len(items) - 1
+        data._timestamps = GrowableArray(timestamps, promote=True, copy=False) if timestamps is not None else None
+        data._interactions = None
+        data._retention = None
+        data._SetDedup(dedup)
+        data.BuildMaps()
+        return data
+
+    @classmethod
+    def FromColumns(cls, user_column, item_column, users: IdIndex = None, items: IdIndex = None, dedup: bool = False, timestamps = None):
+        '''
+        Cria ImplicitData a partir de colunas já codificadas: pandas categorical (Series ou Categorical) ou Arrow dictionary arrays
+        users/items - vocabulários partilhados (IdIndex). Se omitidos, são criados a partir das categorias das colunas
+        Para partilhar o vocabulário, todas as colunas têm de ter as mesmas categorias (ex. fatias do mesmo DataFrame categorical)
+        '''
+        user_codes, user_categories = _CodesAndCategories(user_column)
+        item_codes, item_categories = _CodesAndCategories(item_column)
+        if users is None:
+            users = IdIndex(user_categories, copy=False)
+        if items is None:
+            items = IdIndex(item_categories, copy=False)
+        if len(user_categories) != len(users) or len(item_categories) != len(items):
+            raise ValueError('column categories do not match the shared vocabulary')
+        return cls.FromCodes(user_codes, item_codes, users, items, dedup, timestamps)
+
+    def Save(self, path: str):
+        '''
+        Grava o objeto num diretório de arquivos .npy (um por array), que Load abre com memory map
+        Alternativa ao pickle/joblib: não há listas python a desserializar e vários processos podem partilhar as mesmas páginas
+        '''
+        _SaveImplicitData(self, path, None)
+
+    @classmethod
+    def Load(cls, path: str, mmap: bool = True):
+        '''
+        Abre um objeto gravado com Save. Com mmap=True os arrays são abertos com mmap_mode='r' (sem leitura do disco à cabeça)
+        Novas interações (AddFeedback) copiam para memória apenas as colunas que crescem
+        '''
+        return _LoadImplicitData(cls, path, mmap, {})
+
+    @staticmethod
+    def SaveList(data_list: list, path: str):
+        '''
+        Grava uma lista de ImplicitData (ex. buckets ou holdouts) num diretório, um subdiretório por elemento
+        Vocabulários partilhados (FromCodes/FromColumns) são gravados uma só vez
+        '''
+        os.makedirs(path, exist_ok=True)
+        vocabularies = {}
+        for k, data in enumerate(data_list):
+            _SaveImplicitData(data, os.path.join(path, str(k)), vocabularies)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'format': 'ImplicitDataList', 'version': 1, 'length': len(data_list)}, f)
+
+    @classmethod
+    def LoadList(cls, path: str, mmap: bool = True):
+        '''
+        Abre uma lista gravada com SaveList. Vocabulários partilhados voltam a ser partilhados
+        '''
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        vocabularies = {}
+        return [_LoadImplicitData(cls, os.path.join(path, str(k)), mmap, vocabularies) for k in range(meta['length'])]
+
+    def __setstate__(self, state):
+        if '_users' not in state:
+            # objeto serializado (joblib/pickle) antes do armazenamento colunar - converte os arrays/listas antigos
+            state = dict(state)
+            state['_users'] = IdIndex(state.pop('userset'))
+            state['_items'] = IdIndex(state.pop('itemset'))
+            state['_shared_vocabulary'] = False
+            state['_userindices'] = GrowableArray(state.pop('userindices'), dtype=np.int32)
+            state['_itemindices'] = GrowableArray(state.pop('itemindices'), dtype=np.int32)
+            for name in ('userlist', 'itemlist', 'usermap', 'itemmap', 'useritems', 'itemusers'):
+                state.pop(name, None)
+            self.__dict__.update(state)
+            self._interactions = None
+            self._retention = None
+            self._timestamps = None
+            self.dedup = False
+            self.BuildMaps()
+            return
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_interactions', None)
+        self.__dict__.setdefault('dedup', False)
+        self.__dict__.setdefault('_retention', None)
+        self.__dict__.setdefault('_timestamps', None)
+
+    @property
+    def userset(self):
+        '''
+        usuarios unicos (view sobre o armazenamento, posição = ID interno)
+        '''
+        return self._users.View()
+
+    @property
+    def itemset(self):
+        '''
+        itens unicos (view sobre o armazenamento, posição = ID interno)
+        '''
+        return self._items.View()
+
+    @property
+    def userindices(self):
+        '''
+        ID interno do usuário de cada interação (view)
+        '''
+        return self._userindices.View()
+
+    @property
+    def itemindices(self):
+        '''
+        ID interno do item de cada interação (view)
+        '''
+        return self._itemindices.View()
+
+    @property
+    def userlist(self):
+        '''
+        ID externo do usuário de cada interação (cópia)
+        '''
+        return self.userset[self.userindices]
+
+    @property
+    def itemlist(self):
+        '''
+        ID externo do item de cada interação (cópia)
+        '''
+        return self.itemset[self.itemindices]
+
+    @property
+    def timestamps(self):
+        '''
+        instante de cada interação (view, ordenado), ou None se o objeto não tem timestamps
+        '''
+        if self._timestamps is None:
+            return None
+        return self._timestamps.View()
+
+    @property
+    def usermap(self):
+        '''
+        dicionário ID externo -> ID interno dos usuários
+        '''
+        return self._users.index
+
+    @property
+    def itemmap(self):
+        '''
+        dicionário ID externo -> ID interno dos itens
+        '''
+        return self._items.index
+
+    @property
+    def retention(self):
+        '''
+        política de retenção (window, time_window), ou None se todas as interações são mantidas
+        '''
+        if self._retention is None:
+            return None
+        return self._retention['window'], self._retention['time_window']
+
+    def BuildIndex(self):
+        '''
+        reconstroi os dicionários que mapeiam IDs externos a IDs internos
+        '''
+        self._users = IdIndex(self.userset)
+        self._items = IdIndex(self.itemset)
+        self._shared_vocabulary = False
+
+    def _UnshareVocabulary(self):
+        # copy-on-write: um vocabulário partilhado (FromCodes) é copiado antes de receber usuários/itens novos
+        if self._shared_vocabulary:
+            self._users = self._users.Copy()
+            self._items = self._items.Copy()
+            self._shared_vocabulary = False
+
+    def _SetDedup(self, dedup: bool):
+        # modo sem repetições: os pares (usuário, item) distintos, pela ordem da primeira interação, com o número de interações e a posição da última
+        self.dedup = dedup
+        if not dedup:
+            return
+        keys = _InteractionKeys(self.userindices, self.itemindices)
+        _, first = np.unique(keys, return_index=True)
+        _, last_reversed, counts = np.unique(keys[::-1], return_index=True, return_counts=True)
+        order = np.argsort(first, kind='stable')
+        first = first[order]
+        self._pairusers = GrowableArray(self.userindices[first], dtype=np.int32)
+        self._pairitems = GrowableArray(self.itemindices[first], dtype=np.int32)
+        self._paircounts = GrowableArray(counts[order], dtype=np.int32)
+        self._pairlast = GrowableArray((self.size - 1 - last_reversed)[order], dtype=np.int64)
+
     def BuildMaps(self):
         '''
-        cria listas para mapear usuário-itens e itens-usuário
-        '''
-        # cada lista contem listas vazias para cada usuário e item
-        # cada lista em useritems representa um usuário, e é preenchida com os indices dos itens unicos que este usuario interagiu 
-        # cada lista em itemusers representa um item, e é preenchida com os indices dos usuarios unicos que interagiram com o item
-        self.useritems = []
-        self.itemusers = []
-        for u in range(self.maxuserid + 1):
-            self.useritems.append([])
-        for i in range(self.maxitemid + 1):
-            self.itemusers.append([])
-        for r in range(self.size):
-            self.useritems[self.userindices[r]].append(self.itemindices[r])
-            self.itemusers[self.itemindices[r]].append(self.userindices[r])
-        # há uma lista para cada usuário que contém os itens com que ele interagiu
-        # há uma lista para cada item que contém os usuários que interagiram com ele
+        cria as estruturas que mapeiam usuário-itens e itens-usuário
+        '''
+        # useritems: linha u contém os indices dos itens com que o usuário u interagiu, pela ordem das interações
+        # itemusers: linha i contém os indices dos usuarios que interagiram com o item i
+        # formato CSR (indptr/indices int32) construido com argsort vetorizado, em vez de listas python de inteiros python
+        # no modo dedup as linhas são construidas a partir dos pares distintos - cada item aparece uma vez por usuário
+        users, items = (self._pairusers.View(), self._pairitems.View()) if self.dedup else (self.userindices, self.itemindices)
+        self.useritems = CSRAdjacency(users, items, self.maxuserid + 1)
+        self.itemusers = CSRAdjacency(items, users, self.maxitemid + 1)
+
+    def HasInteraction(self, user_id, item_id, internal = True):
+        '''
+        Verifica se o usuário já interagiu com o item - O(1), em vez de procurar o item na lista de GetUserItems
+        Pode receber a representação interna ou externa
+        '''
+        if not internal:
+            user_id = self.GetUserInternalId(user_id)
+            item_id = self.GetItemInternalId(item_id)
+            if user_id == -1 or item_id == -1:
+                return False
+        if self._interactions is None:
+            self._BuildInteractions()
+        return (int(user_id) << 32 | int(item_id)) in self._interactions
+
+    def _BuildInteractions(self):
+        # conjunto de chaves (usuário << 32 | item) - um único set de inteiros em vez de um set por usuário
+        # criado no primeiro uso (Load continua sem ler os dados) e mantido por AddFeedback/AddFeedbackBatch
+        # no modo dedup é um dicionário chave -> posição do par em _pairusers/_pairitems/_paircounts/_pairlast
+        # com retenção é um dicionário chave -> número de interações retidas do par
+        if self.dedup:
+            keys = _InteractionKeys(self._pairusers.View(), self._pairitems.View())
+            self._interactions = dict(zip(keys.tolist(), range(len(keys))))
+        elif self._retention is not None:
+            keys = _InteractionKeys(self.userindices, self.itemindices)[self._retention['alive'].View()]
+            self._interactions = dict(Counter(keys.tolist()))
+        else:
+            self._interactions = set(_InteractionKeys(self.userindices, self.itemindices).tolist())
+
+    def GetCount(self, user_id, item_id, internal = True):
+        '''
+        Obtem o número de interações do usuário com o item (0 se não interagiu)
+        Pode receber a representação interna ou externa
+        '''
+        if not internal:
+            user_id = self.GetUserInternalId(user_id)
+            item_id = self.GetItemInternalId(item_id)
+        if not self.HasInteraction(user_id, item_id):
+            return 0
+        if self.dedup:
+            return int(self._paircounts.View()[self._interactions[int(user_id) << 32 | int(item_id)]])
+        return int(np.count_nonzero(self.useritems.GetRow(user_id) == item_id))
+
+    def GetLastIndex(self, user_id, item_id, internal = True):
+        '''
+        Obtem a posição (idx de GetTuple) da última interação do usuário com o item (-1 se não interagiu)
+        Pode receber a representação interna ou externa
+        '''
+        if not internal:
+            user_id = self.GetUserInternalId(user_id)
+            item_id = self.GetItemInternalId(item_id)
+        if not self.HasInteraction(user_id, item_id):
+            return -1
+        if self.dedup:
+            return int(self._pairlast.View()[self._interactions[int(user_id) << 32 | int(item_id)]])
+        positions = np.flatnonzero((self.userindices == user_id) & (self.itemindices == item_id) & self._Alive())
+        return int(positions[-1])
+
+    def GetUserItemCounts(self, user_id):
+        '''
+        Obtem o número de interações com cada item de GetUserItems(user_id) (mesma ordem)
+        '''
+        user_items = self.GetUserItems(user_id)
+        if not self.dedup:
+            return np.ones(len(user_items), dtype=np.int32)
+        if self._interactions is None:
+            self._BuildInteractions()
+        pairs = [self._interactions[user_id << 32 | i] for i in np.asarray(user_items).tolist()]
+        return self._paircounts.View()[pairs]
+
+    def _AddPair(self, user_id, item_id, idx):
+        # modo dedup: conta a repetição de um par existente, ou cria o par. Retorna True se o par é novo
+        key = user_id << 32 | item_id
+        pair = self._interactions.get(key, -1)
+        if pair > -1:
+            self._paircounts.Set(pair, self._paircounts.buffer[pair] + 1)
+            self._pairlast.Set(pair, idx)
+            return False
+        self._interactions[key] = self._pairusers.Append(user_id)
+        self._pairitems.Append(item_id)
+        self._paircounts.Append(1)
+        self._pairlast.Append(idx)
+        return True
 
     def GetUserItems(self, user_id, internal = True):
         '''
-        Obtem lista de itens com que o usuário interagiu
+        Obtem lista de itens com que o usuário interagiu (array int32, sem cópia)
         '''
         if internal:
             if user_id > -1 and user_id <= self.maxuserid:
-                return self.useritems[user_id]
+                return self.useritems.GetRow(user_id)
             return []
         uid = self.GetUserInternalId(user_id)
         if uid > -1:
-            return self.itemset[self.useritems[uid]]
+            return self.itemset[self.useritems.GetRow(uid)]
         return []
 
     def GetItemUsers(self, item_id, internal = True):
         '''
-        Obtem lista de usuários que interagiram com o item
+        Obtem lista de usuários que interagiram com o item (array int32, sem cópia)
         '''
         if internal:
             if item_id > -1 and item_id <= self.maxitemid:
-                return self.itemusers[item_id]
+                return self.itemusers.GetRow(item_id)
         iid = self.GetItemInternalId(item_id)
         if iid > -1:
-            return self.userset[self.itemusers[iid]]
+            return self.userset[self.itemusers.GetRow(iid)]
         return []
 
 
-    def AddFeedback(self, user, item):
+    def AddFeedback(self, user, item, timestamp = None):
         '''
         Adiciona uma nova interação usuário-item às listas que mapeiam usuário-itens e itens-usuário
+        timestamp - instante da interação. Não pode ser anterior ao da última interação. Obrigatório com janela de tempo;
+            se o objeto tem timestamps e é omitido, a interação recebe o timestamp da última interação
         '''
+        timestamps = self._CheckTimestamps(None if timestamp is None else [timestamp], 1)
+        if timestamp is None and timestamps is not None:
+            timestamp = timestamps[0]
+        if self._retention is not None and self._retention['time_window'] is not None:
+            # despeja antes de adicionar: os callbacks (ex. UserKNN.Forget) não podem ver a nova interação em useritems/itemusers
+            self._EvictOlderThan(timestamp - self._retention['time_window'])
         self.size = self.size + 1
-        self.userlist.append(user) # 
-        self.itemlist.append(item)
-        # if user not in self.userset:
-        if not np.isin(user, self.userset, True):
-            # if FutureWarning error happens, its bc of comparison between string and numpy arrays - which happens in Lastfm data since users and items IDs are strings
-            # https://stackoverflow.com/questions/40659212/futurewarning-elementwise-comparison-failed-returning-scalar-but-in-the-futur
-            # FutureWarning: elementwise comparison failed; returning scalar instead, but in the future will perform elementwise comparison
-            self.userset = np.append(self.userset, user)
+        # busca no dicionário em vez de np.isin - O(1) e sem FutureWarning quando os IDs são strings (ex. Lastfm)
+        user_id = self._users.Get(user)
+        if user_id == -1:
+            self._UnshareVocabulary()
+            user_id = self._users.Add(user)
             self.maxuserid = self.maxuserid + 1
-            self.useritems.append([])
-        user_id = self.GetUserInternalId(user)
-        self.userindices = np.append(self.userindices, user_id)
-        # if item not in self.itemset:
-        if not np.isin(item, self.itemset, True):
-            self.itemset = np.append(self.itemset, item)
+            self.useritems.AddRow()
+        self._userindices.Append(user_id)
+        item_id = self._items.Get(item)
+        if item_id == -1:
+            self._UnshareVocabulary()
+            item_id = self._items.Add(item)
             self.maxitemid = self.maxitemid + 1
-            self.itemusers.append([])
-        item_id = self.GetItemInternalId(item)
-        self.itemindices = np.append(self.itemindices, item_id)
-        self.useritems[user_id].append(item_id)
-        self.itemusers[item_id].append(user_id)
+            self.itemusers.AddRow()
+        self._itemindices.Append(item_id)
+        if timestamp is not None:
+            self._timestamps.Append(timestamp)
+        if self.dedup:
+            if self._interactions is None:
+                self._BuildInteractions()
+            if not self._AddPair(user_id, item_id, self.size - 1):
+                return user_id, item_id
+        elif self._retention is not None:
+            key = user_id << 32 | item_id
+            self._interactions[key] = self._interactions.get(key, 0) + 1
+        elif self._interactions is not None:
+            self._interactions.add(user_id << 32 | item_id)
+        self.useritems.Append(user_id, item_id)
+        self.itemusers.Append(item_id, user_id)
+        if self._retention is not None:
+            self._Retain(user_id, timestamp)
         return user_id, item_id
 
+    def AddFeedbackBatch(self, users, items, timestamps = None):
+        '''
+        Adiciona várias interações usuário-item de uma vez, pela ordem em que aparecem
+        Os IDs são mapeados numa única passagem e o armazenamento cresce uma só vez por lote
+        Retorna arrays (int32) com os IDs internos do usuário e do item de cada interação
+        timestamps - instantes das interações, como o timestamp de AddFeedback
+        '''
+        users = list(users)
+        items = list(items)
+        n = len(users)
+        user_ids = np.empty(n, dtype=np.int32)
+        item_ids = np.empty(n, dtype=np.int32)
+        timestamps = self._CheckTimestamps(timestamps, n)
+        if self._retention is not None:
+            # com retenção cada interação pode despejar outras - processadas uma a uma
+            timestamps = [None] * n if timestamps is None else list(timestamps)
+            for r in range(n):
+                user_ids[r], item_ids[r] = self.AddFeedback(users[r], items[r], timestamps[r])
+            return user_ids, item_ids
+        usermap, itemmap = self.usermap, self.itemmap
+        for r in range(n):
+            user_id = usermap.get(users[r], -1)
+            if user_id == -1:
+                self._UnshareVocabulary()
+                user_id = self._users.Add(users[r])
+                usermap = self.usermap
+            user_ids[r] = user_id
+            item_id = itemmap.get(items[r], -1)
+            if item_id == -1:
+                self._UnshareVocabulary()
+                item_id = self._items.Add(items[r])
+                itemmap = self.itemmap
+            item_ids[r] = item_id
+        new_users = len(self._users) - (self.maxuserid + 1)
+        new_items = len(self._items) - (self.maxitemid + 1)
+        if new_users:
+            self.maxuserid = self.maxuserid + new_users
+            self.useritems.AddRow(new_users)
+        if new_items:
+            self.maxitemid = self.maxitemid + new_items
+            self.itemusers.AddRow(new_items)
+        self._userindices.Extend(user_ids)
+        self._itemindices.Extend(item_ids)
+        if timestamps is not None:
+            self._timestamps.Extend(timestamps)
+        if self.dedup:
+            if self._interactions is None:
+                self._BuildInteractions()
+            new_pairs = np.fromiter((self._AddPair(u, i, self.size + r) for r, (u, i) in enumerate(zip(user_ids.tolist(), item_ids.tolist()))), dtype=bool, count=n)
+            self.useritems.Extend(user_ids[new_pairs], item_ids[new_pairs])
+            self.itemusers.Extend(item_ids[new_pairs], user_ids[new_pairs])
+        else:
+            if self._interactions is not None:
+                self._interactions.update(_InteractionKeys(user_ids, item_ids).tolist())
+            self.useritems.Extend(user_ids, item_ids)
+            self.itemusers.Extend(item_ids, user_ids)
+        self.size = self.size + n
+        return user_ids, item_ids
+
+    def _CheckTimestamps(self, timestamps, count):
+        # valida os timestamps de novas interações antes de qualquer alteração e retorna os timestamps a guardar (ou None):
+        # ordenados; obrigatórios com janela de tempo; omitidos num objeto com timestamps, repetem o da última interação
+        if timestamps is None:
+            if self._retention is not None and self._retention['time_window'] is not None:
+                raise ValueError('a timestamp is required for each interaction')
+            if self._timestamps is None:
+                return None
+            if not len(self._timestamps):
+                raise ValueError('a timestamp is required for each interaction')
+            last = len(self._timestamps) - 1
+            return np.repeat(self._timestamps.buffer[last:last + 1], count)
+        if self._timestamps is None:
+            if self.size:
+                raise ValueError('this ImplicitData has no timestamps')
+            self._timestamps = GrowableArray(promote=True) # primeira interação com timestamp de um objeto vazio
+        timestamps = np.asarray(timestamps)
+        if len(timestamps) and (np.any(timestamps[1:] < timestamps[:-1]) or len(self._timestamps) and timestamps[0] < self._timestamps.buffer[len(self._timestamps) - 1]):
+            raise ValueError('timestamps must be non-decreasing')
+        return timestamps
+
+    def GetTimeRange(self, start = None, end = None):
+        '''
+        Obtem as posições (lo, hi) das interações com start <= timestamp < end, por pesquisa binária - O(log n)
+        start/end - None para um intervalo aberto
+        '''
+        if self._timestamps is None:
+            raise ValueError('this ImplicitData has no timestamps')
+        if self._retention is not None:
+            self._CompactLog() # as interações despejadas ainda na sequência não podem entrar no intervalo
+        timestamps = self.timestamps
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        hi = self.size if end is None else int(np.searchsorted(timestamps, end, side='left'))
+        return lo, max(lo, hi)
+
+    def SliceByTime(self, start = None, end = None, dedup: bool = False):
+        '''
+        Cria um ImplicitData com as interações com start <= timestamp < end (ex. um bucket ou uma janela de avaliação)
+        As colunas do novo objeto são views sobre as deste (sem cópia) e o vocabulário é partilhado, como em FromCodes:
+        os IDs internos são os mesmos nos dois objetos. O custo é O(log n) para encontrar o intervalo mais a criação de useritems/itemusers do intervalo
+        '''
+        lo, hi = self.GetTimeRange(start, end)
+        self._shared_vocabulary = True # novos usuários/itens deste objeto não podem alterar o vocabulário do intervalo
+        return type(self).FromCodes(self.userindices[lo:hi], self.itemindices[lo:hi], self._users, self._items, dedup, self.timestamps[lo:hi])
+
+    def SetRetention(self, window: int = None, time_window = None, on_evict = None, timestamps = None):
+        '''
+        Ativa uma política de retenção: mantém só as últimas 'window' interações de cada usuário e/ou as interações dos últimos 'time_window'
+        (nas unidades dos timestamps dados a AddFeedback). As interações mais antigas são despejadas de useritems/itemusers em O(1) amortizado
+        on_evict - função chamada com (user_id, item_id) internos para cada interação despejada, para os modelos descontarem o seu estado (ver AddEvictionCallback)
+        timestamps - instantes das interações já existentes, se o objeto ainda não tem timestamps. Obrigatório com time_window se o objeto não está vazio
+        As interações despejadas saem também da sequência de interações (userindices/itemindices, GetTuple) quando esta é compactada,
+        o que desloca as posições - a memória não cresce com o comprimento do stream, só com o número de interações retidas
+        A política não é gravada por Save/Load. Não é suportada no modo dedup
+        '''
+        if self.dedup:
+            raise ValueError('retention is not supported in dedup mode')
+        if window is None and time_window is None:
+            raise ValueError('either window or time_window must be given')
+        if timestamps is not None:
+            if self._timestamps is not None:
+                raise ValueError('this ImplicitData already has timestamps')
+            timestamps = np.asarray(timestamps)
+            if len(timestamps) != self.size or np.any(timestamps[1:] < timestamps[:-1]):
+                raise ValueError('timestamps must be sorted and have one entry per interaction')
+            self._timestamps = GrowableArray(timestamps, promote=True)
+        if time_window is not None and self.size and self._timestamps is None:
+            raise ValueError('timestamps of the existing interactions are required for a time window')
+        if self._retention is not None:
+            self._CompactLog()
+        self._retention = {'window': window, 'time_window': time_window, 'callbacks': [],
+                           'alive': GrowableArray(np.ones(self.size, dtype=bool)), 'evicted': 0, 'head': 0}
+        if window is not None:
+            # fila das posições das interações de cada usuário, da mais antiga para a mais recente
+            queues = [deque() for _ in range(self.maxuserid + 1)]
+            for position, user_id in enumerate(self.userindices.tolist()):
+                queues[user_id].append(position)
+            self._retention['queues'] = queues
+        if on_evict is not None:
+            self.AddEvictionCallback(on_evict)
+        self._BuildInteractions()
+        if time_window is not None and self.size:
+            self._EvictOlderThan(self.timestamps[-1] - time_window)
+        if window is not None:
+            for user_id in range(self.maxuserid + 1):
+                self._EvictUser(user_id)
+        if self._retention['evicted'] > max(1024, self.size // 2):
+            self._CompactLog()
+
+    def AddEvictionCallback(self, callback):
+        '''
+        Regista uma função chamada com (user_id, item_id) internos para cada interação despejada pela política de retenção
+        '''
+        self._retention['callbacks'].append(callback)
+
+    def _Alive(self):
+        # máscara das interações retidas na sequência de interações (todas, sem política de retenção)
+        if self._retention is None:
+            return np.ones(self.size, dtype=bool)
+        return self._retention['alive'].View()
+
+    def _Retain(self, user_id, timestamp):
+        # regista a nova interação (a última da sequência) e despeja as interações do usuário além da janela
+        # (as que sairam da janela de tempo já foram despejadas em AddFeedback, antes de a nova interação ser adicionada)
+        retention = self._retention
+        retention['alive'].Append(True)
+        if retention['window'] is not None:
+            queues = retention['queues']
+            while len(queues) <= user_id:
+                queues.append(deque())
+            queues[user_id].append(self.size - 1)
+            self._EvictUser(user_id)
+        if retention['evicted'] > max(1024, self.size // 2):
+            self._CompactLog()
+
+    def _EvictOlderThan(self, limit):
+        # as interações estão por ordem de tempo: despeja a partir do início da sequência, até à primeira interação mais recente que limit
+        retention = self._retention
+        alive, timestamps = retention['alive'].buffer, self._timestamps.buffer
+        head = retention['head']
+        while head < self.size and timestamps[head] <= limit:
+            if alive[head]:
+                self._Evict(head)
+            head += 1
+        retention['head'] = head
+
+    def _EvictUser(self, user_id):
+        # despeja as interações mais antigas do usuário além das últimas 'window'
+        retention = self._retention
+        queue = retention['queues'][user_id]
+        while queue and not retention['alive'].buffer[queue[0]]: # já despejadas pela janela de tempo
+            queue.popleft()
+        while len(queue) > retention['window']:
+            self._Evict(queue.popleft())
+
+    def _Evict(self, position):
+        retention = self._retention
+        user_id, item_id = int(self.userindices[position]), int(self.itemindices[position])
+        retention['alive'].Set(position, False)
+        retention['evicted'] += 1
+        self.useritems.Remove(user_id, item_id)
+        self.itemusers.Remove(item_id, user_id)
+        key = user_id << 32 | item_id
+        self._interactions[key] -= 1
+        if not self._interactions[key]:
+            del self._interactions[key]
+        for callback in retention['callbacks']:
+            callback(user_id, item_id)
+
+    def _CompactLog(self):
+        # retira da sequência de interações as interações despejadas - O(interações retidas), feito quando metade da sequência foi despejada
+        retention = self._retention
+        alive = retention['alive'].View()
+        if retention['evicted'] == 0:
+            return
+        positions = np.cumsum(alive) - 1 # nova posição de cada interação retida
+        self._userindices = GrowableArray(self.userindices[alive], dtype=np.int32)
+        self._itemindices = GrowableArray(self.itemindices[alive], dtype=np.int32)
+        if self._timestamps is not None:
+            self._timestamps = GrowableArray(self.timestamps[alive], promote=True)
+        if retention['window'] is not None:
+            queues = [np.array(queue, dtype=np.int64) for queue in retention['queues']]
+            retention['queues'] = [deque(positions[queue[alive[queue]]].tolist()) for queue in queues]
+        retention['head'] = int(np.count_nonzero(alive[:retention['head']]))
+        self.size = len(self._userindices)
+        retention['alive'] = GrowableArray(np.ones(self.size, dtype=bool))
+        retention['evicted'] = 0
+
     def GetTuple(self, idx: int, internal: bool = False):
         '''
         Obtem uma tupla do usuário e item em uma interação (idx)
         Pode ser a representação interna ou externa
         '''
+        user_id, item_id = self.userindices[idx], self.itemindices[idx]
         if internal:
-            return self.userindices[idx], self.itemindices[idx]
-        return self.userlist[idx], self.itemlist[idx]
+            return user_id, item_id
+        return self.userset[user_id], self.itemset[item_id]
 
     def GetUserInternalId(self, user):
         '''
         Obtem ID interno do usuário
         '''
-        user_id, = np.where(self.userset == user)
-        if len(user_id):
-            return user_id[0]
-        return -1
+        return self.usermap.get(user, -1)
 
     def GetItemInternalId(self, item):
         '''
         Obtem ID interno do item
         '''
-        item_id, = np.where(self.itemset == item)
-        if len(item_id):
-            return item_id[0]
-        return -1
+        return self.itemmap.get(item, -1)
 
     def GetItemInternalIds(self, items:set):
-        item_ids, = np.where(np.isin(self.itemset, items))
+        item_ids = [self.itemmap[i] for i in items if i in self.itemmap]
         if len(item_ids):
-            return item_ids
+            return np.sort(item_ids)
         return []
 
     def GetUserExternalId(self, user_id:int):
@@ -139,3 +693,109 @@ class ImplicitData:
         if item_id > -1 and item_id <= self.maxitemid:
             return self.itemset[item_id]
         return ""
+
+
+def _InteractionKeys(user_ids, item_ids):
+    '''
+    Chaves dos pares (usuário, item) usadas em HasInteraction: usuário << 32 | item
+    '''
+    return np.asarray(user_ids, dtype=np.int64) << 32 | np.asarray(item_ids, dtype=np.int64)
+
+
+def _CodesAndCategories(column):
+    '''
+    Obtem os códigos (ID interno de cada interação) e as categorias (vocabulário) de uma coluna codificada, sem copiar
+    Aceita pandas Series categorical, pandas Categorical e pyarrow DictionaryArray/ChunkedArray (sem importar pandas nem pyarrow)
+    '''
+    if hasattr(column, 'cat'): # pandas Series categorical
+        column = column.cat
+    if hasattr(column, 'codes') and hasattr(column, 'categories'): # pandas Categorical
+        return np.asarray(column.codes), np.asarray(column.categories)
+    if hasattr(column, 'combine_chunks'): # pyarrow ChunkedArray - os chunks podem ter dicionários diferentes
+        column = column.unify_dictionaries().combine_chunks() if hasattr(column, 'unify_dictionaries') else column.combine_chunks()
+    if hasattr(column, 'indices') and hasattr(column, 'dictionary'): # pyarrow DictionaryArray
+        return column.indices.to_numpy(zero_copy_only=False), column.dictionary.to_numpy(zero_copy_only=False)
+    raise TypeError('expected a pandas categorical or a pyarrow dictionary array, got ' + type(column).__name__)
+
+
+def _SaveArray(filename, array):
+    array = np.asarray(array)
+    if array.dtype == object:
+        # ex. categorias de pandas (strings em arrays object) - converte para um dtype fixo, que pode ser aberto com memory map
+        fixed = np.array(array.tolist())
+        if fixed.dtype != object and len(fixed) == len(array):
+            array = fixed
+    np.save(filename, array, allow_pickle=(array.dtype == object))
+
+
+def _LoadArray(filename, mmap):
+    try:
+        return np.load(filename, mmap_mode='r' if mmap else None)
+    except ValueError: # array object (IDs de tipos mistos) - não pode ser aberto com memory map
+        return np.load(filename, allow_pickle=True)
+
+
+def _SaveImplicitData(data, path, vocabularies):
+    '''
+    vocabularies - vocabulários partilhados já gravados por SaveList (id do IdIndex -> caminho relativo), ou None para gravar tudo no próprio diretório
+    '''
+    os.makedirs(path, exist_ok=True)
+    if data._retention is not None:
+        data._CompactLog()
+    meta = {'format': 'ImplicitData', 'version': 1, 'size': data.size, 'shared_vocabulary': data._shared_vocabulary, 'dedup': data.dedup}
+    for name, vocabulary in (('users', data._users), ('items', data._items)):
+        if vocabularies is None or not data._shared_vocabulary:
+            meta[name] = name + '.npy'
+            _SaveArray(os.path.join(path, meta[name]), vocabulary.View())
+            continue
+        # vocabulário partilhado numa lista: gravado uma vez no diretório da lista e referido pelos elementos
+        if id(vocabulary) not in vocabularies:
+            vocabularies[id(vocabulary)] = os.path.join('..', 'vocabulary_%d_%s.npy' % (len(vocabularies), name))
+            _SaveArray(os.path.join(path, vocabularies[id(vocabulary)]), vocabulary.View())
+        meta[name] = vocabularies[id(vocabulary)]
+    _SaveArray(os.path.join(path, 'userindices.npy'), data.userindices)
+    _SaveArray(os.path.join(path, 'itemindices.npy'), data.itemindices)
+    meta['timestamps'] = data._timestamps is not None
+    if data._timestamps is not None:
+        _SaveArray(os.path.join(path, 'timestamps.npy'), data.timestamps)
+    if data.dedup:
+        for name in ('pairusers', 'pairitems', 'paircounts', 'pairlast'):
+            _SaveArray(os.path.join(path, name + '.npy'), getattr(data, '_' + name).View())
+    for name in ('useritems', 'itemusers'):
+        adjacency = getattr(data, name)
+        adjacency.Compact()
+        _SaveArray(os.path.join(path, name + '_indptr.npy'), adjacency.indptr)
+        _SaveArray(os.path.join(path, name + '_indices.npy'), adjacency.indices)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def _LoadImplicitData(cls, path, mmap, vocabularies):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    data = cls.__new__(cls)
+    data.size = meta['size']
+    for name in ('users', 'items'):
+        filename = os.path.normpath(os.path.join(path, meta[name]))
+        if filename not in vocabularies:
+            vocabularies[filename] = IdIndex(_LoadArray(filename, mmap), copy=False)
+        setattr(data, '_' + name, vocabularies[filename])
+    data._shared_vocabulary = meta['shared_vocabulary']
+    data._userindices = GrowableArray(_LoadArray(os.path.join(path, 'userindices.npy'), mmap), dtype=np.int32, copy=False)
+    data._itemindices = GrowableArray(_LoadArray(os.path.join(path, 'itemindices.npy'), mmap), dtype=np.int32, copy=False)
+    data.maxuserid = len(data._users) - 1
+    data.maxitemid = len(data._items) - 1
+    data._interactions = None
+    data._retention = None
+    data._timestamps = None
+    if meta.get('timestamps', False):
+        data._timestamps = GrowableArray(_LoadArray(os.path.join(path, 'timestamps.npy'), mmap), promote=True, copy=False)
+    data.dedup = meta.get('dedup', False)
+    if data.dedup:
+        for name, dtype in (('pairusers', np.int32), ('pairitems', np.int32), ('paircounts', np.int32), ('pairlast', np.int64)):
+            setattr(data, '_' + name, GrowableArray(_LoadArray(os.path.join(path, name + '.npy'), mmap), dtype=dtype, copy=False))
+    for name in ('useritems', 'itemusers'):
+        indptr = _LoadArray(os.path.join(path, name + '_indptr.npy'), mmap)
+        indices = _LoadArray(os.path.join(path, name + '_indices.npy'), mmap)
+        setattr(data, name, CSRAdjacency.FromArrays(indptr, indices))
+    return data
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import numpy as np
+from .symmetric_matrix import SymmetricMatrix
+
+class MemmapSymmetricMatrix(SymmetricMatrix):
+    '''
+    SymmetricMatrix backed by a numpy.memmap file, for matrices that do not fit in memory.
+    Rows are contiguous in the file (row-major, with a fixed row length 'columns'), so GetRow is one sequential read.
+    The file grows by blocks of rows appended at its end, without copying the existing rows.
+    Only when the number of entities passes 'columns' is the file rewritten, with twice as many columns.
+    '''
+
+    def __init__(self, num_entities: int = 0, filename: str = None, block_rows: int = 1024, columns: int = None, dtype = np.float64):
+        '''
+        num_entities -- initial number of entities
+        filename -- backing file (created or overwritten). If None, an anonymous temporary file is used, removed when the matrix is released
+        block_rows -- number of rows added to the file each time it grows
+        columns -- row length in the file, i.e. number of entities supported before the file is rewritten. Defaults to (num_entities + 1) * 2
+        dtype -- dtype of the entries
+        '''
+        self.filename = filename
+        self.block_rows = block_rows
+        self.dtype = np.dtype(dtype)
+        self.columns = max(columns or 0, (num_entities + 1) * 2)
+        self.max_id = num_entities - 1 # max id: number of entities -1
+        self._file = self._OpenFile(filename)
+        self._Map(min(num_entities + 1 + block_rows, self.columns))
+
+    def _OpenFile(self, filename):
+        if filename is None:
+            return tempfile.TemporaryFile()
+        return open(filename, 'w+b')
+
+    def _Map(self, rows: int):
+        # extends the file (with zeros) and maps it - the existing rows are not touched
+        self._file.truncate(rows * self.columns * self.dtype.itemsize)
+        self.matrix = np.memmap(self._file, dtype=self.dtype, mode='r+', shape=(rows, self.columns))
+        self.size = rows # capacity in rows, checked by SymmetricMatrix before writing
+
+    def _Resize(self):
+        self.matrix.flush()
+        rows = self.size + self.block_rows
+        if rows > self.columns:
+            self._Widen(max(self.columns * 2, rows))
+        self._Map(min(rows, self.columns))
+
+    def _Widen(self, columns: int):
+        # rewrites the file with longer rows, copying a block of rows at a time
+        old_matrix, old_file = self.matrix, self._file
+        temp_name = None if self.filename is None else self.filename + '.tmp'
+        self._file = self._OpenFile(temp_name)
+        self._file.truncate(self.size * columns * self.dtype.itemsize)
+        new_matrix = np.memmap(self._file, dtype=self.dtype, mode='r+', shape=(self.size, columns))
+        for start in range(0, self.size, self.block_rows):
+            new_matrix[start:start + self.block_rows, :self.columns] = old_matrix[start:start + self.block_rows]
+        new_matrix.flush()
+        del old_matrix, new_matrix
+        self.matrix = None
+        old_file.close()
+        if temp_name is not None:
+            os.replace(temp_name, self.filename)
+        self.columns = columns
+
+    def ToArrays(self):
+        '''
+        Returns (arrays, state) to save the matrix: the rows/columns in use (up to max_id + 1, which Increment may write) and the file layout.
+        '''
+        used = min(self.size, self.max_id + 2)
+        return {'matrix': self.matrix[:used, :used]}, {'max_id': int(self.max_id), 'block_rows': self.block_rows, 'columns': self.columns, 'dtype': self.dtype.name}
+
+    @classmethod
+    def FromArrays(cls, arrays: dict, state: dict, filename: str = None):
+        '''
+        Rebuilds a matrix from ToArrays in a new backing file (a temporary file if filename is None), copying a block of rows at a time.
+        '''
+        saved = arrays['matrix']
+        matrix = cls(state['max_id'] + 1, filename, state['block_rows'], max(state['columns'], len(saved)), state['dtype'])
+        if len(saved) > matrix.size:
+            matrix._Map(min(len(saved), matrix.columns))
+        for start in range(0, len(saved), matrix.block_rows):
+            stop = min(start + matrix.block_rows, len(saved))
+            matrix.matrix[start:stop, :len(saved)] = saved[start:stop]
+        return matrix
+
+    def Flush(self):
+        '''
+        Writes the changes to the backing file.
+        '''
+        self.matrix.flush()
@@ -0,0 +1,105 @@
+import numpy as np
+
+def _PackedLength(num_entities: int):
+    return num_entities * (num_entities + 1) // 2
+
+class PackedSymmetricMatrix:
+    '''
+    Dense SymmetricMatrix stored as a packed triangle (each entry once) in float32 by default, with the same API.
+    Uses a quarter of the memory of SymmetricMatrix, and Increment writes one entry instead of two.
+    Entry (i, j), i <= j, is at position j * (j + 1) / 2 + i: the entries of a new entity are appended after the existing ones,
+    so growing the matrix only copies the packed array into a larger one.
+    '''
+
+    def __init__(self, num_entities: int = 0, dtype = np.float32):
+        self.size = (num_entities + 1) * 2 # capacity in entities, as in SymmetricMatrix
+        self.packed = np.zeros(_PackedLength(self.size), dtype=dtype)
+        self.max_id = num_entities - 1 # max id: number of entities -1
+
+    def _Position(self, i, j):
+        # works for ints and for arrays of ints
+        low, high = np.minimum(i, j), np.maximum(i, j)
+        return high * (high + 1) // 2 + low
+
+    def Get(self, i, j):
+        if i > self.max_id or i < 0 or j > self.max_id or j < 0:
+            return 0
+        return float(self.packed[self._Position(i, j)])
+
+    def GetRow(self, i: int):
+        '''
+        Returns the row for an entity as a (float64) array, limited to max_id.
+        '''
+        row = np.zeros(self.max_id + 1)
+        if i < 0 or i > self.max_id:
+            return row
+        start = _PackedLength(i)
+        row[:i + 1] = self.packed[start:start + i + 1] # (i, j) for j <= i is contiguous
+        cols = np.arange(i + 1, self.max_id + 1, dtype=np.int64)
+        row[i + 1:] = self.packed[cols * (cols + 1) // 2 + i]
+        return row
+
+    def IncrementDiag(self, i: int, value: float = 1):
+        if i < 0 or i > self.max_id + 1:
+            return False
+        if i == self.max_id + 1:
+            self._Reserve(i + 2)
+            self.max_id = i
+        self.packed[self._Position(i, i)] += value
+        return True
+
+    def Increment(self, i: int, j: int, value: float = 1):
+        if i < 0 or j < 0 or i > self.max_id + 1 or j > self.max_id + 1:
+            return False
+        # SymmetricMatrix adds value to [i][j] and to [j][i], i.e. twice to the diagonal
+        self.packed[self._Position(i, j)] += 2 * value if i == j else value
+        return True
+
+    def IncrementPairs(self, i_array, j_array, value: float = 1):
+        '''
+        Vectorized Increment of the pairs (i_array[k], j_array[k]), repeated pairs included (np.add.at).
+        Pairs out of range are ignored, as in Increment. Returns the number of pairs incremented.
+        '''
+        i_array, j_array = np.asarray(i_array, dtype=np.int64), np.asarray(j_array, dtype=np.int64)
+        valid = (i_array >= 0) & (j_array >= 0) & (i_array <= self.max_id + 1) & (j_array <= self.max_id + 1)
+        i_array, j_array = i_array[valid], j_array[valid]
+        values = np.where(i_array == j_array, 2 * value, value).astype(self.packed.dtype)
+        np.add.at(self.packed, self._Position(i_array, j_array), values)
+        return len(i_array)
+
+    def Set(self, i: int, j: int, val: float):
+        if i == self.max_id + 1 or j == self.max_id + 1:
+            self._Reserve(max(i, j) + 2)
+            self.max_id = max(i, j)
+        if i < 0 or j < 0 or i >= self.max_id + 1 or j >= self.max_id + 1:
+            return False
+        self.packed[self._Position(i, j)] = val
+        return True
+
+    def ToArrays(self):
+        '''
+        Returns (arrays, state) to save the matrix: the packed entries in use (up to max_id + 1, which Increment may write) and max_id.
+        '''
+        used = min(self.size, self.max_id + 2)
+        return {'packed': self.packed[:_PackedLength(used)]}, {'max_id': int(self.max_id), 'size': int(used)}
+
+    @classmethod
+    def FromArrays(cls, arrays: dict, state: dict):
+        '''
+        Rebuilds a matrix from ToArrays. The array is used as is (e.g. memory-mapped) until the matrix grows.
+        '''
+        matrix = cls.__new__(cls)
+        matrix.packed = arrays['packed']
+        matrix.size = state['size']
+        matrix.max_id = state['max_id']
+        return matrix
+
+    def _Reserve(self, num_entities: int):
+        # Increment may write one entity past max_id, so the capacity is kept at max_id + 2 or more
+        if num_entities <= self.size:
+            return
+        new_size = max(self.size * 2, num_entities)
+        new_packed = np.zeros(_PackedLength(new_size), dtype=self.packed.dtype)
+        new_packed[:len(self.packed)] = self.packed
+        self.packed = new_packed
+        self.size = new_size
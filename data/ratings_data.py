@@ -1,52 +1,125 @@
+import numpy as np
+from .growable_array import GrowableArray
+from .csr_adjacency import CSRAdjacency
+from .id_index import IdIndex
+
 class RatingsData:
+    '''
+    Explicit feedback (user, item, rating) stream, stored like ImplicitData:
+    columns of internal IDs in capacity-doubling arrays, vocabularies of external IDs (IdIndex) and CSR user-item / item-user maps.
+    A (user, item) -> row hash index makes GetIndex/GetRating O(1).
+    The public methods take and return external IDs.
+    '''
 
     def __init__(self, user_list: list, item_list: list, ratings_list: list):
-        self.userlist = user_list
-        self.itemlist = item_list
-        self.ratingslist = ratings_list
-        self.userset = set(self.userlist)
-        self.itemset = set(self.itemlist)
-        self.size = len(self.userlist)
+        self.size = len(user_list)
+        userset, userindices = np.unique(user_list, return_inverse=True)
+        itemset, itemindices = np.unique(item_list, return_inverse=True)
+        self._users = IdIndex(userset)
+        self._items = IdIndex(itemset)
+        self._userindices = GrowableArray(userindices, dtype=np.int32)
+        self._itemindices = GrowableArray(itemindices, dtype=np.int32)
+        self._ratings = GrowableArray(np.asarray(ratings_list), promote=True)
+        self.maxuserid = len(self._users) - 1
+        self.maxitemid = len(self._items) - 1
+        self._index = None # (user << 32 | item) -> row, built on first use
         self.BuildMaps()
 
+    @classmethod
+    def FromDataFrame(cls, data, user_col: str, item_col: str, rating_col: str):
+        '''
+        Vectorized bulk load from a DataFrame with one row per rating.
+        '''
+        return cls(data[user_col].to_numpy(), data[item_col].to_numpy(), data[rating_col].to_numpy())
+
+    @property
+    def userset(self):
+        return self._users.View()
+
+    @property
+    def itemset(self):
+        return self._items.View()
+
+    @property
+    def userlist(self):
+        return self.userset[self._userindices.View()]
+
+    @property
+    def itemlist(self):
+        return self.itemset[self._itemindices.View()]
+
+    @property
+    def ratingslist(self):
+        return self._ratings.View()
+
     def BuildMaps(self):
-        self.useritems = {}
-        self.itemusers = {}
-        for u in self.userset:
-            self.useritems[u] = []
-        for i in self.itemset:
-            self.itemusers[i] = []
-        for i in range(self.size):
-            self.useritems[self.userlist[i]].append(self.itemlist[i])
-            self.itemusers[self.itemlist[i]].append(self.userlist[i])
+        userindices, itemindices = self._userindices.View(), self._itemindices.View()
+        self.useritems = CSRAdjacency(userindices, itemindices, self.maxuserid + 1)
+        self.itemusers = CSRAdjacency(itemindices, userindices, self.maxitemid + 1)
+
+    def _BuildIndex(self):
+        keys = self._userindices.View().astype(np.int64) << 32 | self._itemindices.View()
+        # later rows overwrite earlier ones - a repeated (user, item) pair maps to its latest rating
+        self._index = dict(zip(keys.tolist(), range(len(keys))))
+
+    def GetUserInternalId(self, user_id):
+        return self._users.Get(user_id)
+
+    def GetItemInternalId(self, item_id):
+        return self._items.Get(item_id)
 
     def GetUserItems(self, user_id):
-        return self.useritems[user_id]
+        uid = self._users.Get(user_id)
+        if uid == -1:
+            return []
+        return self.itemset[self.useritems.GetRow(uid)]
 
     def GetItemUsers(self, item_id):
-        return self.itemusers[item_id]
+        iid = self._items.Get(item_id)
+        if iid == -1:
+            return []
+        return self.userset[self.itemusers.GetRow(iid)]
 
     def GetRating(self, user_id, item_id):
+        '''
+        Returns the (latest) rating of the user for the item, or None if there is none.
+        '''
         idx = self.GetIndex(user_id, item_id)
-        return self.ratingslist[idx]
+        if idx == -1:
+            return None
+        return self._ratings.buffer[idx]
 
     def GetIndex(self, user_id, item_id):
-        i = self.userlist.index(user_id)
-        while(self.itemlist[i] != item_id):
-            i += 1 + self.userlist[i+1:].index(user_id)
+        '''
+        Returns the row of the (latest) rating of the user for the item, or -1 if there is none.
+        '''
+        uid, iid = self._users.Get(user_id), self._items.Get(item_id)
+        if uid == -1 or iid == -1:
+            return -1
+        if self._index is None:
+            self._BuildIndex()
+        return self._index.get(uid << 32 | iid, -1)
 
     def AddFeedback(self, user_id, item_id, rating):
-        self.userlist.append(user_id)
-        self.itemlist.append(item_id)
-        self.ratingslist.append(item_id)
-        if user_id not in self.userset:
-            self.userset.add(user_id)
-            self.useritems[user_id] = []
-        if item_id not in self.itemset:
-            self.itemset.add(item_id)
-            self.itemusers[item_id] = []
-        self.useritems[user_id].append(item_id)
-        self.itemusers[item_id].append(user_id)
+        uid = self._users.Get(user_id)
+        if uid == -1:
+            uid = self._users.Add(user_id)
+            self.maxuserid += 1
+            self.useritems.AddRow()
+        iid = self._items.Get(item_id)
+        if iid == -1:
+            iid = self._items.Add(item_id)
+            self.maxitemid += 1
+            self.itemusers.AddRow()
+        self._userindices.Append(uid)
+        self._itemindices.Append(iid)
+        self._ratings.Append(rating)
+        self.useritems.Append(uid, iid)
+        self.itemusers.Append(iid, uid)
+        if self._index is not None:
+            self._index[uid << 32 | iid] = self.size
+        self.size += 1
 
     def GetTuple(self, idx: int):
-        return self.userlist[idx], self.itemlist[idx]
+        # View: a negative idx counts back from the last interaction, not from the end of the unused capacity
+        return self.userset[self._userindices.View()[idx]], self.itemset[self._itemindices.View()[idx]]
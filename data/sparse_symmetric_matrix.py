@@ -0,0 +1,209 @@
+import numpy as np
+
+_EMPTY = {}
+
+class SparseSymmetricMatrix:
+    '''
+    Sparse version of SymmetricMatrix, with the same Get/GetRow/Increment/IncrementDiag/Set API.
+    Memory grows with the number of non-zero entries instead of the square of the number of entities.
+    Entries live in CSR arrays (indptr, indices, data), with both (i, j) and (j, i) stored so that a row is a contiguous slice.
+    Writes go to a dictionary of keys per row, which overrides the CSR arrays and is merged into them periodically.
+    IncrementPairs coalesces repeated pairs (np.unique) and looks the whole batch up in the CSR arrays with one binary search.
+    '''
+
+    def __init__(self, num_entities: int = 0, min_pending: int = 4096):
+        '''
+        num_entities -- initial number of entities
+        min_pending -- minimum number of buffered writes before compaction. Compaction happens when the buffers hold more than max(min_pending, nnz / 4) entries, so its cost is amortized O(1) per write.
+        '''
+        self.max_id = num_entities - 1 # max id: number of entities -1
+        self.min_pending = min_pending
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.data = np.empty(0, dtype=np.float64)
+        self.pending = {} # row -> {col: value} written since the last compaction
+        self.num_pending = 0
+        self._keys = None # row << 32 | col of the CSR entries (sorted), built on the first batch lookup after a compaction
+
+    @property
+    def nnz(self):
+        return len(self.indices) + self.num_pending
+
+    def Get(self, i, j):
+        if i > self.max_id or i < 0 or j > self.max_id or j < 0:
+            return 0
+        return self._Get(i, j)
+
+    def GetRow(self, i: int):
+        '''
+        Returns the row for an entity as a dense array, limited to max_id, as SymmetricMatrix.GetRow does.
+        The row is materialized: O(max_id) memory and time per call. GetRowSparse returns only the non-zero entries.
+        '''
+        row = np.zeros(self.max_id + 1)
+        cols, values = self.GetRowSparse(i)
+        row[cols] = values
+        return row
+
+    def GetRowSparse(self, i: int):
+        '''
+        Returns the non-zero entries of the row of an entity, limited to max_id, as (indices, values) sorted by index.
+        '''
+        if i < 0 or i > self.max_id:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if i + 1 < len(self.indptr):
+            start, end = self.indptr[i], self.indptr[i + 1]
+            cols, values = self.indices[start:end].astype(np.int64), np.array(self.data[start:end])
+        else:
+            cols, values = np.empty(0, dtype=np.int64), np.empty(0)
+        row = self.pending.get(i)
+        if row:
+            # written entries override the CSR ones
+            pending_cols = np.fromiter(row.keys(), dtype=np.int64, count=len(row))
+            pending_values = np.fromiter(row.values(), dtype=np.float64, count=len(row))
+            kept = ~np.isin(cols, pending_cols)
+            cols, values = np.concatenate((cols[kept], pending_cols)), np.concatenate((values[kept], pending_values))
+            order = np.argsort(cols)
+            cols, values = cols[order], values[order]
+        inside = (cols <= self.max_id) & (values != 0) # an entry one past max_id (see Compact) is not part of the row yet
+        return cols[inside], values[inside]
+
+    def IncrementDiag(self, i: int, value: float = 1):
+        if i < 0 or i > self.max_id + 1:
+            return False
+        if i == self.max_id + 1:
+            self.max_id = i
+        self._Put(i, i, self._Get(i, i) + value)
+        return True
+
+    def Increment(self, i: int, j: int, value: float = 1):
+        if i < 0 or j < 0 or i > self.max_id + 1 or j > self.max_id + 1:
+            return False
+        # the dense matrix adds value to [i][j] and to [j][i], i.e. twice to the diagonal
+        self._Put(i, j, self._Get(i, j) + (2 * value if i == j else value))
+        return True
+
+    def IncrementPairs(self, i_array, j_array, value: float = 1):
+        '''
+        Vectorized Increment of the pairs (i_array[k], j_array[k]), repeated pairs included.
+        Pairs out of range are ignored, as in Increment. Returns the number of pairs incremented.
+        '''
+        i_array, j_array = np.asarray(i_array, dtype=np.int64), np.asarray(j_array, dtype=np.int64)
+        valid = (i_array >= 0) & (j_array >= 0) & (i_array <= self.max_id + 1) & (j_array <= self.max_id + 1)
+        i_array, j_array = i_array[valid], j_array[valid]
+        if not len(i_array):
+            return 0
+        # (i, j) and (j, i) are the same entry: one increment per distinct unordered pair, times its number of repeats
+        keys, counts = np.unique(np.minimum(i_array, j_array) << 32 | np.maximum(i_array, j_array), return_counts=True)
+        rows, cols = keys >> 32, keys & 0xFFFFFFFF
+        # the dense matrix adds value to [i][j] and to [j][i], i.e. twice to the diagonal
+        current = self._GetMany(rows, cols)
+        values = current + counts * np.where(rows == cols, 2 * value, value)
+        written = (values != 0) | (current != 0) # zeros are not stored
+        self._PutMany(rows[written], cols[written], values[written])
+        return len(i_array)
+
+    def Set(self, i: int, j: int, val: float):
+        if i == self.max_id + 1 or j == self.max_id + 1:
+            self.max_id = max(i, j)
+        if i < 0 or j < 0 or i >= self.max_id + 1 or j >= self.max_id + 1:
+            return False
+        self._Put(i, j, val)
+        return True
+
+    def ToArrays(self):
+        '''
+        Returns (arrays, state) to save the matrix: the CSR arrays (after Compact) and the scalar attributes.
+        '''
+        self.Compact()
+        return {'indptr': self.indptr, 'indices': self.indices, 'data': self.data}, {'max_id': int(self.max_id), 'min_pending': self.min_pending}
+
+    @classmethod
+    def FromArrays(cls, arrays: dict, state: dict):
+        '''
+        Rebuilds a matrix from ToArrays. The CSR arrays are used as is (e.g. memory-mapped) until the next compaction.
+        '''
+        matrix = cls.__new__(cls)
+        matrix.indptr, matrix.indices, matrix.data = arrays['indptr'], arrays['indices'], arrays['data']
+        matrix.max_id = state['max_id']
+        matrix.min_pending = state['min_pending']
+        matrix.pending = {}
+        matrix.num_pending = 0
+        matrix._keys = None
+        return matrix
+
+    def _Get(self, i: int, j: int):
+        row = self.pending.get(i)
+        if row is not None and j in row:
+            return row[j]
+        if i + 1 < len(self.indptr):
+            start, end = self.indptr[i], self.indptr[i + 1]
+            pos = start + np.searchsorted(self.indices[start:end], j)
+            if pos < end and self.indices[pos] == j:
+                return self.data[pos]
+        return 0.0
+
+    def _Put(self, i: int, j: int, value: float):
+        if value == 0 and self._Get(i, j) == 0:
+            return # zeros are not stored
+        self.pending.setdefault(i, {})[j] = value
+        self.pending.setdefault(j, {})[i] = value
+        self.num_pending += 1
+        if self.num_pending > max(self.min_pending, len(self.indices) // 4):
+            self.Compact()
+
+    def _GetMany(self, rows, cols):
+        # values of the entries (rows[k], cols[k]): one binary search over the CSR keys, then the written entries
+        values = np.zeros(len(rows))
+        if len(self.indices):
+            if self._keys is None:
+                self._keys = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr)) << 32 | self.indices
+            keys = rows << 32 | cols
+            pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+            found = self._keys[pos] == keys
+            values[found] = self.data[pos[found]]
+        if self.pending:
+            # written entries override the CSR ones (NaN: not written)
+            pending = self.pending
+            written = np.fromiter((pending.get(i, _EMPTY).get(j, np.nan) for i, j in zip(rows.tolist(), cols.tolist())), dtype=np.float64, count=len(rows))
+            values = np.where(np.isnan(written), values, written)
+        return values
+
+    def _PutMany(self, rows, cols, values):
+        # one dictionary write per orientation of each (distinct) entry, then a single compaction check
+        pending = self.pending
+        for i, j, value in zip(rows.tolist(), cols.tolist(), values.tolist()):
+            row = pending.get(i)
+            if row is None:
+                row = pending[i] = {}
+            row[j] = value
+            row = pending.get(j)
+            if row is None:
+                row = pending[j] = {}
+            row[i] = value
+        self.num_pending += len(rows)
+        if self.num_pending > max(self.min_pending, len(self.indices) // 4):
+            self.Compact()
+
+    def Compact(self):
+        '''
+        Merges the written entries into the CSR arrays, dropping zeros.
+        '''
+        base_rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        pending_rows = np.fromiter((i for i, row in self.pending.items() for _ in row), dtype=np.int64)
+        pending_cols = np.fromiter((j for row in self.pending.values() for j in row), dtype=np.int64)
+        pending_data = np.fromiter((value for row in self.pending.values() for value in row.values()), dtype=np.float64)
+        keys = np.concatenate((base_rows << 32 | self.indices, pending_rows << 32 | pending_cols))
+        data = np.concatenate((self.data, pending_data))
+        # written entries come last and override the CSR ones: keep the last occurrence of each key
+        keys, last = np.unique(keys[::-1], return_index=True)
+        data = data[::-1][last]
+        keys, data = keys[data != 0], data[data != 0]
+        rows = keys >> 32
+        self.indices = (keys & 0xFFFFFFFF).astype(np.int32)
+        self.data = data
+        counts = np.bincount(rows, minlength=self.max_id + 1) # Increment may write one row past max_id, as in the dense matrix
+        self.indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.pending = {}
+        self.num_pending = 0
+        self._keys = None
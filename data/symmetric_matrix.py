@@ -15,23 +15,35 @@ class SymmetricMatrix:
     def GetRow(self, i: int):
         return self.matrix[i][:self.max_id + 1] # returns the row for an entity, limited to max_id
 
-    def IncrementDiag(self, i: int):
+    def IncrementDiag(self, i: int, value: float = 1):
         if i < 0 or i > self.max_id + 1:
             return False
         if i >= self.max_id + 1:
-            if i == self.size:
+            if i + 1 >= self.size: # keeps room for max_id + 1, which Increment may write
                 self._Resize()
             self.max_id = i
-        self.matrix[i][i] += 1
+        self.matrix[i][i] += value
         return True
 
-    def Increment(self, i: int, j: int):
+    def Increment(self, i: int, j: int, value: float = 1):
         if i < 0 or j < 0 or i > self.max_id + 1 or j > self.max_id + 1:
             return False
-        self.matrix[i][j] += 1
-        self.matrix[j][i] += 1
+        self.matrix[i][j] += value
+        self.matrix[j][i] += value
         return True
 
+    def IncrementPairs(self, i_array, j_array, value: float = 1):
+        '''
+        Vectorized Increment of the pairs (i_array[k], j_array[k]), repeated pairs included (np.add.at).
+        Pairs out of range are ignored, as in Increment. Returns the number of pairs incremented.
+        '''
+        i_array, j_array = np.asarray(i_array, dtype=np.int64), np.asarray(j_array, dtype=np.int64)
+        valid = (i_array >= 0) & (j_array >= 0) & (i_array <= self.max_id + 1) & (j_array <= self.max_id + 1)
+        i_array, j_array = i_array[valid], j_array[valid]
+        np.add.at(self.matrix, (i_array, j_array), value)
+        np.add.at(self.matrix, (j_array, i_array), value)
+        return len(i_array)
+
     def Set(self, i: int, j: int, val: float):
         if i == self.max_id + 1 or j == self.max_id + 1:
             if self.max_id + 2 >= self.size:
@@ -43,6 +55,24 @@ class SymmetricMatrix:
         self.matrix[j][i] = val
         return True
 
+    def ToArrays(self):
+        '''
+        Returns (arrays, state) to save the matrix: the rows/columns in use (up to max_id + 1, which Increment may write) and max_id.
+        '''
+        used = min(self.size, self.max_id + 2)
+        return {'matrix': self.matrix[:used, :used]}, {'max_id': int(self.max_id)}
+
+    @classmethod
+    def FromArrays(cls, arrays: dict, state: dict):
+        '''
+        Rebuilds a matrix from ToArrays. The array is used as is (e.g. memory-mapped) until the matrix grows.
+        '''
+        matrix = cls.__new__(cls)
+        matrix.matrix = arrays['matrix']
+        matrix.size = len(matrix.matrix)
+        matrix.max_id = state['max_id']
+        return matrix
+
     def _Resize(self):
         new_size = self.size * 2
         new_matrix = np.zeros((new_size, new_size))
@@ -85,6 +85,9 @@ def get_namepaths(data_name:str,
 
     buckets_path = output_path+'sample_'+sample_str+'_'+bucket_freq+'_buckets.joblib'
     holdouts_path = output_path+'sample_'+sample_str+'_'+bucket_freq+'_holdouts.joblib'
+    # directories for ImplicitData.SaveList / LoadList (memory-mapped .npy arrays), alternative to the joblib dumps above
+    buckets_dir = output_path+'sample_'+sample_str+'_'+bucket_freq+'_buckets'
+    holdouts_dir = output_path+'sample_'+sample_str+'_'+bucket_freq+'_holdouts'
 
     results_matrix_path = output_path+''+dataset_name+' '+bucket_freq+'_bucket '+model_print_name+' results.csv'
 
@@ -114,6 +117,8 @@ def get_namepaths(data_name:str,
             'bucket_freq': bucket_freq,
             'buckets_path': buckets_path,
             'holdouts_path': holdouts_path,
+            'buckets_dir': buckets_dir,
+            'holdouts_dir': holdouts_dir,
             'results_matrix_path': results_matrix_path,
             'recall_heatmap_title': recall_heatmap_title,
             'recall_heatmap_path': recall_heatmap_path,
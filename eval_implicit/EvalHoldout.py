@@ -1,6 +1,6 @@
 from data import ImplicitData
 from recommenders_implicit import *
-# import numpy as np
+import numpy as np
 # import pandas as pd
 import time
 # import random
@@ -60,7 +60,16 @@ class EvalHoldout:
 
 #         return results
 
-    def Evaluate(self, exclude_known_items: bool = True ):
+    def Evaluate(self, exclude_known_items: bool = True, batch: bool = False):
+        '''
+        batch -- if True, recommendations for all holdout users are computed with a single model.RecommendBatch call
+            (one block matrix product instead of a Recommend call per row). Same metric values, but the time vectors
+            then hold one value each (the whole call) instead of one value per holdout row.
+            Not used with default_user='random': new users draw random factors on each Recommend call, and the per-row
+            calls keep the draws (and so the results) of the original evaluation.
+        '''
+        if batch and self.default_user != 'random' and hasattr(self.model, 'RecommendBatch'):
+            return self._EvaluateBatch(exclude_known_items)
         results = {'time_get_tuple':[], 'time_recommend': [], 'time_eval_point': []}
 
         for metric in self.metrics:
@@ -88,6 +97,31 @@ class EvalHoldout:
 #                 print(uid, 'user not seen')
         return results
 
+    def _EvaluateBatch(self, exclude_known_items: bool = True):
+        results = {'time_get_tuple':[], 'time_recommend': [], 'time_eval_point': []}
+        for metric in self.metrics:
+            results[metric] = []
+        # GetTuple
+        start_get_tuple = time.time()
+        users, items = self.holdout.userlist, self.holdout.itemlist # external IDs
+        unique_users, user_rows = np.unique(users, return_inverse=True) # one recommendation list per distinct user
+        end_get_tuple = time.time()
+        results['time_get_tuple'].append(end_get_tuple - start_get_tuple)
+        # Recommend
+        start_recommend = time.time()
+        reclists = self.model.RecommendBatch(unique_users, n = self.N_recommendations, exclude_known_items = exclude_known_items, default_user=self.default_user)
+        end_recommend = time.time()
+        results['time_recommend'].append(end_recommend - start_recommend)
+        # EvalPoint
+        start_eval_point = time.time()
+        for iid, user_row in zip(items, user_rows):
+            reclist = reclists[user_row]
+            if len(reclist): # if user has been seen by model, add result
+                results[metric].append(self.__EvalPoint(iid, reclist))
+        end_eval_point = time.time()
+        results['time_eval_point'].append(end_eval_point - start_eval_point)
+        return results
+
     def __EvalPoint(self, item_id, reclist):
         result = 0
         if len(reclist) == 0:
@@ -31,7 +31,7 @@ class EvalLeaveLastOut:
             user = self.test_users[i]
             item = self.test_items[i]
 
-            if item not in self.model.data.GetUserItems(user, False):
+            if not self.model.data.HasInteraction(user, item, False):
                 start_recommend = time.time()
                 reclist = self.model.Recommend(user, 20)
                 end_recommend = time.time()
@@ -62,7 +62,7 @@ class EvalLeaveLastOut:
 
         for i in range(count):
             uid, iid = self.data.GetTuple(i)
-            if i >= start_eval and i % interleaved == 0 and iid not in self.model.data.GetUserItems(uid, False):
+            if i >= start_eval and i % interleaved == 0 and not self.model.data.HasInteraction(uid, iid, False):
                 reclist = self.model.Recommend(uid)
                 results[metric].append(self.__EvalPoint(iid, reclist))
             self.model.IncrTrain(uid, iid)
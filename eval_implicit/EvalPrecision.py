@@ -0,0 +1,92 @@
+from eval_implicit import EvalHoldout
+from data import ImplicitData
+from recommenders_implicit import *
+import numpy as np
+import pandas as pd
+import time
+
+DEFAULT_CONFIGURATIONS = [('float64', False), ('float32', False), ('float16', False), ('float64', True), ('float32', True)]
+
+class EvalPrecision:
+    '''
+    Accuracy report of the reduced-precision modes of the ISGD and BISGD families (precision parameter and BuildQuantizedScoring)
+    against float64, on the Recall@N holdout evaluation.
+    For each configuration a model is trained on the same interactions, from the same random seed, and evaluated with EvalHoldout.
+    '''
+
+    def __init__(self, model_class, train: ImplicitData, holdout: ImplicitData, N_recommendations: int = 20, default_user: str = 'none', **model_args):
+        '''
+        model_class -- ISGD, RAISGD, RSISGD, BISGD, UBISGD or LocalUBISGD
+        train -- interactions used to train each model (incrementally, in stream order)
+        holdout -- test interactions (ImplicitData), evaluated with EvalHoldout
+        N_recommendations -- N of Recall@N
+        default_user -- str. One of: none, random, average, or median, as in EvalHoldout
+        model_args -- other parameters of the model (num_factors, learn_rate, ...)
+        '''
+        self.model_class = model_class
+        self.train = train
+        self.holdout = holdout
+        self.N_recommendations = N_recommendations
+        self.default_user = default_user
+        self.model_args = model_args
+
+    def Evaluate(self, configurations: list = DEFAULT_CONFIGURATIONS, exclude_known_items: bool = True):
+        '''
+        Returns a DataFrame with one row per configuration (precision, int8 scoring):
+        - Recall@N and its difference to the float64 model (recall_delta);
+        - top_n_overlap: mean fraction of the float64 model's top N found in this configuration's top N, over the holdout users;
+        - factor_bytes: memory of the factors, and memory_ratio = float64 factor bytes / factor_bytes;
+        - scoring_bytes: bytes read to score every item for one user (int8 copy, or the item factors);
+        - recommend_time: time of the RecommendBatch call of EvalHoldout, and speedup against float64 scoring.
+
+        configurations -- list of (precision, quantized_scoring) pairs. ('float64', False) is always evaluated first as the reference
+        '''
+        configurations = [('float64', False)] + [c for c in configurations if tuple(c) != ('float64', False)]
+        users = np.unique(self.holdout.userlist)
+        rows = []
+        for precision, quantized in configurations:
+            model = self._Train(precision, quantized)
+            results = EvalHoldout(model=model, holdout=self.holdout, metrics=['Recall@N'], N_recommendations=self.N_recommendations,
+                                  default_user=self.default_user).Evaluate(exclude_known_items=exclude_known_items, batch=True)
+            top_n = [set(recs[:, 0].tolist()) if len(recs) else set()
+                     for recs in model.RecommendBatch(users, self.N_recommendations, exclude_known_items, default_user=self.default_user)]
+            if not rows:
+                reference = top_n
+            overlaps = [len(a & b) / len(a) for a, b in zip(reference, top_n) if len(a)]
+            factor_bytes, scoring_bytes = self._Bytes(model)
+            rows.append({
+                'precision': precision,
+                'scoring': 'int8' if quantized else precision,
+                'Recall@N': sum(results['Recall@N']) / self.holdout.size,
+                'top_n_overlap': float(np.mean(overlaps)) if overlaps else 1.0,
+                'factor_bytes': factor_bytes,
+                'scoring_bytes': scoring_bytes,
+                'recommend_time': sum(results['time_recommend'])
+            })
+        report = pd.DataFrame(rows)
+        report['recall_delta'] = report['Recall@N'] - report['Recall@N'][0]
+        report['memory_ratio'] = report['factor_bytes'][0] / report['factor_bytes']
+        report['speedup'] = report['recommend_time'][0] / report['recommend_time']
+        return report
+
+    def _Train(self, precision, quantized):
+        model = self.model_class(ImplicitData([], []), precision=precision, **self.model_args)
+        model.IncrTrainMany(self.train.userlist, self.train.itemlist)
+        if quantized:
+            model.BuildQuantizedScoring()
+        return model
+
+    @staticmethod
+    def _Bytes(model):
+        user_factors, item_factors = model.user_factors, model.item_factors
+        if isinstance(item_factors, list): # BISGD family: one matrix per node
+            factor_bytes = sum(f.View().nbytes for f in user_factors + item_factors)
+            item_bytes = sum(f.View().nbytes for f in item_factors) / len(item_factors)
+            quantized = model.item_quantized or []
+        else:
+            factor_bytes = user_factors.View().nbytes + item_factors.View().nbytes
+            item_bytes = item_factors.View().nbytes
+            quantized = [model.item_quantized] if model.item_quantized is not None else []
+        if quantized:
+            item_bytes = sum(q.codes.View().nbytes + q.scales.View().nbytes for q in quantized) / len(quantized)
+        return factor_bytes, int(item_bytes)
@@ -51,7 +51,7 @@ class EvalPrequential:
             time_get_tuple.append(end_get_tuple - start_get_tuple) 
 
             if i >= start_eval and random.random() <= 1/interleaved and i>100: # *, ***
-                if iid not in self.model.data.GetUserItems(uid, False): # if iid is not in the users list of interacted items
+                if not self.model.data.HasInteraction(uid, iid, False): # if iid is not in the users list of interacted items
                     start_recommend = time.time()
                     reclist = self.model.Recommend(uid, 20) # recommend 20 items to uid
                     end_recommend = time.time()
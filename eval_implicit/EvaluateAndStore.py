@@ -1,4 +1,4 @@
-from eval_implicit import EvalPrequential, EvalHoldout
+from eval_implicit import EvalPrequential, EvalHoldout, DeltaCheckpoints
 from data import ImplicitData
 from recommenders_implicit import *
 import numpy as np
@@ -9,12 +9,16 @@ import copy
 
 class EvaluateAndStore(EvalPrequential):
 
-    def __init__(self, model: Model, data: ImplicitData, n_holdouts=20, metrics = ["Recall@N"], N_recommendations=20, seed: int = None):
+    def __init__(self, model: Model, data: ImplicitData, n_holdouts=20, metrics = ["Recall@N"], N_recommendations=20, seed: int = None, delta_checkpoints: bool = True):
+        '''
+        delta_checkpoints - if True and the model tracks its changed rows (factor models), checkpoints keep only the rows changed
+            between checkpoints and are rebuilt when evaluated (see DeltaCheckpoints). Otherwise each checkpoint is a deep copy of the model
+        '''
         super().__init__(model, data, metrics, N_recommendations, seed)        
         self.n_holdouts = n_holdouts
         # self.holdouts = [ImplicitData(user_list=[], item_list=[]) for _ in range(self.n_holdouts)]
         self.holdouts = [[] for _ in range(n_holdouts)]
-        self.model_checkpoints = []
+        self.model_checkpoints = DeltaCheckpoints(model) if delta_checkpoints and DeltaCheckpoints.Supports(model) else []
 
     def EvaluateAndStore(self, start_eval = 0, count = 0, store_only=True, default_user='none'): # , interleaved = 1): 
         '''
@@ -79,13 +83,22 @@ class EvaluateAndStore(EvalPrequential):
         self.results_matrix = np.zeros(shape=(self.n_holdouts, self.n_holdouts))
         metric = self.metrics[0]
         # results_matrix = np.zeros(shape=(eval.n_holdouts, eval.n_holdouts))
-        for i, hd in enumerate( self.holdouts ):
-            for j, model in enumerate( self.model_checkpoints ):
-                eh_instance = EvalHoldout(model=model, holdout=hd, metrics=[metric], N_recommendations=self.N_recommendations, default_user=default_user)
-                result = sum( eh_instance.Evaluate(exclude_known_items=exclude_known_items)[metric]) / hd.size
-                self.results_matrix[i, j] = result
+        if default_user == 'random':
+            # new users draw random factors on each Recommend call: the original order (holdouts in the outer loop) keeps the draws and the results.
+            # DeltaCheckpoints are then rebuilt once per holdout
+            pairs = ((i, hd, j, model) for i, hd in enumerate( self.holdouts ) for j, model in enumerate( self.model_checkpoints ))
+        else:
+            # results do not depend on the order: checkpoints in the outer loop, each one is rebuilt (DeltaCheckpoints) only once
+            pairs = ((i, hd, j, model) for j, model in enumerate( self.model_checkpoints ) for i, hd in enumerate( self.holdouts ))
+        for i, hd, j, model in pairs:
+            eh_instance = EvalHoldout(model=model, holdout=hd, metrics=[metric], N_recommendations=self.N_recommendations, default_user=default_user)
+            result = sum( eh_instance.Evaluate(exclude_known_items=exclude_known_items, batch=True)[metric]) / hd.size # only the metric is kept
+            self.results_matrix[i, j] = result
     
     def _MakeCheckpoint(self):
+        if isinstance(self.model_checkpoints, DeltaCheckpoints):
+            self.model_checkpoints.Add() # rows changed since the last checkpoint
+            return
         model_cp = copy.deepcopy(self.model)
         self.model_checkpoints.append(model_cp) # [n_checkpoint]
 
@@ -22,9 +22,12 @@ class EvaluateHoldouts():
         self.EvaluateHoldouts_time_record = {}
 #         self._IncrementalTraining()
 
-    def Train_Evaluate(self, N_recommendations=20, exclude_known_items:bool=True, default_user:str='none', verbose=True):
+    def Train_Evaluate(self, N_recommendations=20, exclude_known_items:bool=True, default_user:str='none', verbose=True, batch_train:bool=False, batch_eval:bool=False):
         '''
         Incremental training of recommendation model.
+
+        batch_train -- if True, each bucket is sent to the model with a single IncrTrainMany call (same model, less overhead per interaction).\n\tThe train time vector then holds one value per bucket instead of one per interaction.
+        batch_eval -- if True, each holdout is evaluated with EvalHoldout.Evaluate(batch=True) (same results).\n\tThe EvalHoldout time vectors then hold one value per holdout instead of one per holdout row.
         '''
         cold_start_buckets = len( self.buckets ) - len( self.holdouts )
         self.results_matrix = np.zeros( shape=( len( self.holdouts ), len( self.holdouts ) ) )
@@ -34,26 +37,38 @@ class EvaluateHoldouts():
                 print(100*'-')
                 print(f'Train bucket {b}')
             incrtrain_time = []            
-            for i in range(bucket.size):
-                uid, iid = bucket.GetTuple(i) # get external IDs
+            # the bucket timestamps are forwarded to models whose data keeps timestamps (required by a retention time window)
+            timestamps = bucket.timestamps if self.model.data.timestamps is not None else None
+            if batch_train:
                 s = time.time()
-                self.model.IncrTrain(uid, iid) # perform incremental training
+                self.model.IncrTrainMany(bucket.userlist, bucket.itemlist, timestamps=timestamps) # perform incremental training with the whole bucket
                 f = time.time()
-                incrtrain_time.append(f-s)    
+                incrtrain_time.append(f-s)
+            else:
+                for i in range(bucket.size):
+                    uid, iid = bucket.GetTuple(i) # get external IDs
+                    s = time.time()
+                    if timestamps is None:
+                        self.model.IncrTrain(uid, iid) # perform incremental training
+                    else:
+                        self.model.IncrTrain(uid, iid, timestamp=timestamps[i])
+                    f = time.time()
+                    incrtrain_time.append(f-s)    
             if b >= cold_start_buckets:
                 self._EvaluateHoldouts(
                     bucket_number=b-cold_start_buckets,
                     N_recommendations=N_recommendations,
                     exclude_known_items=exclude_known_items,
-                    default_user=default_user)
+                    default_user=default_user,
+                    batch_eval=batch_eval)
             self.IncrementalTraining_time_record[f'bucket_{b}'] = {
                 'size':bucket.size,
                 'train time vector':incrtrain_time,
-                'avg train time':np.mean(incrtrain_time),
+                'avg train time':np.sum(incrtrain_time)/max(bucket.size, 1),
                 'total train time':np.sum(incrtrain_time),
             }
     
-    def _EvaluateHoldouts(self, bucket_number, N_recommendations=20, exclude_known_items:bool=True, default_user:str='none'):
+    def _EvaluateHoldouts(self, bucket_number, N_recommendations=20, exclude_known_items:bool=True, default_user:str='none', batch_eval:bool=False):
         '''
         exclude_known_items -- boolean, exclude known items from recommendation\n
         default_user -- str. One of: none, random, average, or median.\n\tIf user is not present in model (future user) user factors are generated. If none, then no recommendations are made (user wont count for recall)
@@ -68,7 +83,7 @@ class EvaluateHoldouts():
             eh_instance = EvalHoldout(model=self.model, holdout=hd, metrics=[metric], N_recommendations=N_recommendations, default_user=default_user)
             
             s = time.time()
-            results = eh_instance.Evaluate(exclude_known_items=exclude_known_items)
+            results = eh_instance.Evaluate(exclude_known_items=exclude_known_items, batch=batch_eval)
             f = time.time()
             evaluate_time.append(f-s)
             
@@ -1,5 +1,7 @@
 from .EvalPrequential import EvalPrequential
 from .EvalLeaveLastOut import EvalLeaveLastOut
 from .EvalHoldout import EvalHoldout 
+from .delta_checkpoints import DeltaCheckpoints
 from .EvaluateAndStore import EvaluateAndStore
+from .EvalPrecision import EvalPrecision
 from .EvaluateHoldouts import EvaluateHoldouts
\ No newline at end of file
@@ -0,0 +1,110 @@
+import copy
+import numpy as np
+from data import ImplicitData, IdIndex
+
+class DeltaCheckpoints:
+    '''
+    Sequence of checkpoints (model states) of a model that keeps training, without a full copy of the model per checkpoint.
+
+    Add records, for each array of the model's _SaveState:
+    - for the arrays whose changed rows the model tracks (_TrackedArrays, e.g. ISGD factors), only the rows changed
+      since the previous checkpoint (dirty_rows) and the rows added since then;
+    - for the other arrays (e.g. RAISGD item queue, UBISGD user_k), a copy;
+    plus the scalar attributes and the number of interactions, users and items of the model's data (a watermark).
+    The data is append-only, so it is not copied: its state at a checkpoint is the first interactions of the current data.
+    Memory grows with the rows changed between checkpoints instead of the model size times the number of checkpoints.
+
+    checkpoints[k] rebuilds the model of checkpoint k on demand (an independent model, as copy.deepcopy would give),
+    at the cost of applying the row deltas of checkpoints 0..k. Iterating rebuilds each checkpoint once, in order.
+    The data is copied for models whose data has a retention policy (interactions are evicted, so the log is not append-only).
+    Resetting the model (ResetModel) while checkpoints are being recorded is not supported.
+    '''
+
+    def __init__(self, model):
+        '''
+        model -- model that tracks its rows (model._TrackedArrays() not empty). Row tracking is turned on from this point
+        '''
+        self.model = model
+        self.checkpoints = []
+        self._rows = {} # name -> rows of each tracked array at the last checkpoint
+        model.TrackDirtyRows()
+
+    @staticmethod
+    def Supports(model):
+        return len(model._TrackedArrays()) > 0
+
+    def Add(self):
+        '''
+        Records the current state of the model as a new checkpoint.
+        '''
+        model = self.model
+        arrays, state = model._SaveState()
+        deltas = {}
+        full = {}
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if name not in model.dirty_rows:
+                full[name] = array.copy()
+                continue
+            size = array.shape[-2]
+            dirty = model.dirty_rows[name]
+            rows = np.union1d(np.fromiter(dirty, dtype=np.int64, count=len(dirty)), np.arange(self._rows.get(name, 0), size))
+            rows = rows[rows < size]
+            deltas[name] = (array.shape, rows, np.take(array, rows, axis=-2))
+            self._rows[name] = size
+        data = model.data
+        if data.retention is None:
+            data = (data.size, len(data.userset), len(data.itemset), data.dedup)
+        else:
+            data = copy.deepcopy(data)
+        self.checkpoints.append((deltas, full, copy.deepcopy(state), data))
+        model.TrackDirtyRows()
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def __getitem__(self, index: int):
+        index = range(len(self.checkpoints))[index]
+        arrays = {}
+        for deltas, _, _, _ in self.checkpoints[:index + 1]:
+            self._ApplyDeltas(arrays, deltas)
+        return self._Rebuild(index, arrays)
+
+    def __iter__(self):
+        arrays = {}
+        for index, (deltas, _, _, _) in enumerate(self.checkpoints):
+            self._ApplyDeltas(arrays, deltas)
+            yield self._Rebuild(index, arrays)
+
+    @staticmethod
+    def _ApplyDeltas(arrays, deltas):
+        for name, (shape, rows, values) in deltas.items():
+            array = arrays.get(name)
+            if array is None or array.shape != shape:
+                grown = np.empty(shape, dtype=values.dtype)
+                if array is not None:
+                    grown[..., :array.shape[-2], :] = array
+                array = arrays[name] = grown
+            array[..., rows, :] = values
+
+    def _Rebuild(self, index, arrays):
+        _, full, state, data = self.checkpoints[index]
+        model = self.model.__class__.__new__(self.model.__class__)
+        model.data = self._RebuildData(data)
+        state_arrays = {name: array.copy() for name, array in arrays.items()}
+        state_arrays.update((name, array.copy()) for name, array in full.items())
+        model._LoadState(state_arrays, copy.deepcopy(state))
+        return model
+
+    def _RebuildData(self, data):
+        if isinstance(data, ImplicitData):
+            return copy.deepcopy(data)
+        size, num_users, num_items, dedup = data
+        current = self.model.data
+        users = IdIndex(current.userset[:num_users].copy())
+        items = IdIndex(current.itemset[:num_items].copy())
+        timestamps = current.timestamps
+        data = ImplicitData.FromCodes(current.userindices[:size].copy(), current.itemindices[:size].copy(), users, items, dedup,
+                                      None if timestamps is None else timestamps[:size].copy())
+        data._shared_vocabulary = False # the vocabularies are copies owned by this object
+        return data
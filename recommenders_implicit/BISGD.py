@@ -2,12 +2,19 @@ from collections import defaultdict
 import random
 
 from numpy.core.numeric import NaN
-from data import ImplicitData
+from data import ImplicitData, GrowableArray
 import numpy as np
 from .Model import Model
+from .sgd_kernels import UpdateFactors
+from .recommendation_list import RecommendationList
+from .factor_precision import FactorDtype, Products, QuantizedFactors
 
 class BISGD(Model):
-    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, num_nodes: int = 5, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1):
+
+    precision = 'float64' # models pickled before precision was added
+    item_quantized = None
+
+    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, num_nodes: int = 5, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1, precision: str = 'float64'):
         """    Constructor.
 
         Keyword arguments:
@@ -16,8 +23,10 @@ class BISGD(Model):
         num_iterations -- Maximum number of iterations (int, default 10)
         learn_rate -- Learn rate, aka step size (float, default 0.01)
         regularization -- Regularization factor (float, default 0.01)
-        random_seed -- Random seed (int, default 1)"""
+        random_seed -- Random seed (int, default 1)
+        precision -- dtype of the stored factors of every node: 'float64', 'float32' or 'float16' (see ISGD)"""
 
+        FactorDtype(precision) # raises ValueError for an unknown precision
         self.counter=0
         self.data = data
         self.num_factors = num_factors
@@ -27,13 +36,33 @@ class BISGD(Model):
         self.item_regularization = i_regularization
         self.random_seed = random_seed
         self.num_nodes = num_nodes
+        self.precision = precision
         np.random.seed(random_seed)
         self._InitModel()
 
     def _InitModel(self):
-        self.user_factors = [[np.random.Generator.normal(0.0, 0.1, self.num_factors) for _ in range(self.data.maxuserid + 1)] for _ in range(self.num_nodes)]
-        self.item_factors = [[np.random.Generator.normal(0.0, 0.1, self.num_factors) for _ in range(self.data.maxitemid + 1)] for _ in range(self.num_nodes)]
+        # one contiguous factor matrix per node, with capacity doubling as users/items arrive
+        dtype = FactorDtype(self.precision)
+        self.user_factors = [GrowableArray(np.random.normal(0.0, 0.1, (self.data.maxuserid + 1, self.num_factors)), dtype=dtype) for _ in range(self.num_nodes)]
+        self.item_factors = [GrowableArray(np.random.normal(0.0, 0.1, (self.data.maxitemid + 1, self.num_factors)), dtype=dtype) for _ in range(self.num_nodes)]
+        self.item_quantized = None
+
 
+    def _SaveState(self):
+        arrays, state = super()._SaveState()
+        # (num_nodes x users x factors) and (num_nodes x items x factors)
+        arrays['user_factors'] = np.stack([factors.View() for factors in self.user_factors])
+        arrays['item_factors'] = np.stack([factors.View() for factors in self.item_factors])
+        return arrays, state
+
+    def _LoadState(self, arrays: dict, state: dict):
+        super()._LoadState(arrays, state)
+        self.user_factors = [GrowableArray(factors, copy=False) for factors in arrays['user_factors']]
+        self.item_factors = [GrowableArray(factors, copy=False) for factors in arrays['item_factors']]
+        self.item_quantized = None
+
+    def _TrackedArrays(self):
+        return ('user_factors', 'item_factors')
 
     def BatchTrain(self):
         """
@@ -46,23 +75,41 @@ class BISGD(Model):
                 user_id, item_id = self.data.GetTuple(i, True)
                 self._UpdateFactors(user_id, item_id)
 
-    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True):
+    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True, timestamp = None):
         """
         Incrementally updates the model.
 
         Keyword arguments:
         user_id -- The ID of the user
         item_id -- The ID of the item
+        timestamp -- Instant of the interaction, required if the data has timestamps or a time window (default None)
         """
 
-        user_id, item_id = self.data.AddFeedback(user, item)
+        user_id, item_id = self.data.AddFeedback(user, item, timestamp)
+        self._IncrTrain(user_id, item_id)
 
+    def IncrTrainMany(self, users, items, update_users: bool = True, update_items: bool = True, timestamps = None):
+        """
+        Incrementally updates the model with a batch of interactions.
+        IDs are mapped once for the whole batch. Factors of new users/items are drawn per interaction,
+        interleaved with the bootstrap sampling, so results are the same as calling IncrTrain for each interaction.
+
+        Keyword arguments:
+        users -- The IDs of the users
+        items -- The IDs of the items
+        timestamps -- Instants of the interactions, required if the data has timestamps or a time window (default None)
+        """
+        user_ids, item_ids = self.data.AddFeedbackBatch(users, items, timestamps)
+        for user_id, item_id in zip(user_ids.tolist(), item_ids.tolist()):
+            self._IncrTrain(user_id, item_id)
+
+    def _IncrTrain(self, user_id, item_id):
         for node in range(self.num_nodes):
-            if len(self.user_factors[node]) == self.data.maxuserid:
-                self.user_factors[node].append(np.random.normal(0.0, 0.1, self.num_factors))
+            if len(self.user_factors[node]) == user_id:
+                self.user_factors[node].Append(np.random.normal(0.0, 0.1, self.num_factors))
         for node in range(self.num_nodes):
-            if len(self.item_factors[node]) == self.data.maxitemid:
-                self.item_factors[node].append(np.random.normal(0.0, 0.1, self.num_factors))
+            if len(self.item_factors[node]) == item_id:
+                self.item_factors[node].Append(np.random.normal(0.0, 0.1, self.num_factors))
 
 
         for node in range(self.num_nodes):
@@ -74,23 +121,25 @@ class BISGD(Model):
 
 
     def _UpdateFactors(self, user_id, item_id, node, update_users: bool = True, update_items: bool = True, target: int = 1):
-
-        p_u = self.user_factors[node][user_id]
-        q_i = self.item_factors[node][item_id]
-
-        for _ in range(int(self.num_iterations)):
-            err = target - np.inner(p_u, q_i)
-
+        UpdateFactors(self.user_factors[node][user_id], self.item_factors[node][item_id], self.num_iterations, self.learn_rate,
+                      self.user_regularization, self.item_regularization, update_users, update_items, target)
+        if update_items and self.item_quantized is not None:
+            self.item_quantized[node].Touch(item_id)
+        if self.dirty_rows is not None: # rows of the (num_nodes x rows x factors) arrays of _SaveState
             if update_users:
-                delta = self.learn_rate * (err * q_i - self.user_regularization * p_u)
-                p_u += delta
-
+                self.dirty_rows['user_factors'].add(user_id)
             if update_items:
-                delta = self.learn_rate * (err * p_u - self.item_regularization * q_i)
-                q_i += delta
+                self.dirty_rows['item_factors'].add(item_id)
+
+    def BuildQuantizedScoring(self):
+        """
+        Builds an int8 copy of the item factors of each node (see ISGD.BuildQuantizedScoring), used by Recommend and RecommendBatch.
+        """
+        self.item_quantized = [QuantizedFactors(factors) for factors in self.item_factors]
+        return self.item_quantized
 
-        self.user_factors[node][user_id] = p_u
-        self.item_factors[node][item_id] = q_i
+    def DropQuantizedScoring(self):
+        self.item_quantized = None
 
     def Predict(self, user_id, item_id):
         """
@@ -106,53 +155,64 @@ class BISGD(Model):
         return rec / self.num_nodes
 
     def Recommend(self, user, n: int = -1, exclude_known_items: bool = True):
+        """
+        Returns a RecommendationList (internal item indices and average scores, best first), or [] if there is no user.
+        Each node keeps its top n items, excluding known items, and the lists are averaged (an item missing from a node's list counts as 0).
 
-        user_id = self.data.GetUserInternalId(user)
-        if user_id == -1:
-            return []
-        
-        if exclude_known_items:
-            user_items = self.data.GetUserItems(user_id)
-
-        precs = [None for _ in range(self.num_nodes)]
-        for node in range(self.num_nodes):
-            p_u = self.user_factors[node][user_id]
-            scores = np.abs(1 - np.inner(p_u, self.item_factors[node]))
-            recs_node = np.column_stack((self.data.itemset, scores))
-            
-            if exclude_known_items:
-                recs_node = np.delete(recs_node, user_items, 0)
-            
-            if n == -1 or n > len(recs_node) :
-                n = len(recs_node)
-
-            # recs_node = recs_node[np.argsort(recs_node[:, 1], kind = 'heapsort')]
-            # recs_node = recs_node[:n]
-            # No need to sort yet, just partition:
-            recs_node = recs_node[np.argpartition(recs_node[:,1], n-1)[:n]]
-            
-            precs[node] = recs_node
-
-        recs = self._AvgRecs(precs)
-
-        recs = recs[np.argsort(-recs[:, 1].astype(np.float), kind = 'heapsort')]
-
-        if n == -1 or n > len(recs):
-            n = len(recs)
+        Keyword arguments:
+        user -- The ID of the user
+        n -- number of recommendations. default returns all items sorted by score.
+        exclude_known_items -- boolean, exclude known items from recommendation
+        """
+        return self.RecommendBatch([user], n, exclude_known_items)[0]
 
-        return recs[:n]
+    def RecommendBatch(self, users, n: int = -1, exclude_known_items: bool = True, default_user: str = 'none', block_size: int = 1 << 18):
+        """
+        Returns a list with the recommendations (as returned by Recommend) of each user.
+        For blocks of users, each node scores all items with one matrix product and keeps its top n per user (row-wise partition),
+        then the node lists are averaged (an item missing from a node's list counts as 0). Users not present in the model get [].
 
-    def _AvgRecs(self, precs):
-        recs_dict = {}
-        for node in range(self.num_nodes):
-            for pair in precs[node]:
-                if pair[0] in recs_dict:
-                    recs_dict[pair[0]] = recs_dict[pair[0]] + 1 - pair[1].astype(np.float)
+        Keyword arguments:
+        users -- The IDs of the users (iterable)
+        n -- number of recommendations. default returns all items sorted by score.
+        exclude_known_items -- boolean, exclude known items from recommendation
+        default_user -- not used, users not present in the model get no recommendations (as in Recommend)
+        block_size -- number of scores computed at a time (int, default 2^18)
+        """
+        user_ids = np.array([self.data.GetUserInternalId(user) for user in users], dtype=np.int64)
+        num_items = self.data.maxitemid + 1
+        top_n = num_items if n == -1 else min(n, num_items)
+        recs = [[] for _ in range(len(user_ids))]
+        seen = np.flatnonzero(user_ids != -1)
+        rows_per_block = max(1, block_size // max(num_items, 1))
+        for start in range(0, len(seen), rows_per_block):
+            positions = seen[start:start + rows_per_block]
+            block_ids = user_ids[positions]
+            totals = np.zeros((len(positions), num_items))
+            listed = np.zeros((len(positions), num_items), dtype=bool)
+            for node in range(self.num_nodes):
+                queries = self.user_factors[node].View()[block_ids]
+                if self.item_quantized is not None:
+                    scores = np.abs(1 - self.item_quantized[node].Products(queries))
                 else:
-                    recs_dict[pair[0]] = 1 - pair[1].astype(np.float)
-        
-        return np.array([[i, recs_dict[i]/self.num_nodes] for i in recs_dict])
- 
+                    scores = np.abs(1 - Products(self.item_factors[node].View(), queries))
+                if exclude_known_items:
+                    self._MaskKnownItems(scores, block_ids, np.inf)
+                best = self._RowTopN(scores, top_n)
+                best_scores = np.take_along_axis(scores, best, 1)
+                valid = np.isfinite(best_scores)
+                rows = np.broadcast_to(np.arange(len(positions))[:, None], best.shape)[valid]
+                cols, best_scores = best[valid], best_scores[valid]
+                totals[rows, cols] = totals[rows, cols] + 1 - best_scores
+                listed[rows, cols] = True
+            averages = np.where(listed, totals / self.num_nodes, -np.inf)
+            best = self._RowTopN(-averages, top_n)
+            counts = np.minimum(listed.sum(axis=1), top_n)
+            for position, items, count, row in zip(positions.tolist(), best, counts.tolist(), averages):
+                items = items[:count]
+                recs[position] = RecommendationList(items, row[items], self.data.itemset)
+        return recs
+
     def RecommendOld(self, user, n: int = -1, exclude_known_items: bool = True):
 
         user_id = self.data.GetUserInternalId(user)
@@ -165,7 +225,7 @@ class BISGD(Model):
         for node in range(self.num_nodes):
             p_u = self.user_factors[node][user_id]
             
-            recommendation_list[:,node] = np.abs(1 - np.inner(p_u, self.item_factors[node]))
+            recommendation_list[:,node] = np.abs(1 - self.item_factors[node].View() @ p_u)
 
         scores = np.mean(recommendation_list, 1)
         recs = np.column_stack((self.data.itemset, scores))
@@ -1,7 +1,12 @@
-from data import ImplicitData
+from data import ImplicitData, GrowableArray
 import numpy as np
 from .Model import Model
-import time
+from .sgd_kernels import UpdateFactors
+from .instrumentation import PhaseTimer
+from .ivf_index import IVFIndex
+from .recommendation_list import RecommendationList
+from .factor_statistics import FactorStatistics
+from .factor_precision import FactorDtype, Products, QuantizedFactors
 
 class ISGD(Model):
     """
@@ -10,7 +15,7 @@ class ISGD(Model):
     https://link.springer.com/chapter/10.1007/978-3-319-08786-3_41
     """
 
-    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1):
+    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1, precision: str = 'float64'):
         """
         Constructor.
 
@@ -21,7 +26,10 @@ class ISGD(Model):
         learn_rate -- Learn rate, aka step size (float, default 0.01)
         regularization -- Regularization factor (float, default 0.01)
         random_seed -- Random seed (int, default 1)
+        precision -- dtype of the stored factors: 'float64', 'float32' (float32 training, half the memory) or 'float16'
+            (a quarter of the memory, updated in float32). See also BuildQuantizedScoring
         """
+        FactorDtype(precision) # raises ValueError for an unknown precision
         self.data = data
         self.num_factors = num_factors
         self.num_iterations = num_iterations
@@ -29,33 +37,72 @@ class ISGD(Model):
         self.user_regularization = u_regularization
         self.item_regularization = i_regularization
         self.random_seed = random_seed
+        self.precision = precision
         np.random.seed(random_seed)
-        self.train_time_record = {
-            'IncrTrain_0':[],
-            'IncrTrain_1':[],
-            'IncrTrain_2':[],
-            '_UpdateFactors_inner':[],
-            '_UpdateFactors_users':[], 
-            '_UpdateFactors_items':[]            
-        }
-        self.recommend_time_record = {
-            'Recommend_0':[],
-            'Recommend_1':[],
-            'Recommend_2':[],
-            'Recommend_3':[],
-            'Recommend_4':[],
-            'Recommend_5':[]
-            
-        }
+        self._InitTimers()
+        self.item_index = None
+        self.user_statistics = None
+        self.item_quantized = None
         self._InitModel()
-        
+
+    def _InitTimers(self):
+        self.train_timer = PhaseTimer(['IncrTrain_0', 'IncrTrain_1', 'IncrTrain_2'])
+        self.recommend_timer = PhaseTimer(['Recommend_0', 'Recommend_1', 'Recommend_2', 'Recommend_3', 'Recommend_4', 'Recommend_5'])
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'train_timer' not in state: # models pickled with the old train_time_record/recommend_time_record lists
+            self.__dict__.pop('train_time_record', None)
+            self.__dict__.pop('recommend_time_record', None)
+            self._InitTimers()
+        self.__dict__.setdefault('item_index', None)
+        self.__dict__.setdefault('user_statistics', None)
+        self.__dict__.setdefault('precision', 'float64')
+        self.__dict__.setdefault('item_quantized', None)
+
+    def SetInstrumentation(self, enabled: bool = True, reset: bool = False):
+        """
+        Turns the timing of the IncrTrain and Recommend phases on or off (off by default).
+        Timings are aggregated per phase, see train_timer.Summary() and recommend_timer.Summary().
+
+        Keyword arguments:
+        enabled -- boolean, whether phases are timed
+        reset -- boolean, clear the timings collected so far
+        """
+        for timer in (self.train_timer, self.recommend_timer):
+            timer.enabled = enabled
+            if reset:
+                timer.Reset()
+
+    @property
+    def train_time_record(self):
+        """
+        Former per-call timing lists of IncrTrain, kept for compatibility: dict phase -> aggregates, as train_timer.Summary().
+        Empty aggregates unless timing is on (SetInstrumentation).
+        """
+        return self.train_timer.Summary()
+
+    @property
+    def recommend_time_record(self):
+        """
+        Former per-call timing lists of Recommend, kept for compatibility: dict phase -> aggregates, as recommend_timer.Summary().
+        """
+        return self.recommend_timer.Summary()
+
 
     def _InitModel(self):
         self.ResetModel()
 
     def ResetModel(self):
-        self.user_factors = [np.random.normal(0.0, 0.1, self.num_factors) for _ in range(self.data.maxuserid + 1)]
-        self.item_factors = [np.random.normal(0.0, 0.1, self.num_factors) for _ in range(self.data.maxitemid + 1)]
+        # contiguous (num_users x num_factors) and (num_items x num_factors) matrices, with capacity doubling as users/items arrive
+        # a single draw per matrix gives the same values as one draw per user/item
+        # factors are drawn in float64 and stored in the dtype of the precision (rows appended later are cast the same way)
+        dtype = FactorDtype(self.precision)
+        self.user_factors = GrowableArray(np.random.normal(0.0, 0.1, (self.data.maxuserid + 1, self.num_factors)), dtype=dtype)
+        self.item_factors = GrowableArray(np.random.normal(0.0, 0.1, (self.data.maxitemid + 1, self.num_factors)), dtype=dtype)
+        self.item_index = None # built over the previous item factors
+        self.user_statistics = None # idem, rebuilt on first use
+        self.item_quantized = None # idem
 
     def BatchTrain(self):
         """
@@ -68,61 +115,142 @@ class ISGD(Model):
                 user_id, item_id = self.data.GetTuple(i, True)
                 self._UpdateFactors(user_id, item_id)
 
-    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True, n_times: int = 1):
+    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True, n_times: int = 1, timestamp = None):
         """
         Incrementally updates the model.
 
         Keyword arguments:
         user_id -- The ID of the user
         item_id -- The ID of the item
+        timestamp -- Instant of the interaction, required if the data has timestamps or a time window (default None)
         """
-        # IncrTrain_0
-        s = time.time()
-        user_id, item_id = self.data.AddFeedback(user, item)
-        f = time.time()
-        self.train_time_record['IncrTrain_0'].append(np.round(f-s,3))
-        # IncrTrain_1
-        s = time.time()
+        timer = self.train_timer
+        t = timer.Start()
+        user_id, item_id = self.data.AddFeedback(user, item, timestamp)
+        t = timer.Lap('IncrTrain_0', t)
         if len(self.user_factors) == self.data.maxuserid:
-            self.user_factors.append(np.random.normal(0.0, 0.1, self.num_factors))
+            self.user_factors.Append(np.random.normal(0.0, 0.1, self.num_factors))
         if len(self.item_factors) == self.data.maxitemid:
-            self.item_factors.append(np.random.normal(0.0, 0.1, self.num_factors))
-        f = time.time()
-        self.train_time_record['IncrTrain_1'].append(np.round(f-s,3))
-        # IncrTrain_2
-        s = time.time()
+            self.item_factors.Append(np.random.normal(0.0, 0.1, self.num_factors))
+        t = timer.Lap('IncrTrain_1', t)
         if update_users or update_items:
             for _ in range(n_times):
                 self._UpdateFactors(user_id, item_id, update_users, update_items)
-        f = time.time()
-        self.train_time_record['IncrTrain_2'].append(np.round(f-s,3))        
+        timer.Lap('IncrTrain_2', t)
         
+    def IncrTrainMany(self, users, items, update_users: bool = True, update_items: bool = True, n_times: int = 1, timestamps = None):
+        """
+        Incrementally updates the model with a batch of interactions.
+        IDs are mapped and factors of new users/items are created once for the whole batch,
+        SGD updates are applied in stream order (same results as calling IncrTrain for each interaction).
+
+        Keyword arguments:
+        users -- The IDs of the users
+        items -- The IDs of the items
+        timestamps -- Instants of the interactions, required if the data has timestamps or a time window (default None)
+        """
+        user_ids, item_ids = self.data.AddFeedbackBatch(users, items, timestamps)
+        self._GrowFactorsBatch(user_ids, item_ids)
+        if update_users or update_items:
+            for user_id, item_id in zip(user_ids.tolist(), item_ids.tolist()):
+                for _ in range(n_times):
+                    self._UpdateFactors(user_id, item_id, update_users, update_items)
+
+    def _GrowFactorsBatch(self, user_ids, item_ids):
+        """
+        Creates the factors of the users and items that are new in a batch with a single draw.
+        Random values are assigned in the order IncrTrain would draw them (per interaction, user before item).
+        Returns boolean masks flagging the interactions that introduced a new user / a new item.
+        """
+        # ids of new users/items are assigned in order of first appearance, so an interaction brings a new
+        # user iff its id is above every id seen before it
+        prev_users = np.maximum.accumulate(np.concatenate(([len(self.user_factors) - 1], user_ids)))[:-1]
+        prev_items = np.maximum.accumulate(np.concatenate(([len(self.item_factors) - 1], item_ids)))[:-1]
+        new_users = user_ids > prev_users
+        new_items = item_ids > prev_items
+        draws = np.zeros(2 * len(user_ids), dtype=bool)
+        draws[0::2] = new_users
+        draws[1::2] = new_items
+        if draws.any():
+            factors = np.random.normal(0.0, 0.1, (draws.sum(), self.num_factors))
+            position = np.cumsum(draws) - 1
+            self.user_factors.Extend(factors[position[0::2][new_users]])
+            self.item_factors.Extend(factors[position[1::2][new_items]])
+        return new_users, new_items
+
     def _UpdateFactors(self, user_id, item_id, update_users: bool = True, update_items: bool = True, target: int = 1):
         p_u = self.user_factors[user_id]
-        q_i = self.item_factors[item_id]
-        for _ in range(int(self.num_iterations)):
-            #_UpdateFactors_inner
-            s = time.time()
-            err = target - np.inner(p_u, q_i)
-            f = time.time()
-            self.train_time_record['_UpdateFactors_inner'].append(np.round(f-s,3))
-            # _UpdateFactors_users
-            s = time.time()
+        statistics = self.user_statistics
+        if update_users and statistics is not None and user_id < statistics.count:
+            old_p_u = p_u.copy()
+        else:
+            statistics = None # rows not counted yet are read when statistics are next queried
+        # compiled kernel (see sgd_kernels), updates the factor rows in place
+        UpdateFactors(p_u, self.item_factors[item_id], self.num_iterations, self.learn_rate,
+                      self.user_regularization, self.item_regularization, update_users, update_items, target)
+        if statistics is not None:
+            statistics.Update(old_p_u, p_u)
+        if update_items and self.item_index is not None:
+            self.item_index.Touch(item_id)
+        if update_items and self.item_quantized is not None:
+            self.item_quantized.Touch(item_id)
+        if self.dirty_rows is not None:
             if update_users:
-                delta = self.learn_rate * (err * q_i - self.user_regularization * p_u)
-                p_u += delta
-            f = time.time()
-            self.train_time_record['_UpdateFactors_users'].append(np.round(f-s,3))
-            # _UpdateFactors_items
-            s = time.time()
+                self.dirty_rows['user_factors'].add(user_id)
             if update_items:
-                delta = self.learn_rate * (err * p_u - self.item_regularization * q_i)
-                q_i += delta
-            f = time.time()
-            self.train_time_record['_UpdateFactors_items'].append(np.round(f-s,3))
-            
-        self.user_factors[user_id] = p_u
-        self.item_factors[item_id] = q_i
+                self.dirty_rows['item_factors'].add(item_id)
+
+    def BuildItemIndex(self, num_lists: int = None, num_probes: int = 8, **kwargs):
+        """
+        Builds an approximate retrieval index over the item factors (see IVFIndex), kept up to date as the model is trained.
+        From then on, Recommend with n != -1 only scores the items of the num_probes cells closest to the user.
+
+        Keyword arguments:
+        num_lists -- number of cells (int, default sqrt(number of items))
+        num_probes -- number of cells scanned per recommendation (int, default 8)
+        kwargs -- other IVFIndex parameters
+        """
+        self.item_index = IVFIndex(self.item_factors, num_lists, num_probes, **kwargs)
+        return self.item_index
+
+    def DropItemIndex(self):
+        self.item_index = None
+
+    def BuildQuantizedScoring(self):
+        """
+        Builds an int8 copy of the item factors with one scale per item (see QuantizedFactors), kept up to date as the model is trained.
+        From then on, Recommend and RecommendBatch score all items from the int8 copy: a quarter of the bytes read for float32
+        factors, an eighth for float64, for approximate scores. The factors themselves, and training, are unchanged.
+        """
+        self.item_quantized = QuantizedFactors(self.item_factors)
+        return self.item_quantized
+
+    def DropQuantizedScoring(self):
+        self.item_quantized = None
+
+    def _ItemProducts(self, queries):
+        # inner products of one user vector (or a block of them) with every item, from the int8 copy if there is one
+        if self.item_quantized is not None:
+            return self.item_quantized.Products(queries)
+        return Products(self.item_factors.View(), queries)
+
+    def ItemIndexRecall(self, users, n: int = 10, exclude_known_items: bool = True):
+        """
+        Mean recall of the approximate top-n (item index) against the exact top-n, over a list of users.
+
+        Keyword arguments:
+        users -- The IDs of the users
+        n -- number of recommendations
+        exclude_known_items -- boolean, exclude known items from recommendation
+        """
+        recalls = []
+        for user in users:
+            exact = self.Recommend(user, n, exclude_known_items, use_index=False)
+            if len(exact) == 0:
+                continue
+            approximate = self.Recommend(user, n, exclude_known_items)
+            recalls.append(len(np.intersect1d(exact[:,0], approximate[:,0])) / len(exact))
+        return float(np.mean(recalls)) if recalls else 1.0
 
     def Predict(self, user_id, item_id):
         """
@@ -135,73 +263,145 @@ class ISGD(Model):
         return np.inner(self.user_factors[user_id], self.item_factors[item_id])
 
 
-    def Recommend(self, user, n: int = -1, exclude_known_items: bool = True, candidates: set = {}, default_user: str = 'none'):
+    def Recommend(self, user, n: int = -1, exclude_known_items: bool = True, candidates: set = {}, default_user: str = 'none', use_index: bool = True):
         """
-        Returns an list of tuples in the form (item_id, score), ordered by score.
+        Returns a RecommendationList (internal item indices and scores, ordered by score), or [] if there is no user.
+        recs[:, 0] gives the external item IDs and recs[:, 1] the scores, as in a list of (item_id, score) tuples.
 
         Keyword arguments:
         user_id -- The ID of the user
         item_id -- The ID of the item
         n -- number of recommendations. default returns all items sorted by score.
         exclude_known_items -- boolean, exclude known items from recommendation
-        candidates -- dictionary, ?
-        default_user -- str. One of: random, average, or median. If user is not present in model (new user) user factors are generated.
+        candidates -- set of external item IDs. If not empty, only these items are recommended
+        default_user -- str. One of: none, random, average, or median. If user is not present in model (new user) user factors are generated.
+            average and median come from FactorStatistics (running mean, approximate median), kept up to date as the model is trained.
+        use_index -- boolean, use the item index (see BuildItemIndex) if there is one and n != -1
         """
         recs = []
-        # Recommend_0
-        s = time.time()
+        timer = self.recommend_timer
+        t = timer.Start()
         user_id = self.data.GetUserInternalId(user)
-        f = time.time()
-        self.recommend_time_record['Recommend_0'].append(np.round(f-s,3))
+        timer.Lap('Recommend_0', t)
 
         if user_id == -1:
             if default_user == 'random':
                 p_u = np.random.normal(0.0, 0.1, self.num_factors)
-            if default_user == 'average':
-                p_u = np.mean(self.user_factors, axis=0)
-            if default_user == 'median':
-                p_u = np.median(self.user_factors, axis=0)
+            elif default_user == 'average':
+                p_u = self._UserStatistics().Mean()
+            elif default_user == 'median':
+                p_u = self._UserStatistics().Median()
             else: # none
                 return []
         else:
             p_u = self.user_factors[user_id]
-        # Recommend_1
-        s = time.time()
-        scores = np.abs(1 - np.inner(p_u, self.item_factors))
-        f = time.time()
-        self.recommend_time_record['Recommend_1'].append(np.round(f-s,3))        
-        # Recommend_2
-        s = time.time()
-        recs = np.column_stack((self.data.itemset, scores))
-        f = time.time()
-        self.recommend_time_record['Recommend_2'].append(np.round(f-s,3))
-        # Recommend_3
-        s = time.time()
+        if use_index and self.item_index is not None and n != -1 and not len(candidates):
+            t = timer.Start()
+            recs = self._RecommendIndexed(p_u, user_id, n, exclude_known_items)
+            timer.Lap('Recommend_1', t)
+            return recs
+        t = timer.Start()
+        scores = np.abs(1 - self._ItemProducts(p_u)) # matrix-vector product over the stored factors, no copy
+        t = timer.Lap('Recommend_1', t)
+        # excluded items get an infinite score (lower is better) in place, instead of being deleted from a copy
+        num_valid = len(scores)
         if exclude_known_items and user_id != -1:
             user_items = self.data.GetUserItems(user_id)
-            recs = np.delete(recs, user_items, 0)        
-        f = time.time()
-        self.recommend_time_record['Recommend_3'].append(np.round(f-s,3))
-        
+            if len(user_items):
+                scores[user_items] = np.inf
+                num_valid -= len(np.unique(user_items))
+        t = timer.Lap('Recommend_2', t)
         if len(candidates):
-            # TODO: testar código
-            candidates_internal = self.data.GetItemInternalIds(candidates)
-            condition = np.isin(recs[:,0].astype(int), candidates_internal)
-            recs = recs[condition]
-        
-        # Recommend_4
-        s = time.time()
-        if n == -1 or n > len(recs) :
-            n = len(recs)
+            excluded = np.ones(len(scores), dtype=bool)
+            excluded[self.data.GetItemInternalIds(candidates)] = False
+            scores[excluded] = np.inf
+            num_valid = np.count_nonzero(scores != np.inf)
+        timer.Lap('Recommend_3', t)
+
+        t = timer.Start()
+        if n == -1 or n > num_valid:
+            n = num_valid
+        if n < len(scores):
+            best = np.argpartition(scores, n-1)[:n] if n > 0 else np.empty(0, dtype=np.int64)
         else:
-            recs = recs[np.argpartition(recs[:,1], n-1)[:n]]
-        f = time.time()
-        self.recommend_time_record['Recommend_4'].append(np.round(f-s,3))
-        
-        # Recommend_5
-        s = time.time()
-        recs = recs[np.argsort(recs[:,1])]
-        f = time.time()
-        self.recommend_time_record['Recommend_5'].append(np.round(f-s,3))
+            best = np.arange(len(scores))
+        t = timer.Lap('Recommend_4', t)
+        best = best[np.argsort(scores[best])]
+        recs = RecommendationList(best, scores[best], self.data.itemset)
+        timer.Lap('Recommend_5', t)
 
         return recs
+
+    def RecommendBatch(self, users, n: int = -1, exclude_known_items: bool = True, default_user: str = 'none', block_size: int = 1 << 18):
+        """
+        Returns a list with the recommendations (as returned by Recommend) of each user.
+        Scores are computed for blocks of users with one matrix product (about block_size scores per block),
+        known items are masked and each row is partitioned, instead of one matrix-vector product per user.
+        The item index is not used. Users not present in the model go through Recommend (default_user).
+
+        Keyword arguments:
+        users -- The IDs of the users (iterable)
+        n -- number of recommendations. default returns all items sorted by score.
+        exclude_known_items -- boolean, exclude known items from recommendation
+        default_user -- str. One of: random, average, or median. If user is not present in model (new user) user factors are generated.
+        block_size -- number of scores computed at a time (int, default 2^18)
+        """
+        users = list(users)
+        user_ids = np.array([self.data.GetUserInternalId(user) for user in users], dtype=np.int64)
+        num_items = len(self.item_factors)
+        top_n = num_items if n == -1 else min(n, num_items)
+        recs = [None] * len(users)
+        seen = np.flatnonzero(user_ids != -1)
+        rows_per_block = max(1, block_size // max(num_items, 1))
+        for start in range(0, len(seen), rows_per_block):
+            positions = seen[start:start + rows_per_block]
+            block_ids = user_ids[positions]
+            scores = np.abs(1 - self._ItemProducts(self.user_factors.View()[block_ids]))
+            counts = np.full(len(positions), top_n)
+            if exclude_known_items:
+                # known items get an infinite score, i.e. are ranked last and cut below
+                counts = np.minimum(counts, num_items - self._MaskKnownItems(scores, block_ids, np.inf))
+            best = self._RowTopN(scores, top_n)
+            best_scores = np.take_along_axis(scores, best, 1)
+            for position, items, item_scores, count in zip(positions.tolist(), best, best_scores, counts.tolist()):
+                recs[position] = RecommendationList(items[:count], item_scores[:count], self.data.itemset)
+        for position in np.flatnonzero(user_ids == -1).tolist():
+            recs[position] = self.Recommend(users[position], n, exclude_known_items, default_user=default_user, use_index=False)
+        return recs
+
+    def _SaveState(self):
+        arrays, state = super()._SaveState()
+        arrays['user_factors'] = self.user_factors.View()
+        arrays['item_factors'] = self.item_factors.View()
+        return arrays, state
+
+    def _LoadState(self, arrays: dict, state: dict):
+        super()._LoadState(arrays, state)
+        self.user_factors = GrowableArray(arrays['user_factors'], copy=False)
+        self.item_factors = GrowableArray(arrays['item_factors'], copy=False)
+        self._InitTimers()
+        self.item_index = None
+        self.user_statistics = None
+        self.item_quantized = None
+
+    def _TrackedArrays(self):
+        return ('user_factors', 'item_factors')
+
+    def _UserStatistics(self):
+        # running mean / median sketch of the user factors, built on first use and then kept up to date by _UpdateFactors
+        if self.user_statistics is None:
+            self.user_statistics = FactorStatistics(self.user_factors)
+        return self.user_statistics
+
+    def _RecommendIndexed(self, p_u, user_id, n, exclude_known_items):
+        # exact scores over the candidates of the item index only
+        user_items = self.data.GetUserItems(user_id) if exclude_known_items and user_id != -1 else []
+        item_ids = self.item_index.Candidates(p_u, n + len(user_items))
+        if len(user_items):
+            item_ids = item_ids[~np.isin(item_ids, user_items)]
+        scores = np.abs(1 - Products(self.item_factors.View()[item_ids], p_u))
+        if n < len(item_ids):
+            best = np.argpartition(scores, n-1)[:n]
+            item_ids, scores = item_ids[best], scores[best]
+        order = np.argsort(scores)
+        return RecommendationList(item_ids[order], scores[order], self.data.itemset)
@@ -1,13 +1,13 @@
-from numba import njit
 from collections import defaultdict
 import random
 from data import ImplicitData
 import numpy as np
 from .BISGD import BISGD
 from .ISGD import ISGD
+from .sgd_kernels import UpdateFactors
 
 class LocalUBISGD(BISGD):
-    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, num_nodes: int = 8, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1):
+    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, num_nodes: int = 8, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1, precision: str = 'float64'):
         """    Constructor.
 
         Keyword arguments:
@@ -17,9 +17,10 @@ class LocalUBISGD(BISGD):
         num_nodes -- Number of 'weak' learners (int, default 8)
         learn_rate -- Learn rate, aka step size (float, default 0.01)
         regularization -- Regularization factor (float, default 0.01)
-        random_seed -- Random seed (int, default 1)"""
+        random_seed -- Random seed (int, default 1)
+        precision -- dtype of the stored factors: 'float64', 'float32' or 'float16' (see ISGD)"""
 
-        super().__init__(data, num_factors, num_iterations, num_nodes, learn_rate, u_regularization, i_regularization, random_seed)
+        super().__init__(data, num_factors, num_iterations, num_nodes, learn_rate, u_regularization, i_regularization, random_seed, precision)
 
     def _InitModel(self):
         super()._InitModel()
@@ -28,27 +29,44 @@ class LocalUBISGD(BISGD):
         self.metamodel_items = [np.abs(np.random.normal(0.0, 0.1, self.num_nodes)) for _ in range(self.data.maxuserid + 1)]
 
 
-    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True):
+    def _SaveState(self):
+        arrays, state = super()._SaveState()
+        arrays['metamodel_users'] = np.array(self.metamodel_users).reshape(-1, self.num_nodes)
+        arrays['metamodel_items'] = np.array(self.metamodel_items).reshape(-1, self.num_nodes)
+        return arrays, state
+
+    def _LoadState(self, arrays: dict, state: dict):
+        super()._LoadState(arrays, state)
+        self.metamodel_users = list(arrays['metamodel_users'])
+        self.metamodel_items = list(arrays['metamodel_items'])
+
+    def _TrackedArrays(self):
+        return super()._TrackedArrays() + ('metamodel_users', 'metamodel_items')
+
+    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True, timestamp = None):
         """
         Incrementally updates the model.
 
         Keyword arguments:
         user_id -- The ID of the user
         item_id -- The ID of the item
+        timestamp -- Instant of the interaction, required if the data has timestamps or a time window (default None)
         """
 
-        user_id, item_id = self.data.AddFeedback(user, item)
+        user_id, item_id = self.data.AddFeedback(user, item, timestamp)
 
         #self.metamodel.IncrTrain(user, item)
+        self._IncrTrain(user_id, item_id)
 
-        if len(self.user_factors[0]) == self.data.maxuserid:
+    def _IncrTrain(self, user_id, item_id):
+        if len(self.user_factors[0]) == user_id:
             self.metamodel_users.append(np.abs(np.random.normal(0.0, 0.1, self.num_nodes)))
             for node in range(self.num_nodes):
-                self.user_factors[node].append(np.random.normal(0.0, 0.1, self.num_factors))
-        if len(self.item_factors[0]) == self.data.maxitemid:
+                self.user_factors[node].Append(np.random.normal(0.0, 0.1, self.num_factors))
+        if len(self.item_factors[0]) == item_id:
             self.metamodel_items.append(np.abs(np.random.normal(0.0, 0.1, self.num_nodes)))
             for node in range(self.num_nodes):
-                self.item_factors[node].append(np.random.normal(0.0, 0.1, self.num_factors))
+                self.item_factors[node].Append(np.random.normal(0.0, 0.1, self.num_factors))
         
         self._UpdateFactorsMeta(user_id, item_id)
         user_vector = self.metamodel_users[user_id]
@@ -57,21 +75,12 @@ class LocalUBISGD(BISGD):
             self._UpdateFactors(user_id, item_id, node)
 
     def _UpdateFactorsMeta(self, user_id, item_id, update_users: bool = True, update_items: bool = True, target: int = 1):
-        p_u = self.metamodel_users[user_id]
-        q_i = self.metamodel_items[item_id]
-        for _ in range(int(self.num_iterations)):
-            err = target - np.inner(p_u, q_i)
-
+        # same SGD step as the nodes, with the metamodel weights kept non-negative
+        UpdateFactors(self.metamodel_users[user_id], self.metamodel_items[item_id], self.num_iterations, self.learn_rate,
+                      self.user_regularization, self.item_regularization, update_users, update_items, target, nonnegative=True)
+        if self.dirty_rows is not None:
             if update_users:
-                delta = self.learn_rate * (err * q_i - self.user_regularization * p_u)
-                p_u += delta
-                p_u[p_u<0] = 0.0
-
+                self.dirty_rows['metamodel_users'].add(user_id)
             if update_items:
-                delta = self.learn_rate * (err * p_u - self.item_regularization * q_i)
-                q_i += delta
-                q_i[q_i<0] = 0.0
-
-        self.metamodel_users[user_id] = p_u
-        self.metamodel_items[item_id] = q_i
+                self.dirty_rows['metamodel_items'].add(item_id)
 
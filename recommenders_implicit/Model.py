@@ -1,6 +1,14 @@
 
+import importlib
+import json
+import os
+import numpy as np
+from data import ImplicitData
+
 class Model:
 
+    dirty_rows = None # name -> set of changed rows, while TrackDirtyRows is on
+
     def __init__(self):
         pass
 
@@ -10,16 +18,34 @@ class Model:
         """
         pass
 
-    def IncrTrain(self, user_id, item_id, update_users: bool = True, update_items: bool = True):
+    def IncrTrain(self, user_id, item_id, update_users: bool = True, update_items: bool = True, timestamp = None):
         """
         Incrementally updates the model.
 
         Keyword arguments:
         user_id -- The ID of the user
         item_id -- The ID of the item
+        timestamp -- Instant of the interaction, required if the data has timestamps or a time window (default None)
         """
         pass
 
+    def IncrTrainMany(self, users, items, timestamps = None):
+        """
+        Incrementally updates the model with a batch of interactions, in stream order.
+        Results are the same as calling IncrTrain for each interaction.
+
+        Keyword arguments:
+        users -- The IDs of the users (iterable)
+        items -- The IDs of the items (iterable, same length as users)
+        timestamps -- Instants of the interactions, required if the data has timestamps or a time window (iterable, default None)
+        """
+        if timestamps is None:
+            for user, item in zip(users, items):
+                self.IncrTrain(user, item)
+        else:
+            for user, item, timestamp in zip(users, items, timestamps):
+                self.IncrTrain(user, item, timestamp=timestamp)
+
     def Predict(self, user_id, item_id):
         """
         Return the prediction (float) of the user-item interaction score.
@@ -39,3 +65,118 @@ class Model:
         item_id -- The ID of the item
         """
         pass
+
+    def Save(self, path: str):
+        """
+        Saves the model to a directory: its data (ImplicitData.Save), one .npy file per array (factors, matrices, ...)
+        and a meta.json with the class and the other attributes. Load opens the arrays with a memory map.
+        Derived state (timing records, item index, default user statistics) is not saved and is rebuilt after loading.
+
+        Keyword arguments:
+        path -- directory (created if needed)
+        """
+        os.makedirs(path, exist_ok=True)
+        self.data.Save(os.path.join(path, 'data'))
+        arrays, state = self._SaveState()
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), np.asarray(array))
+        meta = {'format': 'Model', 'version': 1, 'module': type(self).__module__, 'class': type(self).__name__, 'arrays': sorted(arrays), 'state': state}
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def Load(cls, path: str, mmap: bool = True):
+        """
+        Opens a model saved with Save, as an instance of the class that saved it.
+
+        Keyword arguments:
+        path -- directory written by Save
+        mmap -- if True, arrays are memory-mapped copy-on-write (mmap_mode='c'): nothing is read up front
+            and training the loaded model changes its memory, never the files
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        model_class = getattr(importlib.import_module(meta['module']), meta['class'])
+        if not issubclass(model_class, cls):
+            raise TypeError(f"{path} holds a {meta['class']} model, not a {cls.__name__}")
+        model = model_class.__new__(model_class)
+        model.data = ImplicitData.Load(os.path.join(path, 'data'), mmap)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='c' if mmap else None) for name in meta['arrays']}
+        model._LoadState(arrays, meta['state'])
+        return model
+
+    def _SaveState(self):
+        """
+        Returns (arrays, state): the arrays saved as .npy files (name -> array) and the attributes saved in meta.json.
+        By default, every attribute that is a number, a string, a boolean or None goes to meta.json.
+        """
+        state = {}
+        for name, value in self.__dict__.items():
+            if isinstance(value, np.generic):
+                value = value.item()
+            if value is None or isinstance(value, (bool, int, float, str)):
+                state[name] = value
+        return {}, state
+
+    def _LoadState(self, arrays: dict, state: dict):
+        """
+        Restores the attributes returned by _SaveState (data is already loaded).
+        """
+        self.__dict__.update(state)
+
+    def _TrackedArrays(self):
+        """
+        Returns the names of the arrays of _SaveState whose changed rows (along axis -2) are recorded in dirty_rows
+        while TrackDirtyRows is on. Empty if the model does not track its rows.
+        """
+        return ()
+
+    def TrackDirtyRows(self, enabled: bool = True):
+        """
+        Starts recording, in dirty_rows, which rows of the arrays of _TrackedArrays are changed by training
+        (used by DeltaCheckpoints). Calling it again clears the rows recorded so far.
+
+        Keyword arguments:
+        enabled -- boolean, False stops recording
+        """
+        self.dirty_rows = {name: set() for name in self._TrackedArrays()} if enabled else None
+
+    def RecommendBatch(self, users, n: int = -1, exclude_known_items: bool = True, default_user: str = 'none'):
+        """
+        Returns a list with the recommendations (as returned by Recommend) of each user.
+
+        Keyword arguments:
+        users -- The IDs of the users (iterable)
+        n -- number of recommendations. default returns all items sorted by score.
+        exclude_known_items -- boolean, exclude known items from recommendation
+        default_user -- str. Used for users not present in the model, as in Recommend.
+        """
+        return [self.Recommend(user, n=n, exclude_known_items=exclude_known_items, default_user=default_user) for user in users]
+
+    def _MaskKnownItems(self, scores, user_ids, value: float):
+        """
+        Sets the scores of the items known by each user to value, in a (users x items) block.
+        Returns the number of distinct known items of each user.
+        """
+        rows = [self.data.GetUserItems(user_id) for user_id in user_ids]
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        if not lengths.sum():
+            return lengths
+        row_index = np.repeat(np.arange(len(rows)), lengths)
+        col_index = np.concatenate(rows).astype(np.int64)
+        scores[row_index, col_index] = value
+        # the same item may appear more than once in a user's row
+        distinct = np.unique(row_index * scores.shape[1] + col_index) // scores.shape[1]
+        return np.bincount(distinct, minlength=len(rows))
+
+    @staticmethod
+    def _RowTopN(scores, n: int):
+        """
+        Returns, for each row of a (users x items) block, the columns of its n lowest scores, sorted by score.
+        """
+        if n < scores.shape[1]:
+            best = np.argpartition(scores, n-1, axis=1)[:, :n]
+        else:
+            best = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        order = np.argsort(np.take_along_axis(scores, best, 1), axis=1)
+        return np.take_along_axis(best, order, 1)
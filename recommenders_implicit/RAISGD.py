@@ -1,8 +1,8 @@
 import random
+from collections import OrderedDict
 from data import ImplicitData
 from .ISGD import ISGD
 import numpy as np
-import time
 
 class RAISGD(ISGD):
     """
@@ -10,39 +10,61 @@ class RAISGD(ISGD):
     Vinagre, J., Jorge, A. M., & Gama, J. (2015, April). Collaborative filtering with recency-based negative feedback. In Proceedings of the 30th Annual ACM Symposium on Applied Computing (pp. 963-965).
     https://dl.acm.org/doi/abs/10.1145/2695664.2695998
     """
-    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, learn_rate: float = 0.01, u_regularization: float = 0.1,    i_regularization: float = 0.1, random_seed: int = 1, ra_length: int = 1):
-        super().__init__(data, num_factors, num_iterations, learn_rate, u_regularization, i_regularization, random_seed)
+    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, learn_rate: float = 0.01, u_regularization: float = 0.1,    i_regularization: float = 0.1, random_seed: int = 1, ra_length: int = 1, precision: str = 'float64'):
+        super().__init__(data, num_factors, num_iterations, learn_rate, u_regularization, i_regularization, random_seed, precision)
         self.ra_length = ra_length
 
     def _InitModel(self):
         super()._InitModel()
-        self.itemqueue = list(self.data.itemset)
-
-    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True):
-        # IncrTrain_0
-        s = time.time()
-        user_id, item_id = self.data.AddFeedback(user, item)
-        f = time.time()
-        self.train_time_record['IncrTrain_0'].append(np.round(f-s,3))
-        # IncrTrain_1
-        s = time.time()
+        # internal item ids from the least to the most recently seen. The keys of an OrderedDict keep their order
+        # and are removed, popped from the front or appended in O(1), where a list needed O(items) for remove and pop(0)
+        self.itemqueue = OrderedDict.fromkeys(range(self.data.maxitemid + 1))
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if isinstance(self.itemqueue, list): # models pickled with the queue as a list
+            self.itemqueue = OrderedDict.fromkeys(self.itemqueue)
+
+    def _SaveState(self):
+        arrays, state = super()._SaveState()
+        arrays['itemqueue'] = np.fromiter(self.itemqueue, dtype=np.int64, count=len(self.itemqueue))
+        return arrays, state
+
+    def _LoadState(self, arrays: dict, state: dict):
+        super()._LoadState(arrays, state)
+        self.itemqueue = OrderedDict.fromkeys(arrays['itemqueue'].tolist())
+
+    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True, timestamp = None):
+        timer = self.train_timer
+        t = timer.Start()
+        user_id, item_id = self.data.AddFeedback(user, item, timestamp)
+        t = timer.Lap('IncrTrain_0', t)
         if len(self.user_factors) == self.data.maxuserid:
-            self.user_factors.append(np.random.normal(0.0, 0.1, self.num_factors))
+            self.user_factors.Append(np.random.normal(0.0, 0.1, self.num_factors))
         if len(self.item_factors) == self.data.maxitemid:
-            self.item_factors.append(np.random.normal(0.0, 0.1, self.num_factors))
+            self.item_factors.Append(np.random.normal(0.0, 0.1, self.num_factors))
         else:
-            self.itemqueue.remove(item_id)
-        f = time.time()
-        self.train_time_record['IncrTrain_1'].append(np.round(f-s,3))
-        # IncrTrain_2
-        s = time.time()
-        if len(self.itemqueue):
+            del self.itemqueue[item_id]
+        t = timer.Lap('IncrTrain_1', t)
+        self._UpdateRecency(user_id, item_id)
+        timer.Lap('IncrTrain_2', t)
+
+    def IncrTrainMany(self, users, items, update_users: bool = True, update_items: bool = True, timestamps = None):
+        user_ids, item_ids = self.data.AddFeedbackBatch(users, items, timestamps)
+        _, new_items = self._GrowFactorsBatch(user_ids, item_ids)
+        for user_id, item_id, new_item in zip(user_ids.tolist(), item_ids.tolist(), new_items.tolist()):
+            if not new_item:
+                del self.itemqueue[item_id]
+            self._UpdateRecency(user_id, item_id)
+
+    def _UpdateRecency(self, user_id, item_id):
+        # negative feedback on the least recently seen items, then positive feedback on item_id, which becomes the most recent
+        itemqueue = self.itemqueue
+        if len(itemqueue):
             for _ in range(self.ra_length):
-                last = self.itemqueue.pop(0)
+                last = itemqueue.popitem(last=False)[0]
                 self._UpdateFactors(user_id, last, True, False, 0)
-                self.itemqueue.append(last)
+                itemqueue[last] = None
 
         self._UpdateFactors(user_id, item_id)
-        self.itemqueue.append(item_id)
-        f = time.time()
-        self.train_time_record['IncrTrain_2'].append(np.round(f-s,3))
\ No newline at end of file
+        itemqueue[item_id] = None
\ No newline at end of file
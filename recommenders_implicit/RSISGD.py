@@ -1,42 +1,60 @@
 import random
 from data import ImplicitData
+from .Model import Model
 from .ISGD import ISGD
 import numpy as np
-import time
 
 class RSISGD(ISGD):
     """
     ISGD with random negative sampling
     """
-    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1, ra_length: int = 1):
-        super().__init__(data, num_factors, num_iterations, learn_rate, u_regularization, i_regularization, random_seed)
+    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1, ra_length: int = 1, precision: str = 'float64'):
+        super().__init__(data, num_factors, num_iterations, learn_rate, u_regularization, i_regularization, random_seed, precision)
         self.ra_length = ra_length
 
-    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True):
-        # IncrTrain_0
-        s = time.time()
-        user_id, item_id = self.data.AddFeedback(user, item)
-        f = time.time()
-        self.train_time_record['IncrTrain_0'].append(np.round(f-s,3))
-        # IncrTrain_1
-        s = time.time()
+    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True, timestamp = None):
+        timer = self.train_timer
+        t = timer.Start()
+        user_id, item_id = self.data.AddFeedback(user, item, timestamp)
+        t = timer.Lap('IncrTrain_0', t)
         if len(self.user_factors) == self.data.maxuserid:
-            self.user_factors.append(np.random.normal(0.0, 0.1, self.num_factors))
+            self.user_factors.Append(np.random.normal(0.0, 0.1, self.num_factors))
         if len(self.item_factors) == self.data.maxitemid:
-            self.item_factors.append(np.random.normal(0.0, 0.1, self.num_factors))
-        f = time.time()
-        self.train_time_record['IncrTrain_1'].append(np.round(f-s,3))
-        # IncrTrain_2
-        s = time.time()
-        user_items = self.data.GetUserItems(user_id)
-        if len(user_items) < len(self.data.itemset) - self.ra_length:
+            self.item_factors.Append(np.random.normal(0.0, 0.1, self.num_factors))
+        t = timer.Lap('IncrTrain_1', t)
+        self._UpdateWithNegatives(user_id, item_id, self.data.useritems.RowLength(user_id), len(self.data.itemset),
+                                  lambda i: self.data.HasInteraction(user_id, i))
+        timer.Lap('IncrTrain_2', t)
+
+    def IncrTrainMany(self, users, items, update_users: bool = True, update_items: bool = True, timestamps = None):
+        if self.data.dedup or self.data.retention is not None:
+            # the row prefixes below assume one entry per interaction, but repeats are not stored in dedup mode and retention evicts entries
+            return Model.IncrTrainMany(self, users, items, timestamps)
+        num_items = len(self.data.itemset)
+        user_ids, item_ids = self.data.AddFeedbackBatch(users, items, timestamps)
+        self._GrowFactorsBatch(user_ids, item_ids)
+        # negatives must be sampled as in IncrTrain, i.e. only from what was known up to each interaction:
+        # the catalog size at that point and the prefix of the user's items that excludes later interactions of the batch
+        num_items = np.maximum(num_items, np.maximum.accumulate(item_ids) + 1)
+        batch_counts = np.bincount(user_ids)
+        seen = np.zeros_like(batch_counts)
+        for user_id, item_id, n_items in zip(user_ids.tolist(), item_ids.tolist(), num_items.tolist()):
+            seen[user_id] += 1
+            user_items = self.data.GetUserItems(user_id)
+            user_items = user_items[:len(user_items) - batch_counts[user_id] + seen[user_id]]
+            self._UpdateWithNegatives(user_id, item_id, len(user_items), n_items, user_items.__contains__)
+
+    def _UpdateWithNegatives(self, user_id, item_id, num_user_items, num_items, has_item):
+        '''
+        num_user_items -- number of interactions of the user (with repetitions)
+        has_item -- membership test for the user's items, used to reject negative samples
+        '''
+        if num_user_items < num_items - self.ra_length:
             for _ in range(self.ra_length):
-                negative_item_id = random.choice(range(len(self.data.itemset)))
-                while negative_item_id in user_items:
-                    negative_item_id = random.choice(range(len(self.data.itemset)))
+                negative_item_id = random.choice(range(num_items))
+                while has_item(negative_item_id):
+                    negative_item_id = random.choice(range(num_items))
 
                 self._UpdateFactors(user_id, negative_item_id, True, False, 0)
         
-        self._UpdateFactors(user_id, item_id)
-        f = time.time()
-        self.train_time_record['IncrTrain_2'].append(np.round(f-s,3))     
\ No newline at end of file
+        self._UpdateFactors(user_id, item_id)     
\ No newline at end of file
@@ -1,4 +1,3 @@
-from numba import njit
 from collections import defaultdict
 import random
 from data import ImplicitData
@@ -6,7 +5,7 @@ import numpy as np
 from .BISGD import BISGD
 
 class UBISGD(BISGD):
-    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, num_nodes: int = 8, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1):
+    def __init__(self, data: ImplicitData, num_factors: int = 10, num_iterations: int = 10, num_nodes: int = 8, learn_rate: float = 0.01, u_regularization: float = 0.1, i_regularization: float = 0.1, random_seed: int = 1, precision: str = 'float64'):
         """    Constructor.
 
         Keyword arguments:
@@ -16,32 +15,45 @@ class UBISGD(BISGD):
         num_nodes -- Number of 'weak' learners (int, default 8)
         learn_rate -- Learn rate, aka step size (float, default 0.01)
         regularization -- Regularization factor (float, default 0.01)
-        random_seed -- Random seed (int, default 1)"""
+        random_seed -- Random seed (int, default 1)
+        precision -- dtype of the stored factors: 'float64', 'float32' or 'float16' (see ISGD)"""
 
-        super().__init__(data, num_factors, num_iterations, num_nodes, learn_rate, u_regularization, i_regularization, random_seed)
+        super().__init__(data, num_factors, num_iterations, num_nodes, learn_rate, u_regularization, i_regularization, random_seed, precision)
 
     def _InitModel(self):
         super()._InitModel()
         self.user_k = [[] for _ in range(self.num_nodes)]
 
-    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True):
+    def _SaveState(self):
+        arrays, state = super()._SaveState()
+        arrays['user_k'] = np.array(self.user_k, dtype=np.int64).reshape(self.num_nodes, -1) # (num_nodes x users)
+        return arrays, state
+
+    def _LoadState(self, arrays: dict, state: dict):
+        super()._LoadState(arrays, state)
+        self.user_k = [user_k.tolist() for user_k in arrays['user_k']]
+
+    def IncrTrain(self, user, item, update_users: bool = True, update_items: bool = True, timestamp = None):
         """
         Incrementally updates the model.
 
         Keyword arguments:
         user_id -- The ID of the user
         item_id -- The ID of the item
+        timestamp -- Instant of the interaction, required if the data has timestamps or a time window (default None)
         """
 
-        user_id, item_id = self.data.AddFeedback(user, item)
+        user_id, item_id = self.data.AddFeedback(user, item, timestamp)
+        self._IncrTrain(user_id, item_id)
 
-        if len(self.user_factors[0]) == self.data.maxuserid:
+    def _IncrTrain(self, user_id, item_id):
+        if len(self.user_factors[0]) == user_id:
             for node in range(self.num_nodes):
                 self.user_k[node].append(np.random.poisson(1, size=1)[0])
-                self.user_factors[node].append(np.random.normal(0.0, 0.1, self.num_factors))
-        if len(self.item_factors[0]) == self.data.maxitemid:
+                self.user_factors[node].Append(np.random.normal(0.0, 0.1, self.num_factors))
+        if len(self.item_factors[0]) == item_id:
             for node in range(self.num_nodes):
-                self.item_factors[node].append(np.random.normal(0.0, 0.1, self.num_factors))
+                self.item_factors[node].Append(np.random.normal(0.0, 0.1, self.num_factors))
         
         for node in range(self.num_nodes):
             k = min(1, self.user_k[node][user_id])
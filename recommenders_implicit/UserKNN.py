@@ -1,4 +1,4 @@
-from data import ImplicitData, SymmetricMatrix
+from data import ImplicitData, SymmetricMatrix, SparseSymmetricMatrix, PackedSymmetricMatrix, MemmapSymmetricMatrix
 import numpy as np
 import itertools as itt
 from .Model import Model
@@ -8,16 +8,28 @@ class UserKNN(Model):
     TODO doc
     """
 
-    def __init__(self, data: ImplicitData, k: int = 10, similarity: str = "cosine"):
+    matrix_types = {'dense': SymmetricMatrix, 'sparse': SparseSymmetricMatrix, 'packed': PackedSymmetricMatrix, 'memmap': MemmapSymmetricMatrix}
+
+    def __init__(self, data: ImplicitData, k: int = 10, similarity: str = "cosine", matrix_type: str = 'dense', matrix_options: dict = None):
         """
         Constructor.
 
         Keyword arguments:
         data -- ImplicitData object
         k -- Number of neighbors to use (int, default 10)
+        matrix_type -- Storage of user_freq and user_sim (str, default 'dense'):
+            'dense' -- SymmetricMatrix, float64
+            'sparse' -- SparseSymmetricMatrix, memory proportional to the number of co-occurring user pairs
+            'packed' -- PackedSymmetricMatrix, one triangle in float32 (a quarter of the dense memory)
+            'memmap' -- MemmapSymmetricMatrix, dense matrix in a memory-mapped file, for matrices larger than memory
+        matrix_options -- Extra keyword arguments for the matrix constructor, e.g. {'block_rows': 4096} for 'memmap' (dict, default None)
+            A 'filename' is suffixed with '.freq' and '.sim', one backing file per matrix
         """
+        assert matrix_type in self.matrix_types, "matrix_type must be one of " + ", ".join(self.matrix_types)
         self.data = data
         self.k = k
+        self.matrix_type = matrix_type
+        self.matrix_options = matrix_options or {}
         self._InitModel()
 
 
@@ -29,27 +41,66 @@ class UserKNN(Model):
         Creates objects user_freq and user_sim,  which contain square matrices of size ( (#num_entities + 1) * 2 ) x ( (#num_entities + 1) * 2 ) filled with zeros.
         Creates a list of 'maxuserid' 'k' sized arrays filled with -1.
         '''
-        self.user_freq = SymmetricMatrix(len(self.data.userset)) # self.data.size
-        self.user_sim = SymmetricMatrix(len(self.data.userset)) # self.data.size
+        matrix_class = self.matrix_types[self.matrix_type]
+        self.user_freq = matrix_class(len(self.data.userset), **self._MatrixOptions('freq')) # self.data.size
+        self.user_sim = matrix_class(len(self.data.userset), **self._MatrixOptions('sim')) # self.data.size
         self.user_neighbors = [np.zeros(self.k, dtype=np.float32) - 1 for _ in range(self.data.maxuserid + 1)] # int
 
+    def _MatrixOptions(self, suffix: str):
+        # user_freq and user_sim must not share a backing file (memmap)
+        options = dict(self.matrix_options)
+        if options.get('filename') is not None:
+            options['filename'] = options['filename'] + '.' + suffix
+        return options
+
+    def _SaveState(self):
+        arrays, state = super()._SaveState()
+        # dtypes (e.g. {'dtype': np.float32}) are saved by name, which numpy accepts back
+        state['matrix_options'] = {key: np.dtype(value).name if isinstance(value, (type, np.dtype)) else value for key, value in self.matrix_options.items()}
+        state['matrices'] = {}
+        for name in ('user_freq', 'user_sim'):
+            matrix_arrays, state['matrices'][name] = getattr(self, name).ToArrays()
+            arrays.update({name + '.' + key: array for key, array in matrix_arrays.items()})
+        # neighborhoods as one (rows x 2) array and the number of rows of each user, -1 for a user without neighborhood yet
+        computed = [neighbors for neighbors in self.user_neighbors if neighbors.ndim == 2]
+        arrays['neighbors_lengths'] = np.array([len(neighbors) if neighbors.ndim == 2 else -1 for neighbors in self.user_neighbors], dtype=np.int64)
+        arrays['neighbors'] = np.concatenate(computed) if computed else np.empty((0, 2))
+        return arrays, state
+
+    def _LoadState(self, arrays: dict, state: dict):
+        state = dict(state)
+        matrices = state.pop('matrices')
+        super()._LoadState(arrays, state)
+        matrix_class = self.matrix_types[self.matrix_type]
+        for name, matrix_state in matrices.items():
+            prefix = name + '.'
+            matrix_arrays = {key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)}
+            setattr(self, name, matrix_class.FromArrays(matrix_arrays, matrix_state))
+        lengths = arrays['neighbors_lengths']
+        ends = np.cumsum(np.maximum(lengths, 0))
+        self.user_neighbors = [arrays['neighbors'][end - length:end] if length >= 0 else np.zeros(self.k, dtype=np.float32) - 1
+                               for length, end in zip(lengths.tolist(), ends.tolist())]
+
     def BatchTrain(self):
         """
         Trains a new model with the all the available data.
         """
+        self.ResetModel()
         self._BuildFreqMatrix()
         self._ComputeSimilarities()
         self._ComputeNeighborhoods()
 
     def _BuildFreqMatrix(self):
         #Batch
-        for item in range(self.data.maxitem + 1):
-            users = self.data.GetItemUsers(item)
-            for u, v in itt.combinations(users, 2):
-                if u != v:
-                    self.user_freq.Increment(u, v)
-                self.user_freq.IncrementDiag(u)
-                self.user_freq.IncrementDiag(v)
+        for item in range(self.data.maxitemid + 1):
+            users = np.asarray(self.data.GetItemUsers(item), dtype=np.int64)
+            # all pairs of interactions of the item at once, instead of itt.combinations
+            first, second = np.triu_indices(len(users), 1)
+            u, v = users[first], users[second]
+            self.user_freq.IncrementPairs(u[u != v], v[u != v])
+            # the diagonal counts the interactions of each user, as IncrementDiag in _UpdateSimilarities
+            for w, count in zip(*np.unique(users, return_counts=True)):
+                self.user_freq.IncrementDiag(int(w), int(count))
 
     def _ComputeSimilarities(self):
         # Batch: Iterate through all user pairs (u, v) 
@@ -64,7 +115,7 @@ class UserKNN(Model):
                     sim = f_uv / np.sqrt(f_u ** 2 * f_v ** 2)
                 else:
                     sim = 0
-                self.user_sims.Set(u, v, sim)
+                self.user_sim.Set(u, v, sim)
 
     def _ComputeNeighborhoods(self):
         # Batch
@@ -83,28 +134,82 @@ class UserKNN(Model):
         return neighbors[:self.k]
 
 
-    def IncrTrain(self, user, item):
+    def IncrTrain(self, user, item, timestamp = None):
         """
         Incrementally updates the model.
 
         Keyword arguments:
         user_id -- The ID of the user
         item_id -- The ID of the item
+        timestamp -- Instant of the interaction, required if the data has timestamps or a time window (default None)
         """
-        u, i = self.data.AddFeedback(user, item) # 
+        u, i = self.data.AddFeedback(user, item, timestamp)
         self._UpdateSimilarities(u, i)
         self._UpdateNeighbors(u)
 
 
-    def _UpdateSimilarities(self, u: int, i: int):
-        item_users = self.data.GetItemUsers(i)
+    def IncrTrainMany(self, users, items, timestamps = None):
+        """
+        Incrementally updates the model with a batch of interactions.
+        IDs are mapped once for the whole batch; similarities and neighborhoods are updated in stream order,
+        each interaction seeing only the data up to itself (same results as calling IncrTrain for each interaction).
+
+        Keyword arguments:
+        users -- The IDs of the users
+        items -- The IDs of the items
+        timestamps -- Instants of the interactions, required if the data has timestamps or a time window (default None)
+        """
+        if self.data.dedup or self.data.retention is not None:
+            # the row prefixes below assume one entry per interaction, but repeats are not stored in dedup mode and retention evicts entries
+            return super().IncrTrainMany(users, items, timestamps)
+        maxuserid = self.data.maxuserid
+        user_ids, item_ids = self.data.AddFeedbackBatch(users, items, timestamps)
+        maxuserids = np.maximum(maxuserid, np.maximum.accumulate(user_ids))
+        batch_counts = np.bincount(item_ids)
+        seen = np.zeros_like(batch_counts)
+        for u, i, max_u in zip(user_ids.tolist(), item_ids.tolist(), maxuserids.tolist()):
+            seen[i] += 1
+            # users of item i up to this interaction - excludes later interactions of the batch
+            item_users = self.data.GetItemUsers(i)
+            item_users = item_users[:len(item_users) - batch_counts[i] + seen[i]]
+            self._UpdateSimilarities(u, i, item_users, max_u)
+            self._UpdateNeighbors(u, maxuserid=max_u)
+
+    def _UpdateSimilarities(self, u: int, i: int, item_users = None, maxuserid: int = None):
+        if item_users is None:
+            item_users = self.data.GetItemUsers(i)
+        if maxuserid is None:
+            maxuserid = self.data.maxuserid
         self.user_freq.IncrementDiag(u)
-        for v in item_users:
-            if v != u:
-                self.user_freq.Increment(u, v)
+        item_users = np.asarray(item_users)
+        others = item_users[item_users != u]
+        self.user_freq.IncrementPairs(np.full(len(others), u), others)
+        self._UpdateUserSimilarities(u, maxuserid)
+
+    def Forget(self, u: int, i: int):
+        """
+        Removes the contribution of an interaction evicted from the data, e.g. by a retention window.
+        Use as eviction callback: data.SetRetention(window, on_evict=model.Forget)
 
+        Keyword arguments:
+        u -- The internal ID of the user
+        i -- The internal ID of the item
+        """
+        # the evicted interaction is no longer in data.GetItemUsers(i)
+        self.user_freq.IncrementDiag(u, -1)
+        item_users = np.asarray(self.data.GetItemUsers(i))
+        others = item_users[item_users != u]
+        self.user_freq.IncrementPairs(np.full(len(others), u), others, -1)
+        # may run inside AddFeedback, before a new user of the same interaction gets its model state
+        maxuserid = len(self.user_neighbors) - 1
+        self._UpdateUserSimilarities(u, maxuserid)
+        self._UpdateNeighbors(u, maxuserid=maxuserid)
+
+    def _UpdateUserSimilarities(self, u: int, maxuserid: int):
+        if isinstance(self.user_freq, SparseSymmetricMatrix):
+            return self._UpdateUserSimilaritiesSparse(u, maxuserid)
         f_u = self.user_freq.Get(u, u)
-        for v in range(self.data.maxuserid + 1):
+        for v in range(maxuserid + 1):
             if v != u:
                 f_uv = self.user_freq.Get(u, v)
                 f_v = self.user_freq.Get(v, v)
@@ -115,15 +220,34 @@ class UserKNN(Model):
                     sim = 0
                 self.user_sim.Set(u, v, sim)
 
-    def _UpdateNeighbors(self, u: int, complete: bool = True):
+    def _UpdateUserSimilaritiesSparse(self, u: int, maxuserid: int):
+        # only the users that co-occur with u (non-zeros of its user_freq row) have a non-zero similarity: no zeros are written
+        for v in range(self.user_sim.max_id + 1, maxuserid + 1):
+            self.user_sim.Set(v, v, 0) # grows user_sim up to maxuserid, as the Set calls of the dense loop do
+        f_u = self.user_freq.Get(u, u)
+        users, f_uvs = self.user_freq.GetRowSparse(u)
+        inside = (users != u) & (users <= maxuserid)
+        users, f_uvs = users[inside], f_uvs[inside]
+        # similarities that are no longer backed by a co-occurrence (e.g. after Forget) are cleared
+        previous, _ = self.user_sim.GetRowSparse(u)
+        for v in np.setdiff1d(previous, users).tolist():
+            self.user_sim.Set(u, v, 0)
+        for v, f_uv in zip(users.tolist(), f_uvs.tolist()):
+            f_v = self.user_freq.Get(v, v)
+            # Cosine
+            self.user_sim.Set(u, v, f_uv / np.sqrt(f_u ** 2 * f_v ** 2))
+
+    def _UpdateNeighbors(self, u: int, complete: bool = True, maxuserid: int = None):
+        if maxuserid is None:
+            maxuserid = self.data.maxuserid
         if u == len(self.user_neighbors):
-            self.user_neighbors.append(np.zeros(self.k, dtype=np.int) - 1)
+            self.user_neighbors.append(np.zeros(self.k, dtype=int) - 1)
 
         # 1. Update user's own neighbors
         self.user_neighbors[u] = self._ComputeUserNeighbors(u)
         
         neighborhoods = [int(nn) for nn,_ in self.user_neighbors[u]]
-        for v in range(self.data.maxuserid + 1):
+        for v in range(maxuserid + 1):
             # Update u's neighbors' neighbors and users whose neighbors include u 
             #if(u in self.user_neighbors[v] or v in neighborhoods):
             #if(u in self.user_neighbors[v]):
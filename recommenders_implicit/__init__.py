@@ -1,4 +1,5 @@
 from .Model import Model
+from .recommendation_list import RecommendationList
 from .ISGD import ISGD
 from .RAISGD import RAISGD
 from .RSISGD import RSISGD
@@ -0,0 +1,117 @@
+import numpy as np
+from data import GrowableArray
+
+try:
+    from numba import njit
+except ImportError: # pure-Python fallback: quantized scores use the chunked float32 matrix product
+    njit = None
+
+FACTOR_DTYPES = {'float64': np.float64, 'float32': np.float32, 'float16': np.float16}
+
+def FactorDtype(precision: str):
+    '''
+    Returns the dtype of the factors stored with a precision ('float64', 'float32' or 'float16').
+    '''
+    if precision not in FACTOR_DTYPES:
+        raise ValueError(f"precision must be one of {', '.join(FACTOR_DTYPES)}, not {precision!r}")
+    return FACTOR_DTYPES[precision]
+
+def Products(factors, queries, chunk: int = 65536):
+    '''
+    Returns the inner products of queries (one vector, or one per row) with every row of factors:
+    factors @ query for a vector, queries @ factors.T for a matrix.
+    The queries are cast to the dtype of the factors, so that float32 factors are not upcast (copied) by a float64 query.
+    float16 factors have no BLAS product: they are converted to float32 chunk by chunk.
+    '''
+    if factors.dtype != np.float16:
+        queries = np.asarray(queries, dtype=factors.dtype)
+        return factors @ queries if queries.ndim == 1 else queries @ factors.T
+    queries = np.asarray(queries, dtype=np.float32)
+    products = np.empty(queries.shape[:-1] + (len(factors),), dtype=np.float32)
+    for start in range(0, len(factors), chunk):
+        block = factors[start:start + chunk].astype(np.float32)
+        products[..., start:start + chunk] = block @ queries if queries.ndim == 1 else queries @ block.T
+    return products
+
+def Quantize(vectors):
+    '''
+    int8 per-row quantization: returns (codes, scales) with vectors[i] ~ codes[i] * scales[i], |codes| <= 127.
+    '''
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127 if vectors.shape[1] else np.zeros(len(vectors), dtype=np.float32)
+    scales[scales == 0] = 1.0 # all-zero rows
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _QuantizedProducts(codes, scales, query):
+    # one pass over the int8 codes; fastmath lets the accumulation be vectorized
+    products = np.empty(codes.shape[0], dtype=np.float32)
+    for row in range(codes.shape[0]):
+        acc = np.float32(0.0)
+        for dim in range(codes.shape[1]):
+            acc += codes[row, dim] * query[dim]
+        products[row] = acc * scales[row]
+    return products
+
+NUMBA_AVAILABLE = njit is not None
+_QuantizedProductsKernel = njit(cache=True, fastmath=True)(_QuantizedProducts) if NUMBA_AVAILABLE else None
+
+class QuantizedFactors:
+    '''
+    int8 copy of a factor matrix with one float32 scale per row (see Quantize), used to score all items in Recommend:
+    1 byte per factor is read instead of 8 (float64) or 4 (float32), for an error of at most half a quantization step per factor.
+    Queries are not quantized. A single query is scored in one compiled pass over the codes; a block of queries
+    dequantizes the codes chunk by chunk into a float32 matrix product.
+
+    The copy reads the factor matrix (a GrowableArray) directly. Changed rows are marked with Touch and new rows are
+    picked up automatically; both are requantized in one vectorized step before the next query.
+    '''
+
+    def __init__(self, factors: GrowableArray):
+        '''
+        factors -- GrowableArray with one vector per row
+        '''
+        self.factors = factors
+        self.Build()
+
+    def Build(self):
+        '''
+        Quantizes every row.
+        '''
+        codes, scales = Quantize(self.factors.View())
+        self.codes = GrowableArray(codes)
+        self.scales = GrowableArray(scales)
+        self.dirty = set()
+
+    def Touch(self, row: int):
+        '''
+        Marks a row as changed. It is requantized before the next query.
+        '''
+        self.dirty.add(row)
+
+    def _Refresh(self):
+        size = len(self.factors)
+        if size > len(self.codes):
+            codes, scales = Quantize(self.factors.View()[len(self.codes):])
+            self.codes.Extend(codes)
+            self.scales.Extend(scales)
+        if self.dirty:
+            rows = np.fromiter(self.dirty, dtype=np.int64, count=len(self.dirty))
+            self.codes.View()[rows], self.scales.View()[rows] = Quantize(self.factors.View()[rows])
+            self.dirty = set()
+
+    def Products(self, queries, chunk: int = 16384):
+        '''
+        Approximate inner products of queries with every row (float32), as Products(factors, queries).
+        '''
+        self._Refresh()
+        codes, scales = self.codes.View(), self.scales.View()
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1 and NUMBA_AVAILABLE:
+            return _QuantizedProductsKernel(codes, scales, queries)
+        products = np.empty(queries.shape[:-1] + (len(codes),), dtype=np.float32)
+        for start in range(0, len(codes), chunk):
+            block = codes[start:start + chunk].astype(np.float32)
+            block *= scales[start:start + chunk, None]
+            products[..., start:start + chunk] = block @ queries if queries.ndim == 1 else queries @ block.T
+        return products
@@ -0,0 +1,86 @@
+import numpy as np
+from data import GrowableArray
+
+class FactorStatistics:
+    '''
+    Running mean and approximate per-dimension median of the rows of a factor matrix (e.g. ISGD user factors),
+    used as the factors of users that are not in the model (default_user 'average' / 'median').
+
+    The sum of the rows and a histogram per dimension (num_bins bins between the minimum and maximum seen at the last rebuild,
+    values outside go to the edge bins) are kept up to date with Update when a row changes. Rows appended to the matrix
+    are added before the next query. Mean costs O(factors) and Median O(factors * num_bins), however many rows there are.
+    The median is exact up to a bin width (linear interpolation inside the bin).
+    Everything is recomputed from the rows after as many updates as there are rows, which bounds the drift of the running sum
+    and refits the histogram range, at an amortized O(factors) per update.
+    The sum, the histogram range and the results are float64 whatever the dtype of the factors (float32/float16 precision).
+    '''
+
+    def __init__(self, factors: GrowableArray, num_bins: int = 256):
+        '''
+        factors -- GrowableArray with one vector per row
+        num_bins -- number of histogram bins per dimension
+        '''
+        self.factors = factors
+        self.num_bins = num_bins
+        self.Rebuild()
+
+    def Rebuild(self):
+        '''
+        Recomputes the sum and the histograms from the current rows.
+        '''
+        vectors = self.factors.View()
+        num_factors = vectors.shape[1]
+        self.count = len(vectors)
+        self.sum = vectors.sum(axis=0, dtype=np.float64)
+        self.low = vectors.min(axis=0).astype(np.float64) if self.count else np.zeros(num_factors)
+        high = vectors.max(axis=0).astype(np.float64) if self.count else np.zeros(num_factors)
+        self.width = np.where(high > self.low, (high - self.low) / self.num_bins, 1.0)
+        self.histograms = np.zeros((num_factors, self.num_bins), dtype=np.int64)
+        self._dims = np.arange(num_factors)
+        self._AddRows(vectors)
+        self.updates = 0
+
+    def _Bins(self, vectors):
+        # self.low is float64: the difference is computed in float64 for float32/float16 vectors too
+        return np.clip(((vectors - self.low) / self.width).astype(np.int64), 0, self.num_bins - 1)
+
+    def _AddRows(self, vectors):
+        bins = self._Bins(vectors)
+        for dim in range(len(self._dims)):
+            self.histograms[dim] += np.bincount(bins[:, dim], minlength=self.num_bins)
+
+    def Update(self, old, new):
+        '''
+        Accounts for a change of a row already counted (row id < count) from old to new.
+        '''
+        self.sum += np.asarray(new, dtype=np.float64) - np.asarray(old, dtype=np.float64)
+        self.histograms[self._dims, self._Bins(old)] -= 1
+        self.histograms[self._dims, self._Bins(new)] += 1
+        self.updates += 1
+
+    def _Refresh(self):
+        size = len(self.factors)
+        if self.updates > size:
+            self.Rebuild()
+        elif size > self.count:
+            vectors = self.factors.View()[self.count:]
+            self.sum += vectors.sum(axis=0, dtype=np.float64)
+            self._AddRows(vectors)
+            self.count = size
+
+    def Mean(self):
+        self._Refresh()
+        if not self.count:
+            return np.zeros(len(self.sum))
+        return self.sum / self.count
+
+    def Median(self):
+        self._Refresh()
+        if not self.count:
+            return np.zeros(len(self.sum))
+        cumulative = np.cumsum(self.histograms, axis=1)
+        half = self.count / 2
+        bins = np.argmax(cumulative >= half, axis=1)
+        in_bin = self.histograms[self._dims, bins]
+        before = cumulative[self._dims, bins] - in_bin
+        return self.low + (bins + (half - before) / np.maximum(in_bin, 1)) * self.width
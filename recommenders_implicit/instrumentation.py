@@ -0,0 +1,71 @@
+from time import perf_counter_ns
+
+NUM_BINS = 64 # histogram bin b counts durations d with d.bit_length() == b, i.e. 2^(b-1) <= d < 2^b ns
+
+class PhaseTimer:
+    '''
+    Aggregated timings of the phases of a method (e.g. IncrTrain_0..2), off by default.
+    Each phase keeps a fixed amount of memory however many events are timed:
+    a count, the total/min/max duration in nanoseconds (perf_counter_ns) and a log2 histogram.
+    When disabled, Start and Lap return immediately without reading the clock.
+
+    Usage:
+        t = timer.Start()
+        ... phase A ...
+        t = timer.Lap('A', t)
+        ... phase B ...
+        timer.Lap('B', t)
+    '''
+
+    def __init__(self, phases: list, enabled: bool = False):
+        self.phases = list(phases)
+        self.enabled = enabled
+        self.Reset()
+
+    def Reset(self):
+        '''
+        Clears all counters.
+        '''
+        self._stats = {phase: [0, 0, None, 0] for phase in self.phases} # count, total, min, max
+        self._histograms = {phase: [0] * NUM_BINS for phase in self.phases}
+
+    def Start(self):
+        if not self.enabled:
+            return 0
+        return perf_counter_ns()
+
+    def Lap(self, phase: str, start: int):
+        '''
+        Records the time elapsed since start for a phase. Returns the current time, to be used as the start of the next phase.
+        '''
+        if not self.enabled:
+            return 0
+        now = perf_counter_ns()
+        elapsed = now - start
+        stats = self._stats[phase]
+        stats[0] += 1
+        stats[1] += elapsed
+        if stats[2] is None or elapsed < stats[2]:
+            stats[2] = elapsed
+        if elapsed > stats[3]:
+            stats[3] = elapsed
+        self._histograms[phase][min(elapsed.bit_length(), NUM_BINS - 1)] += 1
+        return now
+
+    def Summary(self):
+        '''
+        Returns a dict phase -> {count, total_ns, mean_ns, min_ns, max_ns, histogram}.
+        histogram[b] is the number of events that took between 2^(b-1) and 2^b nanoseconds.
+        '''
+        summary = {}
+        for phase in self.phases:
+            count, total, minimum, maximum = self._stats[phase]
+            summary[phase] = {
+                'count': count,
+                'total_ns': total,
+                'mean_ns': total / count if count else 0.0,
+                'min_ns': minimum or 0,
+                'max_ns': maximum,
+                'histogram': list(self._histograms[phase])
+            }
+        return summary
@@ -0,0 +1,119 @@
+import numpy as np
+from data import GrowableArray
+
+class IVFIndex:
+    '''
+    Approximate top-N retrieval over a factor matrix (inverted file index).
+    Vectors are clustered with k-means into num_lists cells. A query scores the cell centroids
+    and only the items of the best num_probes cells are scored exactly, so a query costs
+    O(num_lists + num_probes * items per cell) instead of O(items) - O(sqrt(items)) with the default num_lists.
+
+    Cells are ranked by |target - <p_u, centroid>|, the score ISGD uses for items (target 1).
+    The index reads the factor matrix (a GrowableArray) directly. Changed vectors are marked with Touch and new rows are
+    picked up automatically; both are reassigned to their nearest centroid in one vectorized step before the next query.
+    Centroids are recomputed (Build) when the number of vectors has doubled since the last build.
+    '''
+
+    def __init__(self, factors: GrowableArray, num_lists: int = None, num_probes: int = 8, target: float = 1.0,
+                 iterations: int = 10, sample_size: int = 100000, random_seed: int = 1):
+        '''
+        factors -- GrowableArray with one vector per item
+        num_lists -- number of cells. If None, sqrt(number of items) at each build
+        num_probes -- number of cells scanned per query (more cells: higher recall, slower queries)
+        target -- cells are ranked by |target - <query, centroid>|
+        iterations -- k-means iterations
+        sample_size -- maximum number of vectors used to fit the centroids
+        random_seed -- seed of the index's own random generator (the global numpy generator used by the models is not touched)
+        '''
+        self.factors = factors
+        self.num_lists = num_lists
+        self.num_probes = num_probes
+        self.target = target
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.random = np.random.RandomState(random_seed)
+        self.Build()
+
+    def Build(self):
+        '''
+        Fits the centroids to the current vectors and reassigns every vector.
+        '''
+        vectors = self.factors.View()
+        size = len(vectors)
+        num_lists = max(1, min(size, self.num_lists or int(np.sqrt(size))))
+        sample = vectors
+        if size > self.sample_size:
+            sample = vectors[self.random.choice(size, self.sample_size, replace=False)]
+        if size:
+            self.centroids = sample[self.random.choice(len(sample), num_lists, replace=False)].copy()
+        else:
+            self.centroids = np.zeros((1, vectors.shape[1]))
+        for _ in range(self.iterations if size else 0):
+            cells = self._Nearest(sample)
+            counts = np.bincount(cells, minlength=len(self.centroids))
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, cells, sample)
+            filled = counts > 0 # an empty cell keeps its centroid
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+        self.built_size = size
+        self.assignment = GrowableArray(np.full(size, -1, dtype=np.int32)) # item -> cell
+        self.position = GrowableArray(np.zeros(size, dtype=np.int32)) # item -> position in its cell
+        self.lists = [GrowableArray(dtype=np.int32) for _ in range(len(self.centroids))]
+        self.dirty = set()
+        self._Assign(np.arange(size))
+
+    def Touch(self, item_id: int):
+        '''
+        Marks a vector as changed. It is moved to its nearest cell before the next query.
+        '''
+        self.dirty.add(item_id)
+
+    def _Nearest(self, vectors, chunk: int = 65536):
+        # argmin of squared euclidean distance, |x|^2 dropped as it is the same for every centroid
+        half_norms = 0.5 * np.einsum('ij,ij->i', self.centroids, self.centroids)
+        cells = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            cells[start:start + chunk] = np.argmin(half_norms - vectors[start:start + chunk] @ self.centroids.T, axis=1)
+        return cells
+
+    def _Assign(self, item_ids):
+        cells = self._Nearest(self.factors.View()[item_ids])
+        assignment = self.assignment.View()
+        moved = cells != assignment[item_ids]
+        for item_id, cell in zip(item_ids[moved].tolist(), cells[moved].tolist()):
+            old_cell = assignment[item_id]
+            if old_cell != -1:
+                # swap-remove: the last item of the old cell takes the place of the moved one
+                members = self.lists[old_cell]
+                pos = self.position[item_id]
+                last = members.Pop()
+                if last != item_id:
+                    members[pos] = last
+                    self.position[last] = pos
+            self.position[item_id] = self.lists[cell].Append(item_id)
+            assignment[item_id] = cell
+
+    def _Refresh(self):
+        size = len(self.factors)
+        if size >= 2 * self.built_size and size > 1:
+            self.Build()
+            return
+        if size > len(self.assignment):
+            new_items = np.arange(len(self.assignment), size)
+            self.assignment.Extend(np.full(len(new_items), -1, dtype=np.int32))
+            self.position.Extend(np.zeros(len(new_items), dtype=np.int32))
+            self.dirty.update(new_items.tolist())
+        if self.dirty:
+            self._Assign(np.fromiter(self.dirty, dtype=np.int64, count=len(self.dirty)))
+            self.dirty = set()
+
+    def Candidates(self, query, min_count: int = 0):
+        '''
+        Returns the items of the best cells for a query vector (internal ids, int array):
+        at least num_probes cells, and more if needed to reach min_count items.
+        '''
+        self._Refresh()
+        order = np.argsort(np.abs(self.target - self.centroids @ query))
+        sizes = np.fromiter((len(self.lists[cell]) for cell in order), dtype=np.int64, count=len(order))
+        num_cells = max(self.num_probes, int(np.searchsorted(np.cumsum(sizes), min_count)) + 1)
+        return np.concatenate([self.lists[cell].View() for cell in order[:num_cells]])
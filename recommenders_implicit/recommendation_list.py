@@ -0,0 +1,48 @@
+import numpy as np
+
+class RecommendationList:
+    '''
+    Result of Recommend: internal item indices (int32) ranked best first, and their scores (float32).
+    External item IDs are only looked up for the items in the list (external_ids).
+
+    Indexing works as on the former (item, score) 2-column array, so existing callers keep working:
+    recs[:n, 0] gives external IDs, recs[:, 1] the scores, recs[:n] a shorter RecommendationList,
+    and np.asarray(recs) the 2-column array.
+    '''
+
+    def __init__(self, item_ids, scores, itemset):
+        '''
+        item_ids -- internal item indices, best first
+        scores -- score of each item
+        itemset -- vocabulary of external item IDs (data.itemset)
+        '''
+        self.item_ids = np.asarray(item_ids, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.itemset = itemset
+
+    @property
+    def external_ids(self):
+        return self.itemset[self.item_ids]
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return RecommendationList(self.item_ids[key], self.scores[key], self.itemset)
+        if isinstance(key, tuple) and len(key) == 2 and isinstance(key[1], int) and key[1] in (0, 1, -1, -2):
+            rows, column = key
+            if column in (0, -2):
+                return self.itemset[self.item_ids[rows]]
+            return self.scores[rows]
+        return np.asarray(self)[key]
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+    def __array__(self, dtype=None, copy=None):
+        recs = np.column_stack((self.external_ids, self.scores))
+        return recs if dtype is None else recs.astype(dtype, copy=False)
+
+    def __repr__(self):
+        return f'RecommendationList({np.asarray(self)!r})'
@@ -0,0 +1,47 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError: # pure-Python fallback: the kernels run as regular numpy code
+    njit = None
+
+def _UpdateFactors(p_u, q_i, num_iterations: int, learn_rate: float, user_regularization: float, item_regularization: float,
+                   update_users: bool, update_items: bool, target: float, nonnegative: bool):
+    # same operations, in the same order, as the original per-iteration numpy code, so results are bit-identical
+    # np.dot on two 1-D float64 arrays is the BLAS dot product used by np.inner (numba calls the same routine)
+    for _ in range(num_iterations):
+        err = target - np.dot(p_u, q_i)
+        if update_users:
+            p_u += learn_rate * (err * q_i - user_regularization * p_u)
+            if nonnegative:
+                p_u[p_u < 0] = 0.0
+        if update_items:
+            q_i += learn_rate * (err * p_u - item_regularization * q_i)
+            if nonnegative:
+                q_i[q_i < 0] = 0.0
+
+NUMBA_AVAILABLE = njit is not None
+_UpdateFactorsKernel = njit(cache=True)(_UpdateFactors) if NUMBA_AVAILABLE else _UpdateFactors
+
+def UpdateFactors(p_u, q_i, num_iterations: int, learn_rate: float, user_regularization: float, item_regularization: float,
+                  update_users: bool = True, update_items: bool = True, target: float = 1, nonnegative: bool = False):
+    """
+    Runs num_iterations SGD steps on a user and an item factor vector, in place.
+    p_u and q_i are rows of the factor matrices (views), so the matrices are updated directly.
+
+    The arithmetic is done in the dtype of the factors (e.g. float32 training for float32 factors).
+    float16 factors are updated through float32 copies of the two rows, written back after the steps.
+
+    Keyword arguments:
+    nonnegative -- clips negative factors to 0 after each step (LocalUBISGD metamodel)
+    """
+    if p_u.dtype == np.float16:
+        p_u32, q_i32 = p_u.astype(np.float32), q_i.astype(np.float32)
+        UpdateFactors(p_u32, q_i32, num_iterations, learn_rate, user_regularization, item_regularization,
+                      update_users, update_items, target, nonnegative)
+        p_u[:] = p_u32
+        q_i[:] = q_i32
+        return
+    scalar = p_u.dtype.type # np.float64 scalars are typed as float64, as python floats are
+    _UpdateFactorsKernel(p_u, q_i, int(num_iterations), scalar(learn_rate), scalar(user_regularization), scalar(item_regularization),
+                         bool(update_users), bool(update_items), scalar(target), bool(nonnegative))
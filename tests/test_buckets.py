@@ -0,0 +1,24 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from data import getBucketsHoldouts
+
+
+def _interactions(n=400, seed=12):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 365, size=n)), unit='D')
+    return pd.DataFrame({'user_id': rng.integers(10, size=n), 'item_id': rng.integers(50, size=n), 'date': dates})
+
+
+@pytest.mark.parametrize('bound', [pd.Timestamp, lambda s: datetime.datetime.fromisoformat(s), str, np.datetime64])
+def test_qs_buckets_with_date_bounds(bound):
+    data = _interactions()
+    quarters = [('2020-01-01', '2020-03-31'), ('2020-04-01', '2020-06-30'), ('2020-07-01', '2020-09-30')]
+    intervals = [(bound(s), bound(e)) for s, e in quarters]
+    # the boolean masks over the date column (the bucket definition)
+    expected = [((data['date'] >= s) & (data['date'] <= e)).sum() for s, e in intervals]
+    expected.append((data['date'] > intervals[-1][1]).sum())
+    buckets, holdouts = getBucketsHoldouts(data, 'user_id', 'item_id', [], interval_type='QS', intervals=intervals, cold_start_buckets=4)
+    assert [bucket.size for bucket in buckets] == expected
+    assert sum(expected) == len(data)
@@ -0,0 +1,55 @@
+import copy
+import numpy as np
+import pytest
+from data import ImplicitData
+from recommenders_implicit import ISGD
+from eval_implicit import EvalHoldout, EvaluateAndStore
+
+
+def _model_and_holdout(seed=4):
+    rng = np.random.default_rng(seed)
+    model = ISGD(ImplicitData([], []), num_factors=5)
+    model.IncrTrainMany(rng.integers(20, size=300).tolist(), rng.integers(40, size=300).tolist())
+    # known and new (25..29) users, some of them repeated
+    holdout = ImplicitData(rng.integers(15, 30, size=60).tolist(), rng.integers(40, size=60).tolist())
+    return model, holdout
+
+
+@pytest.mark.parametrize('default_user', ['none', 'random', 'average'])
+def test_batch_evaluation_matches_per_row(default_user):
+    model, holdout = _model_and_holdout()
+    results = []
+    for batch in (False, True):
+        np.random.seed(9)
+        evaluator = EvalHoldout(copy.deepcopy(model), holdout, N_recommendations=10, default_user=default_user)
+        results.append(evaluator.Evaluate(batch=batch)['Recall@N'])
+    assert results[0] == results[1]
+
+
+
+@pytest.mark.parametrize('delta_checkpoints', [False, True])
+@pytest.mark.parametrize('default_user', ['none', 'random'])
+def test_evaluate_and_store_keeps_holdout_order(default_user, delta_checkpoints):
+    rng = np.random.default_rng(6)
+    stream = ImplicitData(rng.integers(300, size=800).tolist(), rng.integers(80, size=800).tolist())
+    np.random.seed(2)
+    evaluator = EvaluateAndStore(ISGD(ImplicitData([], []), num_factors=4), stream, n_holdouts=4, seed=1, delta_checkpoints=delta_checkpoints)
+    evaluator.EvaluateAndStore()
+    checkpoints = list(evaluator.model_checkpoints)
+    # the original evaluation: holdouts in the outer loop, checkpoints in the inner one
+    np.random.seed(3)
+    expected = np.zeros((4, 4))
+    for i, holdout in enumerate(evaluator.holdouts):
+        for j, model in enumerate(checkpoints):
+            recalls = EvalHoldout(model, holdout, N_recommendations=20, default_user=default_user).Evaluate()['Recall@N']
+            expected[i, j] = sum(recalls) / holdout.size
+    np.random.seed(3)
+    evaluator.EvaluateHoldouts(default_user=default_user)
+    np.testing.assert_array_equal(evaluator.results_matrix, expected)
+
+
+def test_default_evaluation_keeps_per_row_times():
+    model, holdout = _model_and_holdout()
+    results = EvalHoldout(model, holdout, N_recommendations=10).Evaluate()
+    assert len(results['time_get_tuple']) == len(results['time_recommend']) == holdout.size
+    assert len(EvalHoldout(model, holdout, N_recommendations=10).Evaluate(batch=True)['time_recommend']) == 1
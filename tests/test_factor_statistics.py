@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from data import GrowableArray
+from recommenders_implicit.factor_statistics import FactorStatistics
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32, np.float16])
+def test_running_mean_matches_rows(dtype):
+    rng = np.random.default_rng(8)
+    factors = GrowableArray(rng.normal(0, 0.1, (500, 6)), dtype=dtype)
+    statistics = FactorStatistics(factors)
+    for _ in range(300): # fewer updates than rows: no rebuild
+        row = int(rng.integers(len(factors)))
+        old = factors.View()[row].copy()
+        factors.View()[row] = old + rng.normal(0, 0.01, 6)
+        statistics.Update(old, factors.View()[row])
+    factors.Append(rng.normal(0, 0.1, 6))
+    mean = statistics.Mean()
+    assert mean.dtype == np.float64 and statistics.sum.dtype == np.float64
+    np.testing.assert_allclose(mean, factors.View().astype(np.float64).mean(axis=0), atol=1e-9)
+    np.testing.assert_allclose(statistics.Median(), np.median(factors.View().astype(np.float64), axis=0), atol=0.01)
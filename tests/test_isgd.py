@@ -0,0 +1,30 @@
+import copy
+import pickle
+import numpy as np
+from data import ImplicitData
+from recommenders_implicit import ISGD, RAISGD
+
+
+def test_time_records_compatibility():
+    model = RAISGD(ImplicitData([], []))
+    model.SetInstrumentation(True)
+    for user, item in [(1, 1), (1, 2), (2, 1), (3, 3)]:
+        model.IncrTrain(user, item)
+    model.Recommend(1, 5)
+    assert model.train_time_record['IncrTrain_0']['count'] == 4
+    assert model.recommend_time_record == model.recommend_timer.Summary()
+    restored = pickle.loads(pickle.dumps(model))
+    assert restored.train_time_record['IncrTrain_2']['count'] == 4
+    assert copy.deepcopy(model).train_time_record == model.train_time_record
+
+
+def test_legacy_pickle_state():
+    model = ISGD(ImplicitData([1, 2], [1, 2]))
+    state = model.__dict__.copy()
+    del state['train_timer'], state['recommend_timer']
+    state['train_time_record'] = {'IncrTrain_0': [0.0]}
+    state['recommend_time_record'] = {'Recommend_0': [0.0]}
+    restored = ISGD.__new__(ISGD)
+    restored.__setstate__(state)
+    assert restored.train_time_record['IncrTrain_0']['count'] == 0
+    np.testing.assert_array_equal(restored.user_factors.View(), model.user_factors.View())
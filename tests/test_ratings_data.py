@@ -0,0 +1,12 @@
+import pytest
+from data import RatingsData
+
+
+def test_get_tuple_indexes_like_a_list():
+    data = RatingsData(['a', 'b', 'a'], ['x', 'y', 'z'], [1, 2, 3])
+    data.AddFeedback('c', 'x', 4) # grows the columns past their size
+    users, items = ['a', 'b', 'a', 'c'], ['x', 'y', 'z', 'x']
+    for idx in range(-4, 4):
+        assert data.GetTuple(idx) == (users[idx], items[idx])
+    with pytest.raises(IndexError):
+        data.GetTuple(4)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from data import ImplicitData
+from recommenders_implicit import UserKNN
+
+
+def _stream(n=300, num_users=12, num_items=15, seed=7):
+    rng = np.random.default_rng(seed)
+    users = rng.integers(num_users, size=n)
+    items = rng.integers(num_items, size=n)
+    timestamps = np.sort(rng.integers(0, 4 * n, size=n))
+    return users.tolist(), items.tolist(), timestamps.tolist()
+
+
+def _expected_freq(data):
+    # user_freq of a model trained from scratch on the retained interactions:
+    # f(u, u) = number of interactions of u, f(u, v) = sum over the items of count_u(i) * count_v(i)
+    num_users = len(data.userset)
+    freq = np.zeros((num_users, num_users))
+    for item in range(len(data.itemset)):
+        counts = np.bincount(np.asarray(data.GetItemUsers(item), dtype=np.int64), minlength=num_users).astype(float)
+        freq += np.outer(counts, counts)
+    np.fill_diagonal(freq, 0)
+    for user in range(num_users):
+        freq[user, user] = len(data.GetUserItems(user))
+    return freq
+
+
+@pytest.mark.parametrize('matrix_type', ['dense', 'sparse', 'packed'])
+def test_userknn_time_window_eviction_matches_scratch(matrix_type):
+    users, items, timestamps = _stream()
+    data = ImplicitData([], [])
+    model = UserKNN(data, k=3, matrix_type=matrix_type)
+    data.SetRetention(time_window=200, on_evict=model.Forget)
+    for user, item, timestamp in zip(users, items, timestamps):
+        model.IncrTrain(user, item, timestamp=timestamp)
+    num_users = len(data.userset)
+    freq = np.array([[model.user_freq.Get(u, v) for v in range(num_users)] for u in range(num_users)])
+    expected = _expected_freq(data)
+    assert freq.min() >= 0
+    np.testing.assert_allclose(freq, expected)
+    diag = np.diag(expected)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected_sim = np.where(expected > 0, expected / np.sqrt(np.outer(diag ** 2, diag ** 2)), 0)
+    np.fill_diagonal(expected_sim, 0)
+    sim = np.array([[model.user_sim.Get(u, v) if u != v else 0 for v in range(num_users)] for u in range(num_users)])
+    np.testing.assert_allclose(sim, expected_sim, rtol=1e-5)
+
+
+def test_userknn_time_window_eviction_batch():
+    users, items, timestamps = _stream()
+    data = ImplicitData([], [])
+    model = UserKNN(data, k=3)
+    data.SetRetention(time_window=200, on_evict=model.Forget)
+    model.IncrTrainMany(users, items, timestamps)
+    num_users = len(data.userset)
+    freq = np.array([[model.user_freq.Get(u, v) for v in range(num_users)] for u in range(num_users)])
+    np.testing.assert_allclose(freq, _expected_freq(data))
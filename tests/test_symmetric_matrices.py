@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from data import SymmetricMatrix, SparseSymmetricMatrix, PackedSymmetricMatrix
+
+
+def _dense(matrix):
+    size = matrix.max_id + 1
+    return np.array([[matrix.Get(i, j) for j in range(size)] for i in range(size)])
+
+
+@pytest.mark.parametrize('matrix_class', [SparseSymmetricMatrix, PackedSymmetricMatrix])
+def test_random_operations_match_dense(matrix_class):
+    rng = np.random.default_rng(11)
+    dense = SymmetricMatrix(4)
+    other = matrix_class(4) if matrix_class is PackedSymmetricMatrix else matrix_class(4, min_pending=16)
+    for step in range(400):
+        operation = rng.integers(4)
+        i, j = (int(x) for x in rng.integers(0, dense.max_id + 2, size=2))
+        if operation == 0:
+            assert dense.IncrementDiag(i) == other.IncrementDiag(i)
+        elif operation == 1:
+            assert dense.Increment(i, j, 0.5) == other.Increment(i, j, 0.5)
+        elif operation == 2:
+            value = float(rng.random()) if rng.random() < 0.8 else 0.0
+            assert dense.Set(i, j, value) == other.Set(i, j, value)
+        else:
+            rows = rng.integers(-1, dense.max_id + 3, size=20)
+            cols = rng.integers(-1, dense.max_id + 3, size=20)
+            cols[:5] = rows[:5] # diagonal pairs
+            value = float(rng.choice([1, -1, 0.25]))
+            assert dense.IncrementPairs(rows, cols, value) == other.IncrementPairs(rows, cols, value)
+        assert dense.max_id == other.max_id
+        if step % 25 == 0:
+            np.testing.assert_allclose(_dense(other), _dense(dense), rtol=1e-6, atol=1e-5)
+            u = int(rng.integers(dense.max_id + 1))
+            np.testing.assert_allclose(other.GetRow(u), dense.GetRow(u), rtol=1e-6, atol=1e-5)
+    np.testing.assert_allclose(_dense(other), _dense(dense), rtol=1e-6, atol=1e-5)
+
+
+def test_sparse_get_row_sparse():
+    matrix = SparseSymmetricMatrix(6, min_pending=4)
+    matrix.IncrementPairs([0, 0, 1, 2, 2], [1, 1, 3, 2, 5])
+    matrix.Compact()
+    matrix.IncrementPairs([0, 3], [1, 1], -1) # (0, 1) back to 1, (1, 3) to zero
+    matrix.Set(1, 4, 0.5)
+    cols, values = matrix.GetRowSparse(1)
+    np.testing.assert_array_equal(cols, [0, 4])
+    np.testing.assert_allclose(values, [1, 0.5])
+    np.testing.assert_allclose(matrix.GetRow(1), [1, 0, 0, 0, 0.5, 0])
+    cols, values = matrix.GetRowSparse(2)
+    np.testing.assert_array_equal(cols, [2, 5])
+    np.testing.assert_allclose(values, [2, 1])
+    assert len(matrix.GetRowSparse(6)[0]) == 0
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data import ImplicitData, getBucketsHoldouts
+from recommenders_implicit import ISGD, RSISGD, UserKNN
+from eval_implicit import EvaluateHoldouts
+
+
+def _data(n=200, seed=3):
+    rng = np.random.default_rng(seed)
+    users = rng.integers(10, size=n).tolist()
+    items = rng.integers(20, size=n).tolist()
+    timestamps = np.arange(n) * 10
+    return ImplicitData(users, items, timestamps=timestamps)
+
+
+@pytest.mark.parametrize('model_class', [ISGD, RSISGD, UserKNN])
+def test_train_on_slice_by_time(model_class):
+    data = _data()
+    userindices, timestamps = data.userindices.copy(), data.timestamps.copy()
+    train = data.SliceByTime(0, 1000)
+    model = model_class(train)
+    model.BatchTrain()
+    last = train.timestamps[-1]
+    # without a timestamp the interaction gets the last one; with one it must not go back in time
+    model.IncrTrain(data.userset[0], data.itemset[0])
+    model.IncrTrain(data.userset[1], data.itemset[1], timestamp=last + 5)
+    model.IncrTrainMany(data.userset[:3], data.itemset[:3])
+    model.IncrTrainMany(data.userset[:2], data.itemset[:2], timestamps=[last + 6, last + 7])
+    assert train.size == 100 + 7
+    np.testing.assert_array_equal(train.timestamps[100:], [last, last + 5, last + 5, last + 5, last + 5, last + 6, last + 7])
+    with pytest.raises(ValueError):
+        model.IncrTrain(data.userset[0], data.itemset[0], timestamp=last)
+    # the source data is untouched
+    assert data.size == 200
+    np.testing.assert_array_equal(data.userindices, userindices)
+    np.testing.assert_array_equal(data.timestamps, timestamps)
+
+
+def test_time_window_requires_timestamps():
+    data = ImplicitData([], [])
+    model = ISGD(data)
+    data.SetRetention(time_window=50)
+    model.IncrTrain('u', 'i', timestamp=0)
+    with pytest.raises(ValueError):
+        model.IncrTrain('u', 'i')
+
+
+def test_evaluate_holdouts_with_timestamp_buckets():
+    rng = np.random.default_rng(5)
+    n = 400
+    df = pd.DataFrame({'user_id': rng.integers(8, size=n), 'item_id': rng.integers(30, size=n), 'timestamp': np.arange(n)})
+    buckets, holdouts = getBucketsHoldouts(df, 'user_id', 'item_id', list(range(8)), interval_type='F',
+                                           intervals=[(0, 100), (100, 200), (200, 300), (300, 400)], timestamp_col='timestamp')
+    assert buckets[0].timestamps is not None
+    data = ImplicitData([], [])
+    model = ISGD(data)
+    data.SetRetention(time_window=150, timestamps=[])
+    evaluator = EvaluateHoldouts(model, buckets, holdouts)
+    evaluator.Train_Evaluate(N_recommendations=5, verbose=False)
+    assert data.timestamps[-1] == buckets[-1].timestamps[-1]
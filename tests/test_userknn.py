@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from data import ImplicitData
+from recommenders_implicit import UserKNN
+
+
+def _interactions(n=250, seed=1):
+    rng = np.random.default_rng(seed)
+    return rng.integers(15, size=n).tolist(), rng.integers(25, size=n).tolist()
+
+
+def _matrix(matrix, size):
+    return np.array([[matrix.Get(u, v) for v in range(size)] for u in range(size)])
+
+
+@pytest.mark.parametrize('matrix_type', ['dense', 'sparse', 'packed', 'memmap'])
+def test_batch_train_matches_incremental(matrix_type):
+    users, items = _interactions()
+    incremental = UserKNN(ImplicitData([], []), k=4, matrix_type=matrix_type)
+    for user, item in zip(users, items):
+        incremental.IncrTrain(user, item)
+    batch = UserKNN(ImplicitData(users, items), k=4, matrix_type=matrix_type)
+    batch.BatchTrain()
+    size = len(batch.data.userset)
+    # internal IDs of the incremental model, in the order of the batch model's users
+    order = [incremental.data.GetUserInternalId(user) for user in batch.data.userset]
+    np.testing.assert_allclose(_matrix(batch.user_freq, size), _matrix(incremental.user_freq, size)[np.ix_(order, order)])
+    np.testing.assert_allclose(_matrix(batch.user_sim, size), _matrix(incremental.user_sim, size)[np.ix_(order, order)], rtol=1e-6)
+    # incremental training only refreshes the neighborhoods around the user of each interaction: compare with fresh ones
+    for u, v in enumerate(order):
+        np.testing.assert_allclose(batch.user_neighbors[u][:, 1], incremental._ComputeUserNeighbors(v)[:, 1], rtol=1e-6)
+
+
+def test_memmap_with_filename_matches_dense(tmp_path):
+    users, items = _interactions(n=400, seed=2)
+    dense = UserKNN(ImplicitData([], []), k=4)
+    # a small file layout, so that the files grow and are rewritten (widened) during training
+    memmap = UserKNN(ImplicitData([], []), k=4, matrix_type='memmap',
+                     matrix_options={'filename': str(tmp_path / 'knn'), 'block_rows': 2, 'columns': 4})
+    for user, item in zip(users, items):
+        dense.IncrTrain(user, item)
+        memmap.IncrTrain(user, item)
+    assert memmap.user_freq.filename != memmap.user_sim.filename
+    size = len(dense.data.userset)
+    np.testing.assert_allclose(_matrix(memmap.user_freq, size), _matrix(dense.user_freq, size))
+    np.testing.assert_allclose(_matrix(memmap.user_sim, size), _matrix(dense.user_sim, size))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['knn.freq', 'knn.sim']
+
+
+def test_sparse_matches_dense():
+    users, items = _interactions(n=400, seed=3)
+    dense = UserKNN(ImplicitData([], []), k=4)
+    sparse = UserKNN(ImplicitData([], []), k=4, matrix_type='sparse')
+    for data, model in ((dense.data, dense), (sparse.data, sparse)):
+        data.SetRetention(window=8, on_evict=model.Forget) # evictions clear similarities
+    for user, item in zip(users, items):
+        dense.IncrTrain(user, item)
+        sparse.IncrTrain(user, item)
+    size = len(dense.data.userset)
+    assert sparse.user_sim.max_id == dense.user_sim.max_id
+    np.testing.assert_allclose(_matrix(sparse.user_sim, size), _matrix(dense.user_sim, size))
+    for u in range(size):
+        np.testing.assert_array_equal(sparse.user_neighbors[u], dense.user_neighbors[u])
+    # no explicit zeros: the similarities stored are those of co-occurring users
+    sparse.user_sim.Compact()
+    assert np.count_nonzero(sparse.user_sim.data) == len(sparse.user_sim.data)